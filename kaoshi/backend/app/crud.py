@@ -1,107 +1,641 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, case
+from sqlalchemy import func, case, select, insert, update, cast, Integer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from collections import Counter
+from types import SimpleNamespace
 from . import models, schemas
+from .services import search as search_index
+from .services import dedup
+from .services import pool as question_pool
 from datetime import datetime
-from typing import List, Any
+from typing import List, Any, Optional
 
 # ... existing code ...
 
 def get_question(db: Session, question_id: int):
     return db.query(models.Question).filter(models.Question.id == question_id).first()
 
+def get_questions_by_ids(db: Session, ids: List[int]) -> List[models.Question]:
+    """Questions for ids in the given order (one IN query); missing ids are skipped."""
+    if not ids:
+        return []
+    by_id = {q.id: q for q in db.query(models.Question).filter(models.Question.id.in_(ids))}
+    return [by_id[i] for i in ids if i in by_id]
+
 def get_question_by_hash(db: Session, content_hash: str):
     return db.query(models.Question).filter(models.Question.content_hash == content_hash).first()
 
-def get_questions(db: Session, skip: int = 0, limit: int = 100, 
-                  q_type: str = None, difficulty: int = None, 
-                  tag: str = None, status: str = None):
-    query = db.query(models.Question)
+def _normalize_tags(tags) -> List[str]:
+    # De-duplicate while keeping order; blank tags are never indexed
+    if not tags:
+        return []
+    return list(dict.fromkeys(str(t).strip() for t in tags if t and str(t).strip()))
+
+def tag_question_ids(tags: List[str]):
+    # Subquery over the indexed question_tags table
+    return select(models.QuestionTag.question_id).where(models.QuestionTag.tag.in_(tags))
+
+def filter_by_tag(query, tag: str):
+    return query.filter(models.Question.id.in_(tag_question_ids([tag])))
+
+def sync_question_tags(db: Session, question_ids: List[int], tags):
+    """Replace the question_tags rows of the given questions. Caller commits."""
+    if not question_ids:
+        return
+    db.query(models.QuestionTag).filter(
+        models.QuestionTag.question_id.in_(question_ids)
+    ).delete(synchronize_session=False)
+    tags = _normalize_tags(tags)
+    if tags:
+        db.execute(
+            insert(models.QuestionTag),
+            [{"question_id": qid, "tag": t} for qid in question_ids for t in tags],
+        )
+
+def rebuild_question_tags(db: Session, batch_size: int = 1000):
+    """Backfill question_tags from the Question.tags JSON column."""
+    db.query(models.QuestionTag).delete(synchronize_session=False)
+    rows = db.query(models.Question.id, models.Question.tags).yield_per(batch_size)
+    buffer = []
+    for qid, tags in rows:
+        buffer.extend({"question_id": qid, "tag": t} for t in _normalize_tags(tags))
+        if len(buffer) >= batch_size:
+            db.execute(insert(models.QuestionTag), buffer)
+            buffer = []
+    if buffer:
+        db.execute(insert(models.QuestionTag), buffer)
+    db.commit()
+
+def ensure_question_tags(db: Session):
+    # Databases created before question_tags existed need a one-off backfill
+    if db.query(models.QuestionTag.question_id).first() is None and \
+            db.query(models.Question.id).filter(models.Question.tags.isnot(None)).first() is not None:
+        rebuild_question_tags(db)
+
+def _filter_questions(query, q_type: str = None, difficulty: int = None,
+                      tag: str = None, status: str = None):
     if q_type:
         query = query.filter(models.Question.q_type == q_type)
     if difficulty:
         query = query.filter(models.Question.difficulty == difficulty)
-    # Tag filtering needs JSON contains or similar logic if tags is JSON list
-    # SQLite JSON support is limited in old versions, but generally works with cast or like
     if tag:
-        # Simple LIKE for MVP if using JSON stored as string or simple JSON
-        # For Postgres we use .contains, for SQLite/MySQL it varies. 
-        # Assuming simple string match for now or proper JSON operator if supported.
-        # Given earlier code used simple list, we'll skip complex tag logic or assume exact match?
-        # Let's rely on Python filtering if DB is simple, or implementation in router.
-        # But here is CRUD.
-        pass 
+        query = filter_by_tag(query, tag)
     if status:
         query = query.filter(models.Question.status == status)
-        
+    return query
+
+def get_questions(db: Session, skip: int = 0, limit: int = 100, 
+                  q_type: str = None, difficulty: int = None, 
+                  tag: str = None, status: str = None):
+    query = _filter_questions(db.query(models.Question), q_type, difficulty, tag, status)
     return query.offset(skip).limit(limit).all()
 
-def get_questions_with_count(
-    db: Session, skip: int = 0, limit: int = 100, 
-    q_type: str = None, difficulty: int = None, 
+EXPORT_COLUMNS = (
+    models.Question.id, models.Question.custom_id, models.Question.q_type, models.Question.content,
+    models.Question.options, models.Question.answer, models.Question.analysis, models.Question.difficulty,
+    models.Question.tags, models.Question.score, models.Question.source_doc,
+    models.Question.knowledge_points, models.Question.status, models.Question.created_at,
+)
+
+def count_export_questions(db: Session, **filters) -> int:
+    return _filter_questions(db.query(models.Question.id), **filters).count()
+
+def iter_export_questions(db: Session, batch_size: int = 1000, **filters):
+    """
+    Rows of EXPORT_COLUMNS for every matching question in id order, read
+    batch_size at a time by keyset (no ORM objects, no row limit). Each
+    batch is fetched in full, so no SQLite read cursor stays open, blocking
+    writers, while the rows are encoded or a slow client downloads them.
+    """
+    query = _filter_questions(db.query(*EXPORT_COLUMNS), **filters).order_by(models.Question.id)
+    last_id = 0
+    while True:
+        batch = query.filter(models.Question.id > last_id).limit(batch_size).all()
+        if not batch:
+            return
+        yield from batch
+        last_id = batch[-1].id
+
+def query_questions(
+    db: Session, q_type: str = None, difficulty: int = None, 
     tag: str = None, search: str = None, 
     status: str = None, source_doc: str = None,
     review_status: str = None
 ):
+    """
+    Build the filtered question query. Returns (query, order_by, ranked);
+    ranked is True when results are ordered by full-text relevance.
+    """
     query = db.query(models.Question)
     
     if q_type: query = query.filter(models.Question.q_type == q_type)
     if difficulty: query = query.filter(models.Question.difficulty == difficulty)
+    if tag: query = filter_by_tag(query, tag)
     if status: query = query.filter(models.Question.status == status)
     if source_doc: query = query.filter(models.Question.source_doc == source_doc)
-    if search:
-        query = query.filter(models.Question.content.contains(search))
     
     # review_status logic if different from status
     if review_status:
         query = query.filter(models.Question.status == review_status)
 
+    order_by = [models.Question.id.desc()]
+    ranked = False
+    if search:
+        match = search_index.build_match(search) if search_index.is_enabled(db) else None
+        if match:
+            # Ranked full-text lookup (bm25, best first)
+            hits = search_index.ranked_matches(match)
+            query = query.join(hits, hits.c.qid == models.Question.id)
+            order_by.insert(0, hits.c.rank)
+            ranked = True
+        else:
+            query = query.filter(models.Question.content.contains(search))
+
+    return query, order_by, ranked
+
+def get_questions_with_count(
+    db: Session, skip: int = 0, limit: int = 100, **filters
+):
+    query, order_by, _ = query_questions(db, **filters)
     total = query.count()
-    items = query.order_by(models.Question.id.desc()).offset(skip).limit(limit).all()
+    items = query.order_by(*order_by).offset(skip).limit(limit).all()
     return items, total
 
+# Above this many matches "estimate" mode stops counting
+COUNT_ESTIMATE_CAP = 10000
+
+def count_questions(query, mode: str = "exact"):
+    """
+    Count a question query. mode is "exact", "estimate" (count stops at
+    COUNT_ESTIMATE_CAP) or "none". Returns (total, is_exact).
+    """
+    if mode == "none":
+        return None, False
+    if mode == "estimate":
+        capped = query.with_entities(models.Question.id).limit(COUNT_ESTIMATE_CAP + 1).subquery()
+        total = query.session.query(func.count()).select_from(capped).scalar()
+        if total > COUNT_ESTIMATE_CAP:
+            return COUNT_ESTIMATE_CAP, False
+        return total, True
+    return query.count(), True
+
+def get_questions_page(
+    db: Session, skip: int = 0, limit: int = 100,
+    before_id: int = None, total_mode: str = "exact", **filters
+):
+    """
+    Page through questions. When before_id is given (keyset mode) the page
+    starts right after that id in ORDER BY id DESC and skip is ignored, so
+    every page costs the same regardless of depth. Relevance-ranked searches
+    only support offsets, so their next page is given as one.
+
+    Returns (items, total, total_exact, next_page); next_page is
+    {"before_id": id} or {"offset": n} for the following page, None on the last.
+    """
+    query, order_by, ranked = query_questions(db, **filters)
+
+    page = query.order_by(*order_by)
+    if before_id is not None and not ranked:
+        page = page.filter(models.Question.id < before_id)
+    else:
+        page = page.offset(skip)
+    # Fetch one extra row to learn whether another page exists
+    items = page.limit(limit + 1).all()
+    has_more = len(items) > limit
+    items = items[:limit]
+    if not has_more or not items:
+        next_page = None
+    elif ranked:
+        next_page = {"offset": skip + len(items)}
+    else:
+        next_page = {"before_id": items[-1].id}
+
+    if total_mode != "none" and not any(filters.values()):
+        # Unfiltered totals are maintained in the facet counter table
+        total = db.query(func.coalesce(func.sum(models.QuestionFacetCount.count), 0)).filter(
+            models.QuestionFacetCount.facet == "q_type"
+        ).scalar()
+        total_exact = True
+    else:
+        total, total_exact = count_questions(query, total_mode)
+    return items, total, total_exact, next_page
+
+# Facet counters
+FACETS = ("q_type", "difficulty", "status", "source_doc", "tag")
+_FACET_COLUMNS = (
+    models.Question.id, models.Question.q_type, models.Question.difficulty,
+    models.Question.status, models.Question.source_doc, models.Question.tags,
+)
+
+def _facet_pairs(row: dict):
+    for facet in ("q_type", "difficulty", "status", "source_doc"):
+        value = row.get(facet)
+        if value is not None and value != "":
+            yield facet, str(value)
+    for t in _normalize_tags(row.get("tags")):
+        yield "tag", t
+
+def _facet_row(q) -> dict:
+    return {f: getattr(q, f) for f in ("q_type", "difficulty", "status", "source_doc", "tags")}
+
+def add_facet_deltas(deltas: Counter, row: dict, sign: int):
+    for pair in _facet_pairs(row):
+        deltas[pair] += sign
+
+def apply_facet_deltas(db: Session, deltas: Counter):
+    """Upsert counter changes in the current transaction. Caller commits."""
+    rows = [{"facet": f, "value": v, "count": n} for (f, v), n in deltas.items() if n]
+    if not rows:
+        return
+    stmt = sqlite_insert(models.QuestionFacetCount)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["facet", "value"],
+        set_={"count": models.QuestionFacetCount.count + stmt.excluded["count"]},
+    )
+    db.execute(stmt, rows)
+
+def track_facet_changes(db: Session, ids: List[int], change=None):
+    """
+    Record counter deltas for questions about to be changed. `change` maps a
+    question's current facet row to its new one; None means deletion. Must
+    run before the write itself.
+    """
+    if not ids:
+        return
+    deltas = Counter()
+    for row in db.query(*_FACET_COLUMNS).filter(models.Question.id.in_(ids)):
+        before = row._asdict()
+        add_facet_deltas(deltas, before, -1)
+        if change is not None:
+            add_facet_deltas(deltas, change(before), +1)
+    apply_facet_deltas(db, deltas)
+
+def rebuild_facet_counts(db: Session):
+    db.query(models.QuestionFacetCount).delete(synchronize_session=False)
+    deltas = Counter()
+    for facet in ("q_type", "difficulty", "status", "source_doc"):
+        col = getattr(models.Question, facet)
+        for value, n in db.query(col, func.count()).group_by(col):
+            if value is not None and value != "":
+                deltas[(facet, str(value))] += n
+    tag_col = models.QuestionTag.tag
+    for value, n in db.query(tag_col, func.count()).group_by(tag_col):
+        deltas[("tag", value)] += n
+    apply_facet_deltas(db, deltas)
+    db.commit()
+
+def ensure_facet_counts(db: Session):
+    if db.query(models.QuestionFacetCount.facet).first() is None and \
+            db.query(models.Question.id).first() is not None:
+        rebuild_facet_counts(db)
+
+def get_facet_counts(db: Session, **filters):
+    """
+    Facet counts for the given filters. Unfiltered counts are read from the
+    counter table; filtered ones come from one GROUP BY over the scalar
+    facets plus one over the matching tags.
+    """
+    facets = {f: {} for f in FACETS}
+    if not any(filters.values()):
+        for c in db.query(models.QuestionFacetCount).filter(models.QuestionFacetCount.count > 0):
+            facets[c.facet][c.value] = c.count
+        return sum(facets["q_type"].values()), facets
+
+    query, _, _ = query_questions(db, **filters)
+    cols = (models.Question.q_type, models.Question.difficulty,
+            models.Question.status, models.Question.source_doc)
+    total = 0
+    for q_type, difficulty, status, source_doc, n in query.with_entities(*cols, func.count()).group_by(*cols):
+        total += n
+        row = {"q_type": q_type, "difficulty": difficulty, "status": status, "source_doc": source_doc}
+        for f, v in _facet_pairs(row):
+            facets[f][v] = facets[f].get(v, 0) + n
+
+    matching = query.with_entities(models.Question.id).subquery()
+    tag_col = models.QuestionTag.tag
+    tag_counts = db.query(tag_col, func.count()).join(
+        matching, matching.c.id == models.QuestionTag.question_id
+    ).group_by(tag_col)
+    for value, n in tag_counts:
+        facets["tag"][value] = n
+    return total, facets
+
 def calculate_content_hash(content: str):
     import hashlib
     return hashlib.md5(content.strip().encode('utf-8')).hexdigest()
 
-def check_content_similarity(db: Session, content: str, threshold: float = 0.8):
-    # This is a placeholder. Real similarity requires vector DB or Levenshtein
-    # For MVP, we just return empty or simple substring match
-    return []
+def check_content_similarity(db: Session, content: str, threshold: float = 0.8, exclude_id: int = None):
+    """Stored questions whose content is a near-duplicate (Jaccard >= threshold), best first."""
+    return dedup.find_similar(db, content, threshold, exclude_id=exclude_id)
+
+def check_duplicates_batch(db: Session, contents: List[str], threshold: float = 0.8, limit: int = 5) -> List[dict]:
+    """
+    Duplicate check for several candidate texts at once: exact matches by
+    content hash in one indexed IN query, near-duplicates in one LSH pass.
+    Per text: {"index", "exact", "batch_duplicate_of", "similar"}, where
+    batch_duplicate_of is the first earlier text with the same content.
+    """
+    hashes = [calculate_content_hash(c) for c in contents]
+    exact = {
+        row.content_hash: row
+        for row in db.query(models.Question.id, models.Question.custom_id, models.Question.content_hash).filter(
+            models.Question.content_hash.in_(set(hashes))
+        )
+    } if hashes else {}
+    similar = dedup.find_similar_batch(db, contents, threshold, limit)
+    first_index = {}
+    results = []
+    for i, (h, matches) in enumerate(zip(hashes, similar)):
+        hit = exact.get(h)
+        earlier = first_index.setdefault(h, i)
+        results.append({
+            "index": i,
+            "exact": {"id": hit.id, "custom_id": hit.custom_id} if hit else None,
+            "batch_duplicate_of": earlier if earlier != i else None,
+            "similar": matches,
+        })
+    return results
+
+def _reserve_custom_id_block(db: Session, prefix: str, day: str, n: int) -> int:
+    """Reserve n sequence numbers for prefix/day; returns the first one."""
+    seq = models.CustomIdSequence
+    last = db.execute(
+        update(seq).where(seq.prefix == prefix, seq.day == day)
+        .values(last_seq=seq.last_seq + n).returning(seq.last_seq)
+    ).scalar()
+    if last is None:
+        # First block of the day starts after ids already issued (e.g. older random ones)
+        stem = f"{prefix}-{day}-"
+        issued = select(func.coalesce(func.max(cast(func.substr(models.Question.custom_id, len(stem) + 1), Integer)), 0)).where(
+            models.Question.custom_id >= stem, models.Question.custom_id < stem[:-1] + "."
+        ).scalar_subquery()
+        stmt = sqlite_insert(seq).values(prefix=prefix, day=day, last_seq=issued + n)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["prefix", "day"],
+            set_={"last_seq": seq.last_seq + n},
+        ).returning(seq.last_seq)
+        last = db.execute(stmt).scalar_one()
+    return last - n + 1
+
+def allocate_custom_ids(db: Session, q_types: List[str]) -> List[str]:
+    """
+    Sequential custom_ids (e.g. S-20231027-0001) for questions about to be
+    inserted, in input order. Each prefix gets one block from the counter
+    table, so a batch costs one statement per question type, not per row.
+    Runs in the caller's transaction; a rollback returns the block.
+    """
+    day = datetime.now().strftime("%Y%m%d")
+    prefixes = [(t or 'single')[0].upper() for t in q_types]
+    next_seq = {
+        prefix: _reserve_custom_id_block(db, prefix, day, n)
+        for prefix, n in Counter(prefixes).items()
+    }
+    custom_ids = []
+    for prefix in prefixes:
+        custom_ids.append(f"{prefix}-{day}-{next_seq[prefix]:04d}")
+        next_seq[prefix] += 1
+    return custom_ids
 
 def create_question(db: Session, question: schemas.QuestionCreate):
     data = question.dict()
     # Ensure content_hash
     content_hash = calculate_content_hash(data['content'])
-    
-    # Custom ID generation (simple timestamp based)
-    def generate_custom_id(db, q_type):
-        prefix = q_type[0].upper()
-        date_str = datetime.now().strftime("%Y%m%d")
-        # Count existing for today to append sequence? 
-        # Or just random. Let's use simple sequence if possible, or UUID.
-        # For performance, just Random or Time
-        import random
-        seq = random.randint(1000, 9999)
-        return f"{prefix}-{date_str}-{seq}"
-
-    custom_id = generate_custom_id(db, data.get('q_type', 'single'))
+    custom_id = allocate_custom_ids(db, [data.get('q_type')])[0]
     
     db_question = models.Question(**data, custom_id=custom_id, content_hash=content_hash)
     db.add(db_question)
+    db.flush()
+    sync_question_tags(db, [db_question.id], db_question.tags)
+    search_index.index_questions(db, [db_question])
+    dedup.index_questions(db, [db_question])
+    deltas = Counter()
+    add_facet_deltas(deltas, _facet_row(db_question), +1)
+    apply_facet_deltas(db, deltas)
     db.commit()
     db.refresh(db_question)
+    question_pool.refresh_questions(db, [db_question.id])
     return db_question
 
+def get_existing_hashes(db: Session, hashes: List[str]) -> dict:
+    """Map content_hash -> question id for the hashes already in the bank (one IN query)."""
+    if not hashes:
+        return {}
+    rows = db.query(models.Question.content_hash, models.Question.id).filter(
+        models.Question.content_hash.in_(set(hashes))
+    )
+    return {h: qid for h, qid in rows}
+
+def bulk_create_questions(db: Session, questions: List[schemas.QuestionCreate], commit: bool = True) -> List[int]:
+    """
+    Insert many questions with one executemany INSERT ... RETURNING and keep
+    the derived tables (tags, full-text, facet counters) in the same
+    transaction. Callers are expected to have removed duplicates. Returns
+    the new ids in input order.
+    """
+    if not questions:
+        return []
+    rows = [q.dict() for q in questions]
+    custom_ids = allocate_custom_ids(db, [data.get('q_type') for data in rows])
+    for data, custom_id in zip(rows, custom_ids):
+        data['content_hash'] = calculate_content_hash(data['content'])
+        data['custom_id'] = custom_id
+
+    result = db.execute(
+        insert(models.Question).returning(models.Question.id, sort_by_parameter_order=True),
+        rows,
+    )
+    ids = [r[0] for r in result]
+
+    tag_rows = [
+        {"question_id": qid, "tag": t}
+        for qid, data in zip(ids, rows) for t in _normalize_tags(data.get('tags'))
+    ]
+    if tag_rows:
+        db.execute(insert(models.QuestionTag), tag_rows)
+    indexed = [
+        SimpleNamespace(id=qid, content=d['content'], analysis=d.get('analysis'), options=d.get('options'))
+        for qid, d in zip(ids, rows)
+    ]
+    search_index.index_questions(db, indexed)
+    dedup.index_questions(db, indexed)
+    deltas = Counter()
+    for data in rows:
+        add_facet_deltas(deltas, data, +1)
+    apply_facet_deltas(db, deltas)
+
+    if commit:
+        db.commit()
+        question_pool.refresh_questions(db, ids)
+    return ids
+
+def import_questions_chunk(db: Session, items: List[Any], seen_hashes: set):
+    """
+    Import one chunk of (row_number, QuestionCreate) pairs: a single hash
+    lookup, in-file dedup via seen_hashes, then one bulk insert. If the bulk
+    insert hits a constraint (e.g. a concurrent import) the chunk is retried
+    row by row so every row still gets its own outcome.
+    Returns (created_count, [(row_number, error), ...]).
+    """
+    errors = []
+    hashes = [calculate_content_hash(q.content) for _, q in items]
+    existing = get_existing_hashes(db, hashes)
+    to_insert = []
+    for (row, q), h in zip(items, hashes):
+        if h in existing or h in seen_hashes:
+            errors.append((row, "Duplicate content"))
+            continue
+        seen_hashes.add(h)
+        to_insert.append((row, q))
+
+    try:
+        bulk_create_questions(db, [q for _, q in to_insert])
+        return len(to_insert), errors
+    except IntegrityError:
+        db.rollback()
+
+    created_ids = []
+    for row, q in to_insert:
+        try:
+            with db.begin_nested():
+                created_ids.extend(bulk_create_questions(db, [q], commit=False))
+        except IntegrityError as e:
+            duplicate = "content_hash" in str(e.orig)
+            errors.append((row, "Duplicate content" if duplicate else str(e.orig)))
+    db.commit()
+    question_pool.refresh_questions(db, created_ids)
+    return len(created_ids), errors
+
+def batch_create_questions(db: Session, items: List[Any]) -> dict:
+    """
+    Create a set of questions (e.g. an AI-generated batch) in one transaction:
+    items are validated and de-duplicated in memory, checked against the bank
+    with one hash query and written with one bulk insert. Items may be
+    QuestionCreate objects or plain dicts. If the bulk insert hits a
+    constraint (a concurrent write), items are retried one by one so each
+    still gets its own outcome. Returns {"created", "duplicates", "failed"},
+    each a list of dicts keyed by the item's index.
+    """
+    created, duplicates, failed = [], [], []
+    candidates = []  # (index, QuestionCreate, content_hash)
+    batch_hashes = {}
+    for index, item in enumerate(items):
+        try:
+            q = item if isinstance(item, schemas.QuestionCreate) else schemas.QuestionCreate(**item)
+        except Exception as e:
+            failed.append({"index": index, "error": str(e)})
+            continue
+        if not q.content or not q.content.strip():
+            failed.append({"index": index, "error": "Content is missing"})
+            continue
+        h = calculate_content_hash(q.content)
+        if h in batch_hashes:
+            duplicates.append({"index": index, "error": f"Duplicate of item {batch_hashes[h]}"})
+            continue
+        batch_hashes[h] = index
+        candidates.append((index, q, h))
+
+    existing = get_existing_hashes(db, [h for _, _, h in candidates])
+    to_insert = []
+    for index, q, h in candidates:
+        if h in existing:
+            duplicates.append({"index": index, "existing_id": existing[h], "error": "Duplicate question exists"})
+        else:
+            to_insert.append((index, q))
+
+    try:
+        ids = bulk_create_questions(db, [q for _, q in to_insert], commit=False)
+        inserted = [(index, qid) for (index, _), qid in zip(to_insert, ids)]
+    except IntegrityError:
+        db.rollback()
+        inserted = []
+        for index, q in to_insert:
+            try:
+                with db.begin_nested():
+                    inserted.append((index, bulk_create_questions(db, [q], commit=False)[0]))
+            except IntegrityError as e:
+                if "content_hash" in str(e.orig):
+                    duplicates.append({"index": index, "error": "Duplicate question exists"})
+                else:
+                    failed.append({"index": index, "error": str(e.orig)})
+    db.commit()
+
+    ids = [qid for _, qid in inserted]
+    question_pool.refresh_questions(db, ids)
+    custom_ids = dict(
+        db.query(models.Question.id, models.Question.custom_id).filter(models.Question.id.in_(ids))
+    ) if ids else {}
+    created = [{"index": index, "id": qid, "custom_id": custom_ids.get(qid)} for index, qid in inserted]
+    duplicates.sort(key=lambda d: d["index"])
+    failed.sort(key=lambda d: d["index"])
+    return {"created": created, "duplicates": duplicates, "failed": failed}
+
+# Staged imports (parse once, commit later)
+def create_import_batch(db: Session, token: str, filename: str, expires_at: datetime) -> models.ImportBatch:
+    batch = models.ImportBatch(token=token, filename=filename, expires_at=expires_at, total=0)
+    db.add(batch)
+    db.commit()
+    return batch
+
+def add_import_batch_rows(db: Session, token: str, items: List[dict]):
+    """Stage preview items (row_index, status, data, errors) with one executemany."""
+    if not items:
+        return
+    db.execute(insert(models.ImportBatchRow), [
+        {
+            "token": token,
+            "row_index": item["row_index"],
+            "status": item["status"],
+            "data": item["data"],
+            "errors": item["errors"],
+        }
+        for item in items
+    ])
+    db.query(models.ImportBatch).filter(models.ImportBatch.token == token).update(
+        {"total": models.ImportBatch.total + len(items)}
+    )
+    db.commit()
+
+def get_import_batch(db: Session, token: str) -> Optional[models.ImportBatch]:
+    return db.query(models.ImportBatch).filter(models.ImportBatch.token == token).first()
+
+def iter_import_batch_rows(db: Session, token: str, chunk_size: int = 500):
+    """Staged rows in row order, one keyset page per chunk (safe across commits)."""
+    last = 0
+    while True:
+        rows = db.query(models.ImportBatchRow).filter(
+            models.ImportBatchRow.token == token,
+            models.ImportBatchRow.row_index > last,
+        ).order_by(models.ImportBatchRow.row_index).limit(chunk_size).all()
+        if not rows:
+            return
+        last = rows[-1].row_index
+        yield rows
+
+def delete_import_batch(db: Session, token: str):
+    db.query(models.ImportBatchRow).filter(models.ImportBatchRow.token == token).delete()
+    db.query(models.ImportBatch).filter(models.ImportBatch.token == token).delete()
+    db.commit()
+
+def purge_expired_import_batches(db: Session, now: Optional[datetime] = None):
+    now = now or datetime.utcnow()
+    expired = select(models.ImportBatch.token).where(models.ImportBatch.expires_at < now)
+    db.query(models.ImportBatchRow).filter(models.ImportBatchRow.token.in_(expired)).delete(synchronize_session=False)
+    db.query(models.ImportBatch).filter(models.ImportBatch.expires_at < now).delete(synchronize_session=False)
+    db.commit()
+
 def review_question(db: Session, question_id: int, status: str, comment: str = None, reviewer: str = None):
     q = get_question(db, question_id)
     if not q:
         return None
+    track_facet_changes(db, [question_id], lambda row: {**row, "status": status})
     q.status = status
     q.review_comment = comment
     q.reviewer = reviewer
     q.reviewed_at = datetime.utcnow()
     db.commit()
     db.refresh(q)
+    question_pool.refresh_questions(db, [question_id])
     return q
 
 def update_question(db: Session, question_id: int, question: schemas.QuestionUpdate):
@@ -109,23 +643,44 @@ def update_question(db: Session, question_id: int, question: schemas.QuestionUpd
     if not db_question:
         return None
     update_data = question.dict(exclude_unset=True)
+    deltas = Counter()
+    add_facet_deltas(deltas, _facet_row(db_question), -1)
     for key, value in update_data.items():
         setattr(db_question, key, value)
+    add_facet_deltas(deltas, _facet_row(db_question), +1)
+    apply_facet_deltas(db, deltas)
+    if 'tags' in update_data:
+        sync_question_tags(db, [question_id], update_data['tags'])
+    if update_data.keys() & {'content', 'analysis', 'options'}:
+        search_index.index_questions(db, [db_question])
+    if 'content' in update_data:
+        dedup.index_questions(db, [db_question])
     db.commit()
     db.refresh(db_question)
+    question_pool.refresh_questions(db, [question_id])
     return db_question
 
 def delete_question(db: Session, question_id: int):
     db_question = db.query(models.Question).filter(models.Question.id == question_id).first()
     if db_question:
+        sync_question_tags(db, [question_id], None)
+        search_index.remove_questions(db, [question_id])
+        dedup.remove_questions(db, [question_id])
+        track_facet_changes(db, [question_id])
         db.delete(db_question)
         db.commit()
+        question_pool.remove_questions(db, [question_id])
     return db_question
 
 # Batch Operations
 def batch_delete_questions(db: Session, ids: List[int]):
+    sync_question_tags(db, ids, None)
+    search_index.remove_questions(db, ids)
+    dedup.remove_questions(db, ids)
+    track_facet_changes(db, ids)
     db.query(models.Question).filter(models.Question.id.in_(ids)).delete(synchronize_session=False)
     db.commit()
+    question_pool.remove_questions(db, ids)
 
 def batch_update_status(db: Session, ids: List[int], status: str, comment: str = None):
     # If comment is provided, we need to update it too.
@@ -136,24 +691,34 @@ def batch_update_status(db: Session, ids: List[int], status: str, comment: str =
         values[models.Question.reviewed_at] = datetime.utcnow()
         values[models.Question.reviewer] = "Admin" # Default reviewer
         
+    track_facet_changes(db, ids, lambda row: {**row, "status": status})
     db.query(models.Question).filter(models.Question.id.in_(ids)).update(values, synchronize_session=False)
     db.commit()
+    question_pool.refresh_questions(db, ids)
 
 def batch_update_difficulty(db: Session, ids: List[int], difficulty: int):
+    track_facet_changes(db, ids, lambda row: {**row, "difficulty": difficulty})
     db.query(models.Question).filter(models.Question.id.in_(ids)).update({models.Question.difficulty: difficulty}, synchronize_session=False)
     db.commit()
+    question_pool.refresh_questions(db, ids)
 
 def batch_update_tags(db: Session, ids: List[int], tags: List[str]):
     # Updating JSON column in batch might vary by DB
     # For SQLite/Postgres with SQLAlchemy, simple assignment works
+    track_facet_changes(db, ids, lambda row: {**row, "tags": tags})
     db.query(models.Question).filter(models.Question.id.in_(ids)).update({models.Question.tags: tags}, synchronize_session=False)
+    sync_question_tags(db, ids, tags)
     db.commit()
+    question_pool.refresh_questions(db, ids)
 
 def batch_review_questions(db: Session, items: List[Any]):
     # items is List[BatchItem] or dicts
     # We want to update status and review_comment per ID
     # Use mappings for bulk update
     
+    new_status = {item.id: item.value for item in items}
+    track_facet_changes(db, list(new_status), lambda row: {**row, "status": new_status[row["id"]]})
+
     mappings = []
     now = datetime.utcnow()
     for item in items:
@@ -167,6 +732,7 @@ def batch_review_questions(db: Session, items: List[Any]):
     
     db.bulk_update_mappings(models.Question, mappings)
     db.commit()
+    question_pool.refresh_questions(db, list(new_status))
 
 # Tag CRUD
 def get_tags(db: Session, skip: int = 0, limit: int = 1000):
@@ -230,8 +796,10 @@ def delete_rule(db: Session, rule_id: int):
     return db_rule
 
 # Paper CRUD
-def create_paper(db: Session, paper: schemas.ExamPaperCreate, questions: list):
+def create_paper(db: Session, paper: schemas.ExamPaperCreate, questions: list, scores: dict = None):
     # Serialize questions to store as snapshot
+    # scores optionally overrides the per-question score on this paper
+    scores = scores or {}
     questions_data = [
         {
             "id": q.id,
@@ -240,7 +808,7 @@ def create_paper(db: Session, paper: schemas.ExamPaperCreate, questions: list):
             "options": q.options,
             "answer": q.answer,
             "analysis": q.analysis,
-            "score": q.score,
+            "score": scores.get(q.id, q.score),
             "difficulty": q.difficulty,
             "tags": q.tags,
         } for q in questions
@@ -259,6 +827,13 @@ def create_paper(db: Session, paper: schemas.ExamPaperCreate, questions: list):
 def get_paper(db: Session, paper_id: int):
     return db.query(models.ExamPaper).filter(models.ExamPaper.id == paper_id).first()
 
+def get_papers_by_ids(db: Session, ids: List[int]) -> List[models.ExamPaper]:
+    """Papers for ids in the given order (one IN query); missing ids are skipped."""
+    if not ids:
+        return []
+    by_id = {p.id: p for p in db.query(models.ExamPaper).filter(models.ExamPaper.id.in_(ids))}
+    return [by_id[i] for i in ids if i in by_id]
+
 def list_papers(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.ExamPaper).order_by(models.ExamPaper.id.desc()).offset(skip).limit(limit).all()
 
@@ -6,8 +6,10 @@ from slowapi.errors import RateLimitExceeded
 import os
 
 from .models import Base
-from .database import engine
-from .routers import questions, papers, rules, ai, tags, logs
+from .database import engine, SessionLocal
+from . import crud
+from .services import search, dedup, similarity, jobs as job_runner
+from .routers import questions, papers, rules, ai, tags, logs, jobs
 from .limiter import limiter
 
 # Load environment variables
@@ -16,6 +18,18 @@ load_dotenv()
 # Create tables
 Base.metadata.create_all(bind=engine)
 
+# Backfill derived index tables for databases created before they existed
+with SessionLocal() as _db:
+    crud.ensure_question_tags(_db)
+    crud.ensure_facet_counts(_db)
+    search.ensure_index(_db)
+    dedup.ensure_index(_db)
+    similarity.ensure_index(_db)
+
+# Restart queued background jobs and clear expired job files
+with SessionLocal() as _db:
+    job_runner.resume_pending(_db)
+
 app = FastAPI(title="Smart Exam System API")
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
@@ -35,6 +49,7 @@ app.include_router(rules.router)
 app.include_router(ai.router)
 app.include_router(tags.router)
 app.include_router(logs.router)
+app.include_router(jobs.router)
 
 @app.get("/")
 @limiter.limit("5/minute")
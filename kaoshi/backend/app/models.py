@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, JSON, Float, DateTime
+from sqlalchemy import Column, Integer, String, Text, JSON, Float, DateTime, Index, DDL, event
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -26,7 +26,7 @@ class Question(Base):
     clause_num = Column(String, nullable=True)    # Clause number
     knowledge_points = Column(JSON, nullable=True) # List of knowledge points
     status = Column(String, default="draft")      # draft, review, published, archived, disabled
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Review fields
     review_comment = Column(Text, nullable=True)
@@ -35,6 +35,55 @@ class Question(Base):
 
     created_at = Column(DateTime, default=datetime.utcnow)
 
+# Full-text index over questions (rowid = questions.id). The text stored here
+# is pre-tokenized by services.search, which also keeps it in sync.
+FTS_TABLE = "questions_fts"
+CREATE_FTS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    "USING fts5(content, analysis, options, tokenize='unicode61')"
+)
+
+event.listen(Question.__table__, "after_create", DDL(CREATE_FTS_SQL).execute_if(dialect="sqlite"))
+event.listen(Question.__table__, "after_drop", DDL(f"DROP TABLE IF EXISTS {FTS_TABLE}").execute_if(dialect="sqlite"))
+
+class QuestionTag(Base):
+    # Normalized copy of Question.tags so tag filters can use an index
+    # instead of scanning the JSON column. Kept in sync by crud.
+    __tablename__ = "question_tags"
+
+    question_id = Column(Integer, primary_key=True)
+    tag = Column(String, primary_key=True)
+
+    __table_args__ = (
+        Index("ix_question_tags_tag_question", "tag", "question_id"),
+    )
+
+class QuestionLshBucket(Base):
+    # MinHash LSH band buckets of each question's normalized content, one
+    # row per band (services.dedup). Kept in sync by crud.
+    __tablename__ = "question_lsh_buckets"
+
+    bucket = Column(Integer, primary_key=True)  # band number in the top byte
+    question_id = Column(Integer, primary_key=True, index=True)
+
+class QuestionFacetCount(Base):
+    # Unfiltered per-value question counts (q_type, difficulty, status,
+    # source_doc, tag), updated by crud in the same transaction as the write.
+    __tablename__ = "question_facet_counts"
+
+    facet = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class CustomIdSequence(Base):
+    # Last Question.custom_id sequence number issued per prefix and day;
+    # crud.allocate_custom_ids reserves whole blocks from it.
+    __tablename__ = "custom_id_sequences"
+
+    prefix = Column(String, primary_key=True)
+    day = Column(String, primary_key=True)  # YYYYMMDD
+    last_seq = Column(Integer, nullable=False, default=0)
+
 class Tag(Base):
     __tablename__ = "tags"
 
@@ -72,3 +121,39 @@ class OperationLog(Base):
     status = Column(String, default="success") # success, failed
     error_message = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+class ImportBatch(Base):
+    # Rows validated by /questions/parse_import, kept until committed or expired
+    __tablename__ = "import_batches"
+
+    token = Column(String, primary_key=True)
+    filename = Column(String, nullable=True)
+    total = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class ImportBatchRow(Base):
+    __tablename__ = "import_batch_rows"
+
+    token = Column(String, primary_key=True)
+    row_index = Column(Integer, primary_key=True)
+    status = Column(String, nullable=False)  # valid, invalid, duplicate, error
+    data = Column(JSON, nullable=True)
+    errors = Column(JSON, nullable=True)
+
+class Job(Base):
+    # Background work (imports, AI generation, exports) run by services.jobs
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)            # import_questions, ai_generate, export_questions
+    status = Column(String, default="queued", index=True)  # queued, running, succeeded, failed
+    params = Column(JSON, nullable=True)
+    processed = Column(Integer, default=0)           # Units of work done (rows, questions)
+    total = Column(Integer, nullable=True)           # Known total, if any
+    result = Column(JSON, nullable=True)
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
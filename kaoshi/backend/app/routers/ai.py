@@ -1,8 +1,13 @@
-from fastapi import APIRouter, HTTPException, Request, UploadFile, File, Form
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+from typing import List, Optional, Union
+from app import database, schemas
 from app.schemas_ai import AIGenerateRequest, AIGeneratedQuestion
 from app.services.ai_service import AIService
 from app.services.file_parser import FileParser
+from app.services import jobs
 from app.limiter import limiter
 
 router = APIRouter(
@@ -22,13 +27,22 @@ async def parse_upload_file(request: Request, file: UploadFile = File(...)):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.post("/generate", response_model=List[AIGeneratedQuestion])
+@router.post("/generate", response_model=Union[List[AIGeneratedQuestion], schemas.Job])
 @limiter.limit("50/minute")
-def generate_questions_by_ai(req: AIGenerateRequest, request: Request):
+def generate_questions_by_ai(
+    req: AIGenerateRequest,
+    request: Request,
+    background: bool = False,
+    db: Session = Depends(database.get_db),
+):
     """
     接收文本，调用 AI 生成题目。
     如果配置了 OPENAI_API_KEY，将调用真实模型；否则返回 Mock 数据。
+    background=true 时立即返回任务，结果通过 /jobs/{id} 获取。
     """
+    if background:
+        job = jobs.submit(db, "ai_generate", req.dict(), total=1)
+        return JSONResponse(status_code=202, content=jsonable_encoder(jobs.describe(job)))
     try:
         # 使用通用 AIService 入口，内部自动判断使用 Real 或 Mock
         questions = AIService.generate_questions(
@@ -44,3 +58,9 @@ def generate_questions_by_ai(req: AIGenerateRequest, request: Request):
         return questions
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI generation failed: {str(e)}")
+
+@jobs.register("ai_generate")
+def _generate_job(ctx: jobs.JobContext):
+    questions = AIService.generate_questions(**ctx.params)
+    ctx.progress(1)
+    return {"questions": [q.dict() for q in questions]}
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import os
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+from app import database, schemas
+from app.services import jobs
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"],
+)
+
+def get_db():
+    db = database.SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Seconds between job polls on the event stream
+EVENT_POLL_INTERVAL = 0.5
+
+@router.get("/", response_model=List[schemas.Job])
+def read_jobs(kind: Optional[str] = None, status: Optional[str] = None, limit: int = 50, db: Session = Depends(get_db)):
+    return [jobs.describe(job) for job in jobs.list_jobs(db, kind=kind, status=status, limit=limit)]
+
+@router.get("/{job_id}", response_model=schemas.Job)
+def read_job(job_id: int, db: Session = Depends(get_db)):
+    job = jobs.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.describe(job)
+
+def _snapshot(job_id: int) -> Optional[dict]:
+    with database.SessionLocal() as db:
+        job = jobs.get_job(db, job_id)
+        return jsonable_encoder(jobs.describe(job)) if job is not None else None
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: int):
+    """Server-sent events: one `data:` message per progress change until the job finishes."""
+    first = await run_in_threadpool(_snapshot, job_id)
+    if first is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        state, last = first, None
+        while True:
+            progress = (state["status"], state["processed"], state["total"])
+            if progress != last:
+                last = progress
+                yield f"data: {json.dumps(state, ensure_ascii=False)}\n\n"
+            if state["status"] in jobs.TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(EVENT_POLL_INTERVAL)
+            state = await run_in_threadpool(_snapshot, job_id)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/{job_id}/download")
+def download_job_file(job_id: int, db: Session = Depends(get_db)):
+    job = jobs.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    result = job.result or {}
+    if job.status != "succeeded" or not result.get("file"):
+        raise HTTPException(status_code=400, detail="Job has no output file")
+    if not os.path.exists(result["file"]):
+        raise HTTPException(status_code=410, detail="Job output has expired")
+    return FileResponse(
+        result["file"],
+        media_type=result.get("media_type"),
+        filename=result.get("filename") or os.path.basename(result["file"]),
+    )
@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List
 from app import crud, schemas, database
-from app.services.engine import AssemblyEngine
-from app.services import exporter
+from app.services.engine import AssemblyEngine, variant_label
+from app.services import export_cache, paper_archive, render_pool
 
 router = APIRouter(
     prefix="/papers",
@@ -18,15 +18,58 @@ def get_db():
     finally:
         db.close()
 
-@router.post("/generate", response_model=schemas.ExamPaper)
+def resolve_total_score(req: schemas.GeneratePaperRequest, db: Session):
+    """Score target for constrained mode: rule_config first, then the saved rule."""
+    if req.rule_config.get("mode") != "constrained":
+        return None
+    total_score = req.rule_config.get("total_score")
+    if total_score is None and req.rule_id is not None:
+        rule = crud.get_rule(db, rule_id=req.rule_id)
+        total_score = rule.total_score if rule else None
+    return total_score
+
+@router.post("/generate", response_model=schemas.GeneratePaperResponse)
 def generate_paper(req: schemas.GeneratePaperRequest, db: Session = Depends(get_db)):
     engine = AssemblyEngine(db)
+    paper_req = schemas.ExamPaperCreate(title=req.title, rule_id=req.rule_id)
+
+    if req.rule_config.get("mode") == "constrained":
+        total_score = resolve_total_score(req, db)
+        result = engine.assemble(req.rule_config, total_score=total_score)
+        if not result.questions:
+            raise HTTPException(status_code=400, detail={
+                "message": "Could not generate paper. No published questions satisfy the constraints.",
+                "unmet_constraints": result.unmet,
+            })
+        db_paper = crud.create_paper(db=db, paper=paper_req, questions=result.questions, scores=result.scores)
+        paper = schemas.GeneratePaperResponse.model_validate(db_paper)
+        paper.unmet_constraints = [schemas.ConstraintViolation(**u) for u in result.unmet]
+        return paper
+
     selected_questions = engine.generate_paper(req.rule_config)
     if not selected_questions:
         raise HTTPException(status_code=400, detail="Could not generate paper. Please ensure there are enough 'Published' questions matching the rules.")
-    paper_req = schemas.ExamPaperCreate(title=req.title, rule_id=req.rule_id)
     return crud.create_paper(db=db, paper=paper_req, questions=selected_questions)
 
+@router.post("/generate_batch", response_model=List[schemas.GeneratePaperResponse])
+def generate_paper_batch(req: schemas.GeneratePaperBatchRequest, db: Session = Depends(get_db)):
+    """Generate `count` versions of the same exam with bounded question overlap."""
+    engine = AssemblyEngine(db)
+    results = engine.assemble_variants(
+        req.rule_config, req.count, req.max_overlap, total_score=resolve_total_score(req, db)
+    )
+    if not any(r.questions for r in results):
+        raise HTTPException(status_code=400, detail="Could not generate papers. Please ensure there are enough 'Published' questions matching the rules.")
+
+    papers = []
+    for idx, result in enumerate(results):
+        paper_req = schemas.ExamPaperCreate(title=f"{req.title} ({variant_label(idx)})", rule_id=req.rule_id)
+        db_paper = crud.create_paper(db=db, paper=paper_req, questions=result.questions, scores=result.scores)
+        paper = schemas.GeneratePaperResponse.model_validate(db_paper)
+        paper.unmet_constraints = [schemas.ConstraintViolation(**u) for u in result.unmet]
+        papers.append(paper)
+    return papers
+
 @router.get("/", response_model=List[schemas.ExamPaper])
 def list_papers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     return crud.list_papers(db=db, skip=skip, limit=limit)
@@ -38,9 +81,16 @@ def read_paper(paper_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Paper not found")
     return db_paper
 
+EXPORT_MEDIA_TYPES = {
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pdf": "application/pdf",
+    "txt": "text/plain; charset=utf-8",
+}
+
 @router.get("/{paper_id}/export")
 def export_paper(
     paper_id: int,
+    request: Request,
     format: str = "docx",
     include_answers: bool = True,
     db: Session = Depends(get_db),
@@ -48,29 +98,52 @@ def export_paper(
     db_paper = crud.get_paper(db, paper_id=paper_id)
     if db_paper is None:
         raise HTTPException(status_code=404, detail="Paper not found")
-    
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported format. Use docx/pdf/txt.")
+
     paper_data = {
         "title": db_paper.title,
         "questions_snapshot": db_paper.questions_snapshot,
     }
+    key = export_cache.cache_key(paper_id, paper_data, format, include_answers)
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
 
-    if format == "docx":
-        file_stream = exporter.export_to_docx(paper_data, include_answers=include_answers)
-        filename = f"exam_paper_{paper_id}.docx"
-        media_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-    elif format == "pdf":
-        file_stream = exporter.export_to_pdf(paper_data, include_answers=include_answers)
-        filename = f"exam_paper_{paper_id}.pdf"
-        media_type = "application/pdf"
-    elif format == "txt":
-        file_stream = exporter.export_to_txt(paper_data, include_answers=include_answers)
-        filename = f"exam_paper_{paper_id}.txt"
-        media_type = "text/plain; charset=utf-8"
-    else:
-        raise HTTPException(status_code=400, detail="Unsupported format. Use docx/pdf/txt.")
+    try:
+        path = export_cache.get_or_render(
+            key, format, lambda: render_pool.render(format, paper_data, include_answers=include_answers)
+        )
+    except render_pool.RenderQueueFull:
+        raise HTTPException(status_code=503, detail="Too many exports in progress, retry shortly.",
+                            headers={"Retry-After": "5"})
+    except render_pool.RenderTimeout:
+        raise HTTPException(status_code=504, detail="Rendering the paper timed out.")
+    return FileResponse(path, media_type=EXPORT_MEDIA_TYPES[format],
+                        filename=f"exam_paper_{paper_id}.{format}", headers=headers)
 
+@router.post("/export_bulk")
+def export_papers_bulk(req: schemas.PaperBulkExportRequest, db: Session = Depends(get_db)):
+    """ZIP of several papers in each requested format and answer variant, streamed as members finish."""
+    bad = [f for f in req.formats if f not in EXPORT_MEDIA_TYPES]
+    if bad:
+        raise HTTPException(status_code=400, detail=f"Unsupported format(s): {', '.join(bad)}. Use docx/pdf/txt.")
+    ids = list(dict.fromkeys(req.paper_ids))
+    db_papers = crud.get_papers_by_ids(db, ids)
+    if len(db_papers) != len(ids):
+        found = {p.id for p in db_papers}
+        raise HTTPException(status_code=404, detail={
+            "message": "Paper not found",
+            "missing_ids": [i for i in ids if i not in found],
+        })
+    # Plain dicts: the stream outlives this request's session
+    papers = [
+        {"id": p.id, "title": p.title, "questions_snapshot": p.questions_snapshot}
+        for p in db_papers
+    ]
     return StreamingResponse(
-        file_stream,
-        media_type=media_type,
-        headers={"Content-Disposition": f"attachment; filename={filename}"},
+        paper_archive.iter_zip(papers, list(dict.fromkeys(req.formats)), list(dict.fromkeys(req.include_answers))),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="exam_papers.zip"'},
     )
@@ -1,10 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional
 from app import crud, schemas, database
-import io
-import csv
+from app.services import search as search_index
+from app.services import importer
+from app.services import dedup
+from app.services import similarity
+from app.services import bank_export
+from app.services import jobs
+import os
+import json
+import base64
+from datetime import datetime
 
 router = APIRouter(
     prefix="/questions",
@@ -19,15 +28,42 @@ def get_db():
         db.close()
 
 @router.post("/", response_model=schemas.Question)
-def create_question(question: schemas.QuestionCreate, db: Session = Depends(get_db)):
+def create_question(
+    question: schemas.QuestionCreate,
+    similarity_threshold: Optional[float] = None,
+    db: Session = Depends(get_db),
+):
     # Check for strict duplicates using hash
     content_hash = crud.calculate_content_hash(question.content)
     existing = crud.get_question_by_hash(db, content_hash)
     if existing:
         raise HTTPException(status_code=400, detail=f"Duplicate question detected (ID: {existing.custom_id or existing.id})")
+    # Opt-in near-duplicate guard
+    if similarity_threshold is not None:
+        similar = crud.check_content_similarity(db, question.content, similarity_threshold)
+        if similar:
+            raise HTTPException(status_code=409, detail={"message": "Similar questions exist", "similar_questions": similar})
         
     return crud.create_question(db=db, question=question)
 
+def encode_cursor(page: dict) -> str:
+    raw = json.dumps(page).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    """{"before_id": id} (keyset) or {"offset": n} (relevance-ranked search)."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        page = json.loads(raw)
+        if "offset" in page:
+            offset = int(page["offset"])
+            if offset < 0:
+                raise ValueError(offset)
+            return {"offset": offset}
+        return {"before_id": int(page["before_id"])}
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/", response_model=schemas.QuestionListResponse)
 def read_questions(
     skip: int = 0,
@@ -39,18 +75,59 @@ def read_questions(
     status: Optional[str] = None,
     source_doc: Optional[str] = None,
     review_status: Optional[str] = None,
+    highlight: bool = False,
+    cursor: Optional[str] = None,
+    total_mode: str = "exact",
     db: Session = Depends(get_db),
 ):
-    questions, total = crud.get_questions_with_count(
-        db, skip=skip, limit=limit, 
+    """
+    List questions. Pass the returned next_cursor back as `cursor` for
+    constant-time paging (skip is then ignored); for searches ordered by
+    relevance the cursor carries an offset instead. total_mode is one of
+    exact, estimate or none.
+    """
+    if total_mode not in ("exact", "estimate", "none"):
+        raise HTTPException(status_code=400, detail="total_mode must be exact, estimate or none")
+    page = decode_cursor(cursor) if cursor else {}
+
+    questions, total, total_exact, next_page = crud.get_questions_page(
+        db, skip=page.get("offset", skip), limit=limit, before_id=page.get("before_id"), total_mode=total_mode,
         q_type=q_type, difficulty=difficulty, tag=tag,
         search=search, status=status, source_doc=source_doc,
         review_status=review_status
     )
-    return {"items": questions, "total": total}
+    result = {
+        "items": questions,
+        "total": total,
+        "total_exact": total_exact,
+        "next_cursor": encode_cursor(next_page) if next_page is not None else None,
+    }
+    if search and highlight:
+        snippets = {q.id: search_index.make_snippet(q, search) for q in questions}
+        result["snippets"] = {k: v for k, v in snippets.items() if v}
+    return result
+
+@router.get("/facets", response_model=schemas.QuestionFacets)
+def read_question_facets(
+    q_type: Optional[str] = None,
+    difficulty: Optional[int] = None,
+    tag: Optional[str] = None,
+    search: Optional[str] = None,
+    status: Optional[str] = None,
+    source_doc: Optional[str] = None,
+    review_status: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """Counts per q_type, difficulty, status, source_doc and tag for the current filter."""
+    total, facets = crud.get_facet_counts(
+        db, q_type=q_type, difficulty=difficulty, tag=tag,
+        search=search, status=status, source_doc=source_doc,
+        review_status=review_status
+    )
+    return {"total": total, "facets": facets}
 
 # Batch Operations
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Any
 
 class ReviewRequest(BaseModel):
@@ -86,236 +163,239 @@ class BatchOpRequest(BaseModel):
 class CheckDuplicateRequest(BaseModel):
     content: str
     threshold: float = 0.8
+    exclude_id: Optional[int] = None  # question being edited
 
 @router.post("/check_duplicate")
 def check_duplicate(req: CheckDuplicateRequest, db: Session = Depends(get_db)):
-    similar = crud.check_content_similarity(db, req.content, req.threshold)
+    similar = crud.check_content_similarity(db, req.content, req.threshold, exclude_id=req.exclude_id)
     return {"similar_questions": similar}
 
+class CheckDuplicateBatchRequest(BaseModel):
+    contents: List[str] = Field(max_length=500)
+    threshold: float = 0.8
+    limit: int = Field(default=5, ge=1, le=50)  # near-duplicates per item
+
+@router.post("/check_duplicate_batch", response_model=schemas.DuplicateCheckBatchResult)
+def check_duplicate_batch(req: CheckDuplicateBatchRequest, db: Session = Depends(get_db)):
+    """Exact and near-duplicate matches for each candidate content, in one request."""
+    return {"items": crud.check_duplicates_batch(db, req.contents, req.threshold, req.limit)}
+
+class SimilarRequest(BaseModel):
+    text: str
+    k: int = Field(default=10, ge=1, le=100)
+    exclude_id: Optional[int] = None
+
+def _submit_similarity_rebuild(db: Session):
+    if not any(jobs.list_jobs(db, kind="similarity_index", status=status) for status in ("queued", "running")):
+        jobs.submit(db, "similarity_index")
+
+def _similar(db: Session, text: str, k: int, exclude_id: Optional[int]):
+    try:
+        items = similarity.find_similar(db, text, k, exclude_id)
+    except similarity.IndexNotBuilt:
+        # Never built in the request: start the job and let the client retry
+        _submit_similarity_rebuild(db)
+        raise HTTPException(status_code=503, detail="The similarity index is being built, retry shortly.",
+                            headers={"Retry-After": "30"})
+    # The delta segment has grown past its share: rebuild in the background
+    if similarity.get_index(db).needs_rebuild():
+        _submit_similarity_rebuild(db)
+    return {"items": items}
+
+@router.post("/similar")
+def find_similar_questions(req: SimilarRequest, db: Session = Depends(get_db)):
+    """Top-k questions by TF-IDF cosine similarity to free text."""
+    return _similar(db, req.text, req.k, req.exclude_id)
+
+@router.post("/similar/rebuild", status_code=202)
+def rebuild_similarity_index(db: Session = Depends(get_db)):
+    job = jobs.submit(db, "similarity_index")
+    return jsonable_encoder(jobs.describe(job))
+
+@jobs.register("similarity_index")
+def _similarity_index_job(ctx: jobs.JobContext):
+    similarity.rebuild(ctx.db, on_progress=ctx.progress)
+    return {"rows": ctx.processed}
+
+class DuplicateGroupsRequest(BaseModel):
+    threshold: float = Field(default=0.8, gt=0, le=1)
+    workers: Optional[int] = Field(default=None, ge=1)
+
+# Groups included inline in the job result; the full list is in the job's file
+DUPLICATE_GROUPS_PREVIEW = 50
+
+@router.post("/duplicate_groups", status_code=202)
+def find_duplicate_groups(req: DuplicateGroupsRequest, db: Session = Depends(get_db)):
+    """
+    Cluster the whole bank into near-duplicate groups in the background.
+    Poll /jobs/{id}; the full result is a JSON Lines download.
+    """
+    job = jobs.submit(db, "duplicate_groups", req.dict())
+    return jsonable_encoder(jobs.describe(job))
+
+@jobs.register("duplicate_groups")
+def _duplicate_groups_job(ctx: jobs.JobContext):
+    truncated = []
+    groups = dedup.find_duplicate_groups(
+        ctx.db, threshold=ctx.params.get("threshold", 0.8),
+        workers=ctx.params.get("workers"), on_progress=ctx.progress, truncated=truncated,
+    )
+    path = ctx.output_path("duplicate_groups.jsonl")
+    with open(path, "w", encoding="utf-8") as out:
+        for group in groups:
+            out.write(json.dumps(group, ensure_ascii=False) + "\n")
+    return {
+        "groups": len(groups),
+        "questions": sum(g["size"] for g in groups),
+        "top_groups": groups[:DUPLICATE_GROUPS_PREVIEW],
+        # LSH buckets too common to compare all their members pairwise
+        "truncated_buckets": len(truncated),
+        "top_truncated_buckets": sorted(truncated, key=lambda b: -b["size"])[:DUPLICATE_GROUPS_PREVIEW],
+        "file": path,
+        "filename": "duplicate_groups.jsonl",
+        "media_type": "application/x-ndjson",
+    }
+
+def stream_questions_export(fmt: str, filters: dict):
+    """
+    Encoded chunks of the streamed export. Holds its own session, since the
+    request's is closed before the body is sent.
+    """
+    db = database.SessionLocal()
+    try:
+        count = 0
+        def rows():
+            nonlocal count
+            for row in crud.iter_export_questions(db, **filters):
+                count += 1
+                yield row
+        yield from bank_export.iter_export(fmt, rows())
+        crud.create_operation_log(
+            db, action="export", target_type="question",
+            details={"count": count, "format": fmt, "filters": {"q_type": filters.get("q_type"), "tag": filters.get("tag")}}
+        )
+    finally:
+        db.close()
+
 @router.post("/export")
 def export_questions(
     q_type: Optional[str] = None,
     difficulty: Optional[int] = None,
     tag: Optional[str] = None,
     status: Optional[str] = None,
+    format: str = "csv",
+    background: bool = False,
     db: Session = Depends(get_db)
 ):
-    questions = crud.get_questions(
-        db, skip=0, limit=100000, 
-        q_type=q_type, difficulty=difficulty, tag=tag, status=status
+    if format not in bank_export.FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported format. Use csv/xlsx/jsonl/parquet.")
+    filters = {"q_type": q_type, "difficulty": difficulty, "tag": tag, "status": status}
+    if background:
+        job = jobs.submit(db, "export_questions", {**filters, "format": format})
+        return JSONResponse(status_code=202, content=jsonable_encoder(jobs.describe(job)))
+
+    media_type, filename = bank_export.FORMATS[format]
+    return StreamingResponse(
+        stream_questions_export(format, filters),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['ID', 'Type', 'Content', 'Options', 'Answer', 'Difficulty', 'Tags', 'Status'])
-    
-    for q in questions:
-        writer.writerow([
-            q.custom_id or q.id,
-            q.q_type,
-            q.content,
-            str(q.options) if q.options else '',
-            q.answer,
-            q.difficulty,
-            ",".join(q.tags) if q.tags else '',
-            q.status
-        ])
-    
-    output.seek(0)
-    
+
+@jobs.register("export_questions")
+def _export_job(ctx: jobs.JobContext):
+    filters = {k: v for k, v in ctx.params.items() if k != "format"}
+    fmt = ctx.params.get("format", "csv")
+    media_type, filename = bank_export.FORMATS[fmt]
+    ctx.progress(0, total=crud.count_export_questions(ctx.db, **filters), force=True)
+    count = 0
+    def rows():
+        nonlocal count
+        for row in crud.iter_export_questions(ctx.db, **filters):
+            count += 1
+            if count % 1000 == 0:
+                ctx.progress(count)
+            yield row
+    path = ctx.output_path(filename)
+    with open(path, "wb") as out:
+        for chunk in bank_export.iter_export(fmt, rows()):
+            out.write(chunk)
+    ctx.progress(count)
     crud.create_operation_log(
-        db, action="export", target_type="question", 
-        details={"count": len(questions), "filters": {"q_type": q_type, "tag": tag}}
-    )
-    
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=questions_export.csv"}
+        ctx.db, action="export", target_type="question",
+        details={"count": count, "format": fmt, "filters": {"q_type": filters.get("q_type"), "tag": filters.get("tag")}, "job_id": ctx.job_id}
     )
+    return {"count": count, "file": path, "filename": filename, "media_type": media_type}
 
 @router.post("/parse_import")
-async def parse_import_questions(file: UploadFile = File(...), db: Session = Depends(get_db)):
+def parse_import_questions(file: UploadFile = File(...), db: Session = Depends(get_db)):
     """
     Parse an import file and return the data for preview/validation without saving.
+    The parsed rows are staged under the returned token for /import/commit.
     """
-    contents = await file.read()
     filename = file.filename
-    
-    df = None
     try:
-        if filename.endswith('.csv'):
-            try:
-                df = pd.read_csv(io.BytesIO(contents), encoding='utf-8')
-            except UnicodeDecodeError:
-                df = pd.read_csv(io.BytesIO(contents), encoding='gbk')
-        elif filename.endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(io.BytesIO(contents))
-        else:
-            raise HTTPException(400, "Unsupported file format. Please use .csv or .xlsx")
+        frames = importer.open_frames(file.file, filename)
+        return importer.stage_preview(db, frames, filename)
     except Exception as e:
         raise HTTPException(400, f"Failed to parse file: {str(e)}")
-    
-    # Fill NaN with None/Empty
-    df = df.where(pd.notnull(df), None)
 
-    parsed_items = []
-    
-    for idx, row in df.iterrows():
-        item = {
-            "row_index": idx + 1,
-            "status": "valid",
-            "errors": [],
-            "data": {}
-        }
-        
-        try:
-            # Map columns
-            content = row.get('content') or row.get('题干')
-            if not content:
-                item["status"] = "invalid"
-                item["errors"].append("Content is missing")
-            else:
-                item["data"]["content"] = str(content).strip()
-                
-            q_type = row.get('q_type') or row.get('题型') or 'single'
-            type_map = {'单选': 'single', '多选': 'multi', '判断': 'judge', '简答': 'essay'}
-            if q_type in type_map: q_type = type_map[q_type]
-            item["data"]["q_type"] = str(q_type)
-            
-            difficulty = row.get('difficulty') or row.get('难度') or 3
-            try:
-                item["data"]["difficulty"] = int(difficulty)
-            except:
-                item["data"]["difficulty"] = 3
-                
-            options_raw = row.get('options') or row.get('选项')
-            options = []
-            if options_raw and isinstance(options_raw, str):
-                options = [o.strip() for o in options_raw.split('\n') if o.strip()]
-            item["data"]["options"] = options
-            
-            answer = row.get('answer') or row.get('答案') or ''
-            item["data"]["answer"] = str(answer).strip()
-            
-            tags_raw = row.get('tags') or row.get('标签')
-            tags = []
-            if tags_raw and isinstance(tags_raw, str):
-                tags = [t.strip() for t in tags_raw.split(',') if t.strip()]
-            item["data"]["tags"] = tags
-            
-            item["data"]["analysis"] = str(row.get('analysis') or row.get('解析') or '') or None
-            item["data"]["source_doc"] = str(row.get('source_doc') or row.get('来源') or '') or None
-
-            # Validation: Check Duplicate
-            if item["data"].get("content"):
-                content_hash = crud.calculate_content_hash(item["data"]["content"])
-                existing = crud.get_question_by_hash(db, content_hash)
-                if existing:
-                    item["status"] = "duplicate"
-                    item["errors"].append("Duplicate question exists")
-                    item["existing_id"] = existing.id
-
-        except Exception as e:
-            item["status"] = "error"
-            item["errors"].append(str(e))
-            
-        parsed_items.append(item)
+class ImportCommitRequest(BaseModel):
+    token: str
+    rows: Optional[List[int]] = None  # row_index values to import; default all valid rows
+    edits: Optional[Dict[int, Dict[str, Any]]] = None  # row_index -> corrected fields
+
+@router.post("/import/commit")
+def commit_import(req: ImportCommitRequest, background: bool = False, db: Session = Depends(get_db)):
+    """Insert rows staged by /parse_import without re-reading or re-parsing the file."""
+    batch = crud.get_import_batch(db, req.token)
+    if batch is None:
+        raise HTTPException(404, "Import batch not found")
+    if batch.expires_at < datetime.utcnow():
+        crud.delete_import_batch(db, req.token)
+        raise HTTPException(410, "Import batch has expired, please parse the file again")
 
-    return {"filename": filename, "total": len(parsed_items), "items": parsed_items}
+    if background:
+        job = jobs.submit(db, "commit_import", jsonable_encoder(req), total=batch.total)
+        return JSONResponse(status_code=202, content=jsonable_encoder(jobs.describe(job)))
+    return importer.commit_staged(db, batch, rows=req.rows, edits=req.edits)
+
+@jobs.register("commit_import")
+def _commit_import_job(ctx: jobs.JobContext):
+    batch = crud.get_import_batch(ctx.db, ctx.params["token"])
+    if batch is None:
+        raise ValueError("Import batch not found")
+    return importer.commit_staged(
+        ctx.db, batch, rows=ctx.params.get("rows"), edits=ctx.params.get("edits"), on_progress=ctx.progress
+    )
 
 @router.post("/import")
-async def import_questions(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    contents = await file.read()
+def import_questions(file: UploadFile = File(...), background: bool = False, db: Session = Depends(get_db)):
+    """
+    Import questions from a CSV/XLSX file. With background=true the upload is
+    saved and imported by a job; poll /jobs/{id} for progress and the result.
+    """
     filename = file.filename
-    
-    df = None
+    if background:
+        path = jobs.save_upload(file.file, filename)
+        job = jobs.submit(db, "import_questions", {"path": path, "filename": filename})
+        return JSONResponse(status_code=202, content=jsonable_encoder(jobs.describe(job)))
+
     try:
-        if filename.endswith('.csv'):
-            # Try utf-8 then gbk
-            try:
-                df = pd.read_csv(io.BytesIO(contents), encoding='utf-8')
-            except UnicodeDecodeError:
-                df = pd.read_csv(io.BytesIO(contents), encoding='gbk')
-        elif filename.endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(io.BytesIO(contents))
-        else:
-            raise HTTPException(400, "Unsupported file format. Please use .csv or .xlsx")
+        frames = importer.open_frames(file.file, filename)
     except Exception as e:
         raise HTTPException(400, f"Failed to parse file: {str(e)}")
-    
-    success_count = 0
-    failed_count = 0
-    errors = []
-    
-    # Fill NaN with None/Empty to avoid validation errors
-    df = df.where(pd.notnull(df), None)
-
-    for idx, row in df.iterrows():
-        try:
-            # Map columns
-            content = row.get('content') or row.get('题干')
-            if not content:
-                continue
-                
-            q_type = row.get('q_type') or row.get('题型') or 'single'
-            type_map = {'单选': 'single', '多选': 'multi', '判断': 'judge', '简答': 'essay'}
-            if q_type in type_map: q_type = type_map[q_type]
-            
-            difficulty = row.get('difficulty') or row.get('难度') or 3
-            try:
-                difficulty = int(difficulty)
-            except:
-                difficulty = 3
-                
-            options_raw = row.get('options') or row.get('选项')
-            options = []
-            if options_raw and isinstance(options_raw, str):
-                options = [o.strip() for o in options_raw.split('\n') if o.strip()]
-            
-            answer = row.get('answer') or row.get('答案') or ''
-            
-            tags_raw = row.get('tags') or row.get('标签')
-            tags = []
-            if tags_raw and isinstance(tags_raw, str):
-                tags = [t.strip() for t in tags_raw.split(',') if t.strip()]
-                
-            q_schema = schemas.QuestionCreate(
-                content=str(content).strip(),
-                q_type=str(q_type),
-                difficulty=difficulty,
-                options=options,
-                answer=str(answer).strip(),
-                tags=tags,
-                analysis=str(row.get('analysis') or row.get('解析') or '') or None,
-                source_doc=str(row.get('source_doc') or row.get('来源') or '') or None
-            )
-            
-            # Check duplicate
-            content_hash = crud.calculate_content_hash(q_schema.content)
-            existing = crud.get_question_by_hash(db, content_hash)
-            if existing:
-                failed_count += 1
-                errors.append(f"Row {idx+1}: Duplicate content")
-                continue
-
-            crud.create_question(db, q_schema)
-            success_count += 1
-            
-        except Exception as e:
-            failed_count += 1
-            errors.append(f"Row {idx+1}: {str(e)}")
-
-    crud.create_operation_log(
-        db, "batch_import", "question", 
-        details={"filename": filename, "success": success_count, "failed": failed_count}
-    )
+    return importer.run_import(db, frames, filename)
 
-    return {
-        "success": success_count,
-        "failed": failed_count,
-        "errors": errors[:50]
-    }
+@jobs.register("import_questions")
+def _import_job(ctx: jobs.JobContext):
+    path, filename = ctx.params["path"], ctx.params["filename"]
+    try:
+        with open(path, "rb") as f:
+            frames = importer.open_frames(f, filename)
+            return importer.run_import(ctx.db, frames, filename, on_progress=ctx.progress)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
 
 @router.post("/batch")
 def batch_operations(req: BatchOpRequest, db: Session = Depends(get_db)):
@@ -368,32 +448,18 @@ class BatchCreateRequest(BaseModel):
 
 @router.post("/batch_create", response_model=List[schemas.Question])
 def batch_create_questions(req: BatchCreateRequest, db: Session = Depends(get_db)):
-    results = []
-    errors = []
-    for q in req.questions:
-        try:
-            # Re-use duplicate check logic manually or via crud
-            # Ideally we should refactor create_question to not depend on router logic
-            # But here we can just call crud.create_question, but first check hash
-            content_hash = crud.calculate_content_hash(q.content)
-            existing = crud.get_question_by_hash(db, content_hash)
-            if existing:
-                # Skip duplicate silently or return error?
-                # For batch import, skipping or marking as error is better than failing all
-                errors.append(f"Duplicate content: {q.content[:20]}...")
-                continue
-            
-            new_q = crud.create_question(db=db, question=q)
-            results.append(new_q)
-        except Exception as e:
-            errors.append(f"Error creating {q.content[:20]}...: {str(e)}")
-            
-    # We return created questions. Errors could be returned in headers or a wrapper response
-    # For simple list response, we just return successes.
-    # To provide feedback, maybe we should change response model.
-    # But to keep compatible with "List[Question]", let's just return created ones.
-    # Real-world app would return { success: [], failed: [] }
-    return results
+    """Legacy variant: returns only the created questions (see /batch_create/v2)."""
+    result = crud.batch_create_questions(db, req.questions)
+    return crud.get_questions_by_ids(db, [c["id"] for c in result["created"]])
+
+class BatchCreateV2Request(BaseModel):
+    # Plain dicts so one malformed item is reported instead of rejecting the batch
+    questions: List[Dict[str, Any]]
+
+@router.post("/batch_create/v2", response_model=schemas.BatchCreateResult)
+def batch_create_questions_v2(req: BatchCreateV2Request, db: Session = Depends(get_db)):
+    """Create questions in one transaction; reports created, duplicate and failed items by index."""
+    return crud.batch_create_questions(db, req.questions)
 
 @router.get("/{question_id}", response_model=schemas.Question)
 def read_question(question_id: int, db: Session = Depends(get_db)):
@@ -402,6 +468,14 @@ def read_question(question_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Question not found")
     return db_question
 
+@router.get("/{question_id}/similar")
+def related_questions(question_id: int, k: int = Query(10, ge=1, le=100), db: Session = Depends(get_db)):
+    """Questions related to a stored one (by content, analysis and options)."""
+    q = crud.get_question(db, question_id=question_id)
+    if q is None:
+        raise HTTPException(status_code=404, detail="Question not found")
+    return _similar(db, similarity.document(q.content, q.analysis, q.options), k, question_id)
+
 @router.delete("/{question_id}", response_model=schemas.Question)
 def delete_question(question_id: int, db: Session = Depends(get_db)):
     db_question = crud.delete_question(db, question_id=question_id)
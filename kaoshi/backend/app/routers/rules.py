@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 from app import crud, schemas, database
+from app.services import feasibility
 
 router = APIRouter(
     prefix="/rules",
@@ -15,9 +16,31 @@ def get_db():
     finally:
         db.close()
 
-@router.post("/", response_model=schemas.ExamRule)
+def check_rule(db: Session, config: dict, total_score: float):
+    # Only constrained assembly targets the rule's total score
+    target = total_score if config.get("mode") == "constrained" else None
+    return feasibility.check_rule(db, config, total_score=target)
+
+def with_check(db: Session, db_rule):
+    rule = schemas.ExamRuleWithCheck.model_validate(db_rule)
+    rule.feasibility = schemas.RuleCheckResult(**check_rule(db, db_rule.config, db_rule.total_score))
+    return rule
+
+@router.post("/", response_model=schemas.ExamRuleWithCheck)
 def create_rule(rule: schemas.ExamRuleCreate, db: Session = Depends(get_db)):
-    return crud.create_rule(db=db, rule=rule)
+    return with_check(db, crud.create_rule(db=db, rule=rule))
+
+@router.post("/check", response_model=schemas.RuleCheckResult)
+def check_rule_config(rule: schemas.ExamRuleCreate, db: Session = Depends(get_db)):
+    """Feasibility of an unsaved rule, for live feedback in the rule editor."""
+    return check_rule(db, rule.config, rule.total_score)
+
+@router.post("/{rule_id}/check", response_model=schemas.RuleCheckResult)
+def check_saved_rule(rule_id: int, db: Session = Depends(get_db)):
+    db_rule = crud.get_rule(db=db, rule_id=rule_id)
+    if db_rule is None:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    return check_rule(db, db_rule.config, db_rule.total_score)
 
 @router.get("/", response_model=List[schemas.ExamRule])
 def list_rules(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
@@ -30,12 +53,12 @@ def get_rule(rule_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Rule not found")
     return db_rule
 
-@router.put("/{rule_id}", response_model=schemas.ExamRule)
+@router.put("/{rule_id}", response_model=schemas.ExamRuleWithCheck)
 def update_rule(rule_id: int, rule: schemas.ExamRuleUpdate, db: Session = Depends(get_db)):
     db_rule = crud.update_rule(db=db, rule_id=rule_id, rule=rule)
     if db_rule is None:
         raise HTTPException(status_code=404, detail="Rule not found")
-    return db_rule
+    return with_check(db, db_rule)
 
 @router.delete("/{rule_id}", response_model=schemas.ExamRule)
 def delete_rule(rule_id: int, db: Session = Depends(get_db)):
@@ -56,7 +56,49 @@ class Question(QuestionBase):
 
 class QuestionListResponse(BaseModel):
     items: List[Question]
+    total: Optional[int] = None
+    # False when total was skipped or capped (total_mode=none/estimate)
+    total_exact: bool = True
+    # Opaque cursor for the next page (keyset, or an offset for searches
+    # ordered by relevance); None on the last page
+    next_cursor: Optional[str] = None
+    # Highlighted search hits keyed by question id (only when requested)
+    snippets: Optional[Dict[int, str]] = None
+
+class QuestionFacets(BaseModel):
     total: int
+    # facet name -> value -> count, e.g. {"q_type": {"single": 12}}
+    facets: Dict[str, Dict[str, int]]
+
+class BatchCreateItem(BaseModel):
+    index: int  # position in the request's questions list
+    id: Optional[int] = None  # created question
+    custom_id: Optional[str] = None
+    existing_id: Optional[int] = None  # question a duplicate matched, if already stored
+    error: Optional[str] = None
+
+class BatchCreateResult(BaseModel):
+    created: List[BatchCreateItem]
+    duplicates: List[BatchCreateItem]
+    failed: List[BatchCreateItem]
+
+class SimilarQuestion(BaseModel):
+    id: int
+    content: str
+    score: float  # Jaccard similarity of normalized content
+
+class ExactDuplicate(BaseModel):
+    id: int
+    custom_id: Optional[str] = None
+
+class DuplicateCheckItem(BaseModel):
+    index: int  # position in the request's contents list
+    exact: Optional[ExactDuplicate] = None
+    batch_duplicate_of: Optional[int] = None  # earlier index with the same content
+    similar: List[SimilarQuestion]
+
+class DuplicateCheckBatchResult(BaseModel):
+    items: List[DuplicateCheckItem]
 
 class TagBase(BaseModel):
     name: str
@@ -96,6 +138,22 @@ class ExamRule(ExamRuleBase):
     class Config:
         from_attributes = True
 
+class RuleCheckCell(BaseModel):
+    dimension: str  # type, difficulty, knowledge_point, total_score
+    key: Optional[str] = None
+    required: float
+    available: float
+    exact: bool = True  # False when the count is a bound (multi-tag filters)
+    shortfall: float
+
+class RuleCheckResult(BaseModel):
+    feasible: bool
+    cells: List[RuleCheckCell]
+    shortfalls: List[RuleCheckCell]
+
+class ExamRuleWithCheck(ExamRule):
+    feasibility: Optional[RuleCheckResult] = None
+
 # Exam Paper Schemas
 class ExamPaperBase(BaseModel):
     title: str
@@ -117,6 +175,27 @@ class GeneratePaperRequest(BaseModel):
     rule_id: Optional[int] = None
     rule_config: Dict[str, Any]
 
+class ConstraintViolation(BaseModel):
+    constraint: str  # type_count, difficulty, knowledge_point, total_score
+    key: Optional[str] = None
+    required: float
+    achieved: float
+
+class GeneratePaperResponse(ExamPaper):
+    # Only filled in by constrained assembly ("mode": "constrained")
+    unmet_constraints: List[ConstraintViolation] = []
+
+class GeneratePaperBatchRequest(GeneratePaperRequest):
+    count: int = Field(ge=1, le=26)  # versions are labelled A..Z
+    # Max share of questions two versions may have in common (0 = disjoint)
+    max_overlap: float = Field(default=0.3, ge=0, le=1)
+
+class PaperBulkExportRequest(BaseModel):
+    paper_ids: List[int] = Field(min_length=1, max_length=200)
+    formats: List[str] = Field(default=["docx"], min_length=1)
+    # One archive member per variant: True = with answers, False = without
+    include_answers: List[bool] = Field(default=[True], min_length=1)
+
 class OperationLog(BaseModel):
     id: int
     user_id: Optional[str] = None
@@ -130,3 +209,17 @@ class OperationLog(BaseModel):
 
     class Config:
         from_attributes = True
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: str  # queued, running, succeeded, failed
+    processed: int = 0
+    total: Optional[int] = None
+    elapsed_seconds: float = 0.0
+    throughput: float = 0.0  # processed units per second
+    result: Optional[Dict[str, Any]] = None
+    error_message: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
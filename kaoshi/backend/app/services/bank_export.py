@@ -0,0 +1,189 @@
+"""
+Question bank export formats, each produced as a stream of byte chunks
+from an iterator of crud.EXPORT_COLUMNS rows, so the bank is never held
+in memory:
+
+- csv: the legacy spreadsheet layout (EXPORT_HEADER).
+- xlsx: openpyxl write-only workbook with importable headers. Rows are
+  spooled to disk as they arrive; the zip container can only be sent once
+  the sheet is complete.
+- jsonl: gzip'd JSON Lines, one object per question with real lists.
+- parquet: one row group per PARQUET_ROW_GROUP rows (needs pyarrow).
+
+xlsx, jsonl and parquet use the importer's field names, so their files can
+be imported again as they are.
+"""
+import csv
+import io
+import json
+import os
+import tempfile
+import zlib
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator
+
+from app.services.streaming import ChunkSink
+
+EXPORT_HEADER = ['ID', 'Type', 'Content', 'Options', 'Answer', 'Difficulty', 'Tags', 'Status']
+# Bytes buffered before a chunk is sent
+EXPORT_CHUNK_SIZE = 64 * 1024
+PARQUET_ROW_GROUP = 10000
+
+# Fields of the machine-readable formats, in column order
+FIELDS = [
+    "id", "custom_id", "q_type", "content", "options", "answer", "analysis", "difficulty",
+    "tags", "score", "source_doc", "knowledge_points", "status", "created_at",
+]
+LIST_FIELDS = ("options", "tags", "knowledge_points")
+
+# format -> (media type, download filename)
+FORMATS = {
+    "csv": ("text/csv", "questions_export.csv"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "questions_export.xlsx"),
+    "jsonl": ("application/gzip", "questions_export.jsonl.gz"),
+    "parquet": ("application/vnd.apache.parquet", "questions_export.parquet"),
+}
+
+
+def _as_list(value):
+    """JSON list column as a list of strings (None stays None)."""
+    if value is None:
+        return None
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    return [str(v) for v in value if v is not None]
+
+
+def _record(row) -> dict:
+    record = {field: getattr(row, field) for field in FIELDS}
+    for field in LIST_FIELDS:
+        record[field] = _as_list(record[field])
+    return record
+
+
+def _export_row(q) -> list:
+    return [
+        q.custom_id or q.id,
+        q.q_type,
+        q.content,
+        str(q.options) if q.options else '',
+        q.answer,
+        q.difficulty,
+        ",".join(q.tags) if q.tags else '',
+        q.status
+    ]
+
+
+def iter_csv(rows: Iterable) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_HEADER)
+    for q in rows:
+        writer.writerow(_export_row(q))
+        if buf.tell() >= EXPORT_CHUNK_SIZE:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_jsonl_gz(rows: Iterable) -> Iterator[bytes]:
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    lines, size = [], 0
+    for row in rows:
+        line = json.dumps(_record(row), ensure_ascii=False, default=_json_default) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            out = gz.compress("".join(lines).encode("utf-8"))
+            lines, size = [], 0
+            if out:
+                yield out
+    yield gz.compress("".join(lines).encode("utf-8")) + gz.flush()
+
+
+def _xlsx_cell(field: str, value, illegal):
+    if value is None:
+        return None
+    if field == "options":
+        value = "\n".join(value)
+    elif field in LIST_FIELDS:
+        value = ",".join(value)
+    if isinstance(value, str):
+        return illegal.sub("", value)
+    return value
+
+
+def iter_xlsx(rows: Iterable) -> Iterator[bytes]:
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("questions")
+    ws.append(FIELDS)
+    for row in rows:
+        record = _record(row)
+        ws.append([_xlsx_cell(field, record[field], ILLEGAL_CHARACTERS_RE) for field in FIELDS])
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        wb.save(path)
+        with open(path, "rb") as f:
+            while chunk := f.read(EXPORT_CHUNK_SIZE):
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+def arrow_schema():
+    import pyarrow as pa
+
+    text, text_list = pa.string(), pa.list_(pa.string())
+    return pa.schema([
+        ("id", pa.int64()), ("custom_id", text), ("q_type", text), ("content", text),
+        ("options", text_list), ("answer", text), ("analysis", text), ("difficulty", pa.int64()),
+        ("tags", text_list), ("score", pa.float64()), ("source_doc", text),
+        ("knowledge_points", text_list), ("status", text), ("created_at", pa.timestamp("us")),
+    ])
+
+
+def iter_parquet(rows: Iterable, row_group: int = PARQUET_ROW_GROUP) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema()
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    rows = iter(rows)
+    while True:
+        batch = [_record(row) for row in islice(rows, row_group)]
+        if not batch:
+            break
+        columns = {field: [r[field] for r in batch] for field in FIELDS}
+        writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+def iter_export(fmt: str, rows: Iterable) -> Iterator[bytes]:
+    """Byte chunks of the bank in fmt (see FORMATS)."""
+    if fmt == "csv":
+        return iter_csv(rows)
+    if fmt == "xlsx":
+        return iter_xlsx(rows)
+    if fmt == "jsonl":
+        return iter_jsonl_gz(rows)
+    if fmt == "parquet":
+        return iter_parquet(rows)
+    raise ValueError(f"Unsupported export format: {fmt}")
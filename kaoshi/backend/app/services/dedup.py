@@ -0,0 +1,360 @@
+"""
+Near-duplicate detection over question content with MinHash LSH.
+
+Content is normalized (NFKC, lower-cased, whitespace and punctuation
+removed) and cut into overlapping character shingles, which needs no word
+segmentation and so works for Chinese. Each question's MinHash signature is
+split into bands; every band hashes to one row in question_lsh_buckets,
+kept in sync by crud. Two questions sharing any bucket are candidates, and
+candidates are scored by exact shingle Jaccard similarity.
+
+With 20 bands of 5 rows a pair at Jaccard 0.8 shares a bucket with
+probability > 0.999, at 0.6 about 0.8; well below 0.5 recall drops off.
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import combinations
+import multiprocessing
+import os
+import re
+import unicodedata
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from app import models
+
+SHINGLE_SIZE = 3
+NUM_BANDS = 20
+BAND_ROWS = 5
+NUM_PERM = NUM_BANDS * BAND_ROWS
+
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_rng = np.random.RandomState(20240601)  # fixed: signatures are persisted
+_A = _rng.randint(1, 2 ** 31, size=NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, 2 ** 31, size=NUM_PERM).astype(np.uint64)
+_BAND_MULT = _rng.randint(1, 2 ** 63, size=BAND_ROWS, dtype=np.uint64) | np.uint64(1)
+_BAND_NUMBERS = np.arange(NUM_BANDS, dtype=np.uint64) << np.uint64(56)
+_KEY_MASK = np.uint64((1 << 56) - 1)
+
+_STRIP_RE = re.compile(r"[\W_]+")
+
+# Whole-bank clustering: candidate pairs are verified in a process pool
+# once there are at least PARALLEL_PAIRS_MIN of them
+CLUSTER_WORKERS = int(os.getenv("CLUSTER_WORKERS", "0")) or (os.cpu_count() or 1)
+PARALLEL_PAIRS_MIN = int(os.getenv("PARALLEL_PAIRS_MIN", "20000"))
+PAIR_CHUNK_SIZE = 5000
+# Members of larger buckets are only paired with the bucket's first member,
+# so one very common text cannot blow up into millions of pairs; such
+# buckets are reported (see candidate_pairs)
+MAX_BUCKET_SIZE = 200
+
+
+def normalize(content: Optional[str]) -> str:
+    """Form used for comparison: trivial punctuation/spacing differences vanish."""
+    text = unicodedata.normalize("NFKC", content or "").lower()
+    return _STRIP_RE.sub("", text)
+
+
+def shingles(content: Optional[str]) -> Set[str]:
+    text = normalize(content)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def signature(shingle_set: Set[str]) -> Optional[np.ndarray]:
+    """MinHash signature (NUM_PERM uint32 values); None for empty content."""
+    if not shingle_set:
+        return None
+    hv = np.fromiter(
+        (zlib.crc32(s.encode("utf-8")) for s in shingle_set),
+        dtype=np.uint64, count=len(shingle_set),
+    )
+    # a < 2**31 and hv < 2**32, so a * hv + b stays inside uint64
+    return ((_A[:, None] * hv[None, :] + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def band_keys(sig: np.ndarray) -> List[int]:
+    """One bucket key per band: the band number in the top byte, 56 hash bits below."""
+    # Multiply-shift hash of each band's rows (uint64 arithmetic wraps)
+    h = (sig.reshape(NUM_BANDS, BAND_ROWS).astype(np.uint64) * _BAND_MULT).sum(axis=1)
+    h ^= h >> np.uint64(29)
+    return (_BAND_NUMBERS | (h & _KEY_MASK)).astype(np.int64).tolist()
+
+
+def content_keys(content: Optional[str]) -> List[int]:
+    sig = signature(shingles(content))
+    return band_keys(sig) if sig is not None else []
+
+
+def index_questions(db: Session, questions: Iterable):
+    """(Re)index questions (objects with id and content) in the current transaction. Caller commits."""
+    rows = []
+    ids = []
+    for q in questions:
+        ids.append(q.id)
+        rows.extend({"bucket": key, "question_id": q.id} for key in content_keys(q.content))
+    if not ids:
+        return
+    remove_questions(db, ids)
+    if rows:
+        db.execute(insert(models.QuestionLshBucket), rows)
+
+
+def remove_questions(db: Session, ids: List[int]):
+    if not ids:
+        return
+    db.query(models.QuestionLshBucket).filter(
+        models.QuestionLshBucket.question_id.in_(ids)
+    ).delete(synchronize_session=False)
+
+
+def rebuild(db: Session, batch_size: int = 1000):
+    db.query(models.QuestionLshBucket).delete(synchronize_session=False)
+    rows = db.query(models.Question.id, models.Question.content).yield_per(batch_size)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            index_questions(db, batch)
+            batch = []
+    if batch:
+        index_questions(db, batch)
+    db.commit()
+
+
+def ensure_index(db: Session):
+    """Backfill the bucket table for databases that predate it."""
+    if db.query(models.QuestionLshBucket.question_id).first() is None and \
+            db.query(models.Question.id).first() is not None:
+        rebuild(db)
+
+
+def find_similar_batch(
+    db: Session,
+    contents: Sequence[str],
+    threshold: float = 0.8,
+    limit: int = 10,
+    exclude_ids: Optional[Sequence[Optional[int]]] = None,
+) -> List[List[dict]]:
+    """
+    Near-duplicates for several texts at once: one bucket lookup and one
+    content fetch for the whole batch. Returns, per text, up to `limit`
+    {"id", "content", "score"} dicts with Jaccard score >= threshold, best
+    first. exclude_ids[i] (e.g. the question being edited) is never matched.
+    """
+    shingle_sets = [shingles(c) for c in contents]
+    keys_per_text = []
+    for s in shingle_sets:
+        sig = signature(s)
+        keys_per_text.append(band_keys(sig) if sig is not None else [])
+    all_keys = {k for keys in keys_per_text for k in keys}
+    if not all_keys:
+        return [[] for _ in contents]
+
+    bucket_members: Dict[int, List[int]] = {}
+    for key, qid in db.query(models.QuestionLshBucket.bucket, models.QuestionLshBucket.question_id).filter(
+        models.QuestionLshBucket.bucket.in_(all_keys)
+    ):
+        bucket_members.setdefault(key, []).append(qid)
+    candidate_ids = {qid for members in bucket_members.values() for qid in members}
+    if not candidate_ids:
+        return [[] for _ in contents]
+    stored = {
+        qid: (content, shingles(content))
+        for qid, content in db.query(models.Question.id, models.Question.content).filter(
+            models.Question.id.in_(candidate_ids)
+        )
+    }
+
+    results = []
+    for i, (s, keys) in enumerate(zip(shingle_sets, keys_per_text)):
+        skip = exclude_ids[i] if exclude_ids else None
+        candidates = {qid for k in keys for qid in bucket_members.get(k, ())}
+        matches = []
+        for qid in candidates:
+            if qid == skip or qid not in stored:
+                continue
+            content, other = stored[qid]
+            score = jaccard(s, other)
+            if score >= threshold:
+                matches.append({"id": qid, "content": content, "score": round(score, 4)})
+        matches.sort(key=lambda m: (-m["score"], m["id"]))
+        results.append(matches[:limit])
+    return results
+
+
+def find_similar(db: Session, content: str, threshold: float = 0.8, limit: int = 10,
+                 exclude_id: Optional[int] = None) -> List[dict]:
+    return find_similar_batch(db, [content], threshold, limit, [exclude_id])[0]
+
+
+def candidate_pairs(db: Session, truncated: Optional[list] = None) -> Set[Tuple[int, int]]:
+    """
+    All (low id, high id) pairs sharing at least one LSH bucket, except
+    within buckets over MAX_BUCKET_SIZE, whose members are only paired with
+    the first one. Those buckets are appended to truncated as
+    {"bucket", "size", "first_id"}: pairs inside them are only found if they
+    also share another band.
+    """
+    pairs: Set[Tuple[int, int]] = set()
+    buckets = db.query(
+        models.QuestionLshBucket.bucket, func.group_concat(models.QuestionLshBucket.question_id)
+    ).group_by(models.QuestionLshBucket.bucket).having(func.count() > 1)
+    for bucket, members in buckets:
+        ids = sorted(int(qid) for qid in members.split(","))
+        if len(ids) > MAX_BUCKET_SIZE:
+            pairs.update((ids[0], qid) for qid in ids[1:])
+            if truncated is not None:
+                truncated.append({"bucket": bucket, "size": len(ids), "first_id": ids[0]})
+        else:
+            pairs.update(combinations(ids, 2))
+    return pairs
+
+
+def _verify_pairs(pairs: List[Tuple[int, int]], contents: Dict[int, str], threshold: float):
+    """Pairs whose exact Jaccard similarity reaches threshold, as (a, b, score)."""
+    cache: Dict[int, Set[str]] = {}
+
+    def shingled(qid):
+        if qid not in cache:
+            cache[qid] = shingles(contents.get(qid))
+        return cache[qid]
+
+    matched = []
+    for a, b in pairs:
+        score = jaccard(shingled(a), shingled(b))
+        if score >= threshold:
+            matched.append((a, b, score))
+    return matched
+
+
+def _load_questions(db: Session, ids: Iterable[int], columns, batch_size: int = 5000) -> Dict[int, tuple]:
+    ids = list(ids)
+    rows = {}
+    for start in range(0, len(ids), batch_size):
+        for row in db.query(models.Question.id, *columns).filter(
+            models.Question.id.in_(ids[start:start + batch_size])
+        ):
+            rows[row[0]] = row
+    return rows
+
+
+def _keeper_rank(row):
+    # Published before anything else, then explained, then the oldest
+    _, status, analysis, _, _ = row
+    return (status != "published", not analysis, row[0])
+
+
+def find_duplicate_groups(
+    db: Session,
+    threshold: float = 0.8,
+    workers: Optional[int] = None,
+    on_progress: Optional[Callable] = None,
+    truncated: Optional[list] = None,
+) -> List[dict]:
+    """
+    Cluster the whole bank into groups of near-duplicates.
+
+    Candidate pairs come from the persisted LSH buckets, so the work grows
+    with the number of colliding pairs rather than n^2. Candidates are
+    verified by exact Jaccard (in a process pool for large runs) and joined
+    transitively with union-find. Each group names a suggested keeper and
+    lists every member with its similarity to the keeper, largest groups
+    first. on_progress(processed, total=...) counts verified pairs. Oversized
+    buckets that were not fully compared go to truncated (see candidate_pairs).
+    """
+    pairs = sorted(candidate_pairs(db, truncated))
+    if on_progress:
+        on_progress(0, total=len(pairs))
+    if not pairs:
+        return []
+    contents = {
+        qid: row[1]
+        for qid, row in _load_questions(db, {qid for pair in pairs for qid in pair}, [models.Question.content]).items()
+    }
+    chunks = [pairs[i:i + PAIR_CHUNK_SIZE] for i in range(0, len(pairs), PAIR_CHUNK_SIZE)]
+
+    def payload(chunk):
+        return chunk, {qid: contents.get(qid) for pair in chunk for qid in pair}, threshold
+
+    matched: List[Tuple[int, int, float]] = []
+    processed = 0
+    workers = min(workers or CLUSTER_WORKERS, len(chunks))
+    if len(pairs) >= PARALLEL_PAIRS_MIN and workers > 1:
+        # spawn: forking while web threads run can copy held locks; the
+        # worker function and its payloads are plain picklable data
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as ex:
+            # Keep a bounded window in flight so chunk payloads don't all pile up
+            pending = {}
+            queue = iter(chunks)
+            for chunk in queue:
+                pending[ex.submit(_verify_pairs, *payload(chunk))] = len(chunk)
+                if len(pending) >= workers * 2:
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    matched.extend(fut.result())
+                    processed += pending.pop(fut)
+                    nxt = next(queue, None)
+                    if nxt is not None:
+                        pending[ex.submit(_verify_pairs, *payload(nxt))] = len(nxt)
+                if on_progress:
+                    on_progress(processed)
+    else:
+        for chunk in chunks:
+            matched.extend(_verify_pairs(*payload(chunk)))
+            processed += len(chunk)
+            if on_progress:
+                on_progress(processed)
+
+    parent: Dict[int, int] = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b, _ in matched:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    members: Dict[int, List[int]] = {}
+    for qid in parent:
+        members.setdefault(find(qid), []).append(qid)
+
+    info = _load_questions(db, parent, [
+        models.Question.status, models.Question.analysis, models.Question.custom_id, models.Question.content
+    ])
+    groups = []
+    for ids in members.values():
+        rows = [info[qid] for qid in ids if qid in info]
+        if len(rows) < 2:
+            continue
+        keeper = min(rows, key=_keeper_rank)
+        keeper_shingles = shingles(keeper[4])
+        group = []
+        for row in sorted(rows, key=_keeper_rank):
+            qid, status, _, custom_id, content = row
+            group.append({
+                "id": qid,
+                "custom_id": custom_id,
+                "status": status,
+                "content": content,
+                "score": round(jaccard(keeper_shingles, shingles(content)), 4),
+            })
+        groups.append({"keeper_id": keeper[0], "size": len(group), "members": group})
+    groups.sort(key=lambda g: (-g["size"], g["keeper_id"]))
+    return groups
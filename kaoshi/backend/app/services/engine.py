@@ -1,8 +1,29 @@
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+from bisect import bisect_left, insort
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import multiprocessing
+import os
 from sqlalchemy.orm import Session
-from app import models, crud
+from app import models
+from app.services import pool as question_pool
 import random
 
+_EPS = 1e-6
+
+# Variant batches at least this large are solved in a process pool
+PARALLEL_VARIANTS_MIN = int(os.getenv("PARALLEL_VARIANTS_MIN", "6"))
+VARIANT_WORKERS = int(os.getenv("VARIANT_WORKERS", "0")) or (os.cpu_count() or 1)
+
+@dataclass
+class AssemblyResult:
+    questions: List[models.Question]
+    # Score of each question on this paper (type_scores may override the bank score)
+    scores: Dict[int, float] = field(default_factory=dict)
+    # Constraints that could not be satisfied, see ConstraintSolver.unmet
+    unmet: List[dict] = field(default_factory=list)
+
 class AssemblyEngine:
     def __init__(self, db: Session):
         self.db = db
@@ -17,60 +38,438 @@ class AssemblyEngine:
             "difficulty_distribution": {"1": 0.2, "2": 0.5, "3": 0.3},
             "tags": ["Math"]
         }
+        Sampling runs on the in-memory published pool; only the chosen
+        questions are loaded from the database.
+        """
+        pool = question_pool.get_pool(self.db)
+        for attempt in range(2):
+            with pool.lock:
+                selected_ids = self._select_ids(pool, rule_config)
+            questions = self._load_questions(selected_ids)
+            if len(questions) == len(selected_ids):
+                break
+            # Some picks were changed by another process; reload and retry once
+            pool = question_pool.get_pool(self.db, reload=True)
+        return questions
+
+    def assemble(self, rule_config: dict, total_score: Optional[float] = None) -> AssemblyResult:
         """
-        selected_questions = []
-        
-        # 1. Filter base pool by tags if specified
-        # ONLY select questions that are PUBLISHED
-        query = self.db.query(models.Question).filter(models.Question.status == 'published')
-
-        # Note: Tag filtering is simplified here. In production, use proper JSON operators or secondary tables.
-        # For SQLite JSON, exact match or simple contains is tricky without extensions, 
-        # so we fetch and filter in memory for this MVP or assume no tag filter for now.
-        
-        all_candidates = query.all()
-        
+        Constraint-driven assembly ("mode": "constrained"). On top of
+        type_distribution / difficulty_distribution the config may set:
+        {
+            "tags_included": ["Math"],          # any-of
+            "tags_excluded": ["Obsolete"],      # none-of
+            "knowledge_points": {"Fractions": 2},  # minimum coverage (a list means 1 each)
+            "total_score": 100,                 # defaults to the ExamRule total_score
+            "type_scores": {"single": 2, "essay": 10}  # points per question of a type
+        }
+        Unsatisfiable constraints are reported in AssemblyResult.unmet
+        instead of failing the whole paper.
+        """
+        if total_score is None:
+            total_score = rule_config.get("total_score")
+        pool = question_pool.get_pool(self.db)
+        for attempt in range(2):
+            with pool.lock:
+                solver = ConstraintSolver(pool, rule_config, total_score)
+                chosen = solver.solve()
+                selected_ids = [pool.ids[p] for p in chosen]
+                scores = {pool.ids[p]: solver.score(p) for p in chosen}
+            questions = self._load_questions(selected_ids)
+            if len(questions) == len(selected_ids):
+                break
+            pool = question_pool.get_pool(self.db, reload=True)
+        return AssemblyResult(questions=questions, scores=scores, unmet=solver.unmet)
+
+    def assemble_variants(self, rule_config: dict, count: int, max_overlap: float,
+                          total_score: Optional[float] = None) -> List[AssemblyResult]:
+        """
+        Assemble `count` versions (A, B, C, ...) of one rule in one pass. The
+        share of questions any two versions have in common, relative to the
+        smaller paper, is kept at or below max_overlap where the pool allows;
+        remaining violations are reported as "overlap" unmet constraints.
+        """
+        pool = question_pool.get_pool(self.db)
+        for attempt in range(2):
+            # Solved on a private copy: the pool lock isn't held (nor copied
+            # into worker processes) for the whole solve
+            snapshot = pool.snapshot()
+            variants = self._solve_variants(snapshot, rule_config, count, max_overlap, total_score)
+            scorer = ConstraintSolver(snapshot, rule_config, total_score)
+            picked = [
+                ([snapshot.ids[p] for p in chosen], {snapshot.ids[p]: scorer.score(p) for p in chosen}, unmet)
+                for chosen, unmet in variants
+            ]
+            all_ids = list({qid for ids, _, _ in picked for qid in ids})
+            rows = self._load_questions(all_ids)
+            if len(rows) == len(all_ids):
+                break
+            pool = question_pool.get_pool(self.db, reload=True)
+
+        by_id = {q.id: q for q in rows}
+        return [
+            AssemblyResult(questions=[by_id[i] for i in ids if i in by_id], scores=scores, unmet=unmet)
+            for ids, scores, unmet in picked
+        ]
+
+    def _solve_variants(self, pool, rule_config, count, max_overlap, total_score) -> List[Tuple[List[int], List[dict]]]:
+        if count >= PARALLEL_VARIANTS_MIN and len(pool):
+            # Each worker prefers its own shard of the pool (position % count),
+            # which keeps versions disjoint unless a shard runs short
+            seeds = [random.randrange(2 ** 32) for _ in range(count)]
+            workers = min(count, VARIANT_WORKERS)
+            # spawn: forking a threaded server process can copy held locks
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_variant_worker, initargs=(pool,)) as ex:
+                variants = list(ex.map(
+                    _solve_shard, repeat(rule_config), repeat(total_score), range(count), repeat(count), seeds
+                ))
+        else:
+            variants = []
+            used = set()
+            for _ in range(count):
+                solver = ConstraintSolver(pool, rule_config, total_score, prefer=lambda p: p not in used)
+                chosen = solver.solve()
+                variants.append((chosen, solver.unmet))
+                used.update(chosen)
+
+        # Re-solve any version that shares too much with an earlier one
+        for k in range(count):
+            if any(overlap_ratio(variants[k][0], variants[j][0]) > max_overlap + _EPS for j in range(k)):
+                avoid = set()
+                for j in range(count):
+                    if j != k:
+                        avoid.update(variants[j][0])
+                solver = ConstraintSolver(pool, rule_config, total_score, prefer=lambda p: p not in avoid)
+                variants[k] = (solver.solve(), solver.unmet)
+
+        for k in range(count):
+            for j in range(k):
+                ratio = overlap_ratio(variants[k][0], variants[j][0])
+                if ratio > max_overlap + _EPS:
+                    variants[k][1].append({
+                        "constraint": "overlap", "key": variant_label(j),
+                        "required": max_overlap, "achieved": round(ratio, 4),
+                    })
+        return variants
+
+    def _select_ids(self, pool: question_pool.QuestionPool, rule_config: dict) -> List[int]:
+        # 1. Restrict the published pool by tags if specified (any-of match)
+        tags = rule_config.get("tags") or rule_config.get("tags_included")
+        mask = pool.tag_mask(tags) if tags else None
+        if mask == 0:
+            return []
+        tag_bits = pool.tag_bits
+
+        buckets = pool.buckets()
+        selected = []
+
         # 2. Process by Question Type
         type_dist = rule_config.get("type_distribution", {})
-        
+        diff_dist = rule_config.get("difficulty_distribution", {})
+
         for q_type, count in type_dist.items():
-            # Filter candidates by type
-            type_candidates = [q for q in all_candidates if q.q_type == q_type]
-            
-            if not type_candidates:
+            # Candidates of this type, grouped by difficulty
+            by_difficulty = {}
+            for (b_type, b_diff), positions in buckets.items():
+                if b_type != q_type:
+                    continue
+                if mask is not None:
+                    positions = [p for p in positions if tag_bits[p] & mask]
+                if positions:
+                    by_difficulty[b_diff] = positions
+
+            if not by_difficulty:
                 continue
-                
+
             # 3. Apply Difficulty Distribution within this type
-            # Calculate target counts for each difficulty
-            diff_dist = rule_config.get("difficulty_distribution", {})
-            
-            questions_for_type = []
+            chosen = []
             remaining_count = count
-            
-            # Try to satisfy difficulty requirements
+
             for diff_level, ratio in diff_dist.items():
                 target_count = int(count * ratio)
                 if target_count == 0:
                     continue
-                    
-                diff_candidates = [q for q in type_candidates if str(q.difficulty) == str(diff_level)]
-                
-                # Select random questions
-                selected = random.sample(diff_candidates, min(len(diff_candidates), target_count))
-                questions_for_type.extend(selected)
-                
-                # Remove selected from candidates to avoid duplicates (though diff filter handles this)
-                remaining_count -= len(selected)
-            
+                diff_candidates = by_difficulty.get(str(diff_level), [])
+                picked = random.sample(diff_candidates, min(len(diff_candidates), target_count))
+                chosen.extend(picked)
+                remaining_count -= len(picked)
+
             # 4. Fill remaining with random questions from same type if difficulty constraints couldn't be met
             if remaining_count > 0:
-                # Get currently unselected candidates of this type
-                current_selected_ids = {q.id for q in questions_for_type}
-                remaining_candidates = [q for q in type_candidates if q.id not in current_selected_ids]
-                
-                fillers = random.sample(remaining_candidates, min(len(remaining_candidates), remaining_count))
-                questions_for_type.extend(fillers)
-            
-            selected_questions.extend(questions_for_type)
-            
-        return selected_questions
+                taken = set(chosen)
+                remaining_candidates = [
+                    p for positions in by_difficulty.values() for p in positions if p not in taken
+                ]
+                chosen.extend(random.sample(remaining_candidates, min(len(remaining_candidates), remaining_count)))
+
+            selected.extend(pool.ids[p] for p in chosen)
+
+        return selected
+
+    def _load_questions(self, ids: List[int]) -> List[models.Question]:
+        """Fetch full rows for the chosen ids, keeping selection order."""
+        if not ids:
+            return []
+        rows = self.db.query(models.Question).filter(
+            models.Question.id.in_(ids),
+            models.Question.status == 'published',
+        ).all()
+        by_id = {q.id: q for q in rows}
+        return [by_id[i] for i in ids if i in by_id]
+
+
+def variant_label(index: int) -> str:
+    return chr(ord("A") + index)
+
+def overlap_ratio(a: List[int], b: List[int]) -> float:
+    """Shared questions relative to the smaller of two papers."""
+    if not a or not b:
+        return 0.0
+    return len(set(a) & set(b)) / min(len(a), len(b))
+
+# Process-pool workers for assemble_variants; the pool arrives once per worker
+_worker_pool = None
+
+def _init_variant_worker(pool):
+    global _worker_pool
+    _worker_pool = pool
+
+def _solve_shard(rule_config, total_score, shard, shards, seed):
+    random.seed(seed)
+    solver = ConstraintSolver(_worker_pool, rule_config, total_score, prefer=lambda p: p % shards == shard)
+    return solver.solve(), solver.unmet
+
+
+class ConstraintSolver:
+    """
+    Greedy selection plus swap repair over the published pool.
+
+    1. Knowledge points, scarcest first, preferring questions that cover
+       several unmet points at once.
+    2. Difficulty targets per type, then random fill up to the type count.
+    3. If a total score is set, swap questions for unchosen ones of the
+       same type and difficulty whose score closes the gap, never dropping
+       a question that a knowledge-point minimum depends on.
+    """
+
+    MAX_SWAPS = 500
+    # Bounded look-ahead when ranking candidates by knowledge-point coverage
+    KP_SAMPLE = 64
+
+    def __init__(self, pool: question_pool.QuestionPool, rule_config: dict,
+                 total_score: Optional[float] = None, prefer: Optional[Callable[[int], bool]] = None):
+        self.pool = pool
+        # Soft preference: positions failing prefer() are only used as a last resort
+        self.prefer = prefer
+        self.type_dist = {t: int(n) for t, n in (rule_config.get("type_distribution") or {}).items()}
+        self.diff_dist = rule_config.get("difficulty_distribution") or {}
+        self.type_scores = {t: float(v) for t, v in (rule_config.get("type_scores") or {}).items()}
+        self.total_score = total_score
+
+        kps = rule_config.get("knowledge_points") or {}
+        if isinstance(kps, list):
+            kps = {kp: 1 for kp in kps}
+        self.kp_need = {kp: int(n) for kp, n in kps.items() if int(n) > 0}
+
+        self.include = rule_config.get("tags_included") or rule_config.get("tags") or []
+        self.exclude = rule_config.get("tags_excluded") or []
+
+        self.chosen: List[int] = []
+        self.chosen_set = set()
+        self.unmet: List[dict] = []
+
+    def score(self, p: int) -> float:
+        q_type = self.pool.type_names[self.pool.types[p]]
+        return self.type_scores.get(q_type, self.pool.scores[p])
+
+    def _report(self, constraint: str, key, required, achieved):
+        self.unmet.append({"constraint": constraint, "key": key, "required": required, "achieved": achieved})
+
+    def _candidates(self):
+        """Eligible positions per (type, difficulty) for the requested types."""
+        pool = self.pool
+        inc_mask = pool.tag_mask(self.include) if self.include else None
+        exc_mask = pool.tag_mask(self.exclude)
+        tag_bits = pool.tag_bits
+        by_cell = {}
+        if inc_mask == 0:
+            return by_cell
+        for (q_type, diff), positions in pool.buckets().items():
+            if q_type not in self.type_dist:
+                continue
+            if inc_mask is not None or exc_mask:
+                positions = [
+                    p for p in positions
+                    if (inc_mask is None or tag_bits[p] & inc_mask) and not tag_bits[p] & exc_mask
+                ]
+            if positions:
+                by_cell[(q_type, diff)] = positions
+        return by_cell
+
+    def _sample(self, options: List[int], count: int) -> List[int]:
+        """Random sample of up to count options, preferred positions first."""
+        if count <= 0 or not options:
+            return []
+        if self.prefer is None:
+            return random.sample(options, min(len(options), count))
+        fresh = [p for p in options if self.prefer(p)]
+        picked = random.sample(fresh, min(len(fresh), count))
+        if len(picked) < count:
+            rest = [p for p in options if not self.prefer(p)]
+            picked += random.sample(rest, min(len(rest), count - len(picked)))
+        return picked
+
+    def _take(self, p: int, taken: Dict[str, int]):
+        self.chosen.append(p)
+        self.chosen_set.add(p)
+        taken[self.pool.type_names[self.pool.types[p]]] += 1
+
+    def solve(self) -> List[int]:
+        pool = self.pool
+        by_cell = self._candidates()
+        taken = {t: 0 for t in self.type_dist}
+
+        def has_room(p):
+            q_type = pool.type_names[pool.types[p]]
+            return taken[q_type] < self.type_dist[q_type]
+
+        # 1. Knowledge-point coverage
+        kp_bit = {kp: pool.kp_bit(kp) for kp in self.kp_need}
+        covered = {kp: 0 for kp in self.kp_need}
+        required_mask = 0
+        for bit in kp_bit.values():
+            required_mask |= bit
+        if required_mask:
+            kp_bits = pool.kp_bits
+            kp_cands = [p for positions in by_cell.values() for p in positions if kp_bits[p] & required_mask]
+            per_kp = {kp: [p for p in kp_cands if kp_bits[p] & bit] for kp, bit in kp_bit.items() if bit}
+            for kp in sorted(per_kp, key=lambda k: len(per_kp[k])):
+                missing = self.kp_need[kp] - covered[kp]
+                if missing <= 0:
+                    continue
+                deficit_mask = 0
+                for other, bit in kp_bit.items():
+                    if covered[other] < self.kp_need[other]:
+                        deficit_mask |= bit
+                options = [p for p in per_kp[kp] if p not in self.chosen_set]
+                random.shuffle(options)
+                prefer = self.prefer or (lambda p: True)
+                if self.prefer is not None:
+                    options.sort(key=prefer, reverse=True)
+                options = options[:self.KP_SAMPLE * missing]
+                options.sort(key=lambda p: (prefer(p), bin(kp_bits[p] & deficit_mask).count("1")), reverse=True)
+                for p in options:
+                    if missing <= 0:
+                        break
+                    if not has_room(p):
+                        continue
+                    self._take(p, taken)
+                    for other, bit in kp_bit.items():
+                        if kp_bits[p] & bit:
+                            covered[other] += 1
+                    missing -= 1
+
+        # 2. Difficulty targets, then fill each type up to its count
+        for q_type, count in self.type_dist.items():
+            for diff_level, ratio in self.diff_dist.items():
+                target = int(count * ratio)
+                have = sum(1 for p in self.chosen if pool.type_names[pool.types[p]] == q_type and str(pool.difficulties[p]) == str(diff_level))
+                need = min(target - have, count - taken[q_type])
+                if need <= 0:
+                    continue
+                options = [p for p in by_cell.get((q_type, str(diff_level)), []) if p not in self.chosen_set]
+                for p in self._sample(options, need):
+                    self._take(p, taken)
+                if len(options) < need:
+                    self._report("difficulty", f"{q_type}:{diff_level}", target, have + len(options))
+
+            need = count - taken[q_type]
+            if need > 0:
+                options = [
+                    p for (t, _), positions in by_cell.items() if t == q_type
+                    for p in positions if p not in self.chosen_set
+                ]
+                for p in self._sample(options, need):
+                    self._take(p, taken)
+            if taken[q_type] < count:
+                self._report("type_count", q_type, count, taken[q_type])
+
+        # 3. Total score repair
+        if self.total_score is not None:
+            self._repair_total(by_cell, kp_bit, covered)
+
+        for kp, need in self.kp_need.items():
+            if covered[kp] < need:
+                self._report("knowledge_point", kp, need, covered[kp])
+        return self.chosen
+
+    def _repair_total(self, by_cell, kp_bit, covered):
+        pool = self.pool
+        current = sum(self.score(p) for p in self.chosen)
+
+        # Unchosen candidates of swappable (bank-scored) types, by cell and score
+        index = {}
+        for cell, positions in by_cell.items():
+            if cell[0] in self.type_scores:
+                continue
+            buckets = index.setdefault(cell, {})
+            for p in positions:
+                # Swapping in non-preferred questions would undo the preference
+                if p not in self.chosen_set and (self.prefer is None or self.prefer(p)):
+                    buckets.setdefault(pool.scores[p], []).append(p)
+        keys = {cell: sorted(b) for cell, b in index.items()}
+
+        def nearest(cell, desired):
+            buckets, ks = index.get(cell), keys.get(cell)
+            if not ks:
+                return None
+            i = bisect_left(ks, desired)
+            best = None
+            for j in (i - 1, i):
+                if 0 <= j < len(ks) and buckets[ks[j]]:
+                    if best is None or abs(ks[j] - desired) < abs(best - desired):
+                        best = ks[j]
+            return best
+
+        for _ in range(self.MAX_SWAPS):
+            gap = self.total_score - current
+            if abs(gap) <= _EPS:
+                break
+            # Knowledge points sitting exactly at their minimum must stay covered
+            critical = 0
+            for kp, bit in kp_bit.items():
+                if covered[kp] <= self.kp_need[kp]:
+                    critical |= bit
+
+            best = None
+            for idx, p in enumerate(self.chosen):
+                if pool.kp_bits[p] & critical:
+                    continue
+                cell = (pool.type_names[pool.types[p]], str(pool.difficulties[p]))
+                replacement_score = nearest(cell, pool.scores[p] + gap)
+                if replacement_score is None:
+                    continue
+                gain = abs(gap) - abs(gap - (replacement_score - pool.scores[p]))
+                if gain > _EPS and (best is None or gain > best[0]):
+                    best = (gain, idx, cell, replacement_score)
+            if best is None:
+                break
+
+            _, idx, cell, replacement_score = best
+            out_p = self.chosen[idx]
+            in_p = index[cell][replacement_score].pop()
+            self.chosen[idx] = in_p
+            self.chosen_set.discard(out_p)
+            self.chosen_set.add(in_p)
+            if self.prefer is None or self.prefer(out_p):
+                if pool.scores[out_p] not in index[cell]:
+                    index[cell][pool.scores[out_p]] = []
+                    insort(keys[cell], pool.scores[out_p])
+                index[cell][pool.scores[out_p]].append(out_p)
+            for kp, bit in kp_bit.items():
+                covered[kp] += bool(pool.kp_bits[in_p] & bit) - bool(pool.kp_bits[out_p] & bit)
+            current += pool.scores[in_p] - pool.scores[out_p]
+
+        if abs(self.total_score - current) > _EPS:
+            self._report("total_score", None, self.total_score, round(current, 4))
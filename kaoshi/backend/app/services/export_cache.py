@@ -0,0 +1,109 @@
+"""
+Disk cache for rendered paper exports.
+
+A paper's questions_snapshot is frozen at creation, so a rendered file only
+depends on the paper, its snapshot, the format and include_answers. The
+cache key hashes exactly those (plus the DOCX engine for docx, and
+RENDER_VERSION, bumped whenever the exporter's output changes), and doubles
+as the download's ETag. Entries
+are evicted least-recently-used once the directory exceeds
+EXPORT_CACHE_MAX_MB; a hit refreshes the file's mtime. Concurrent misses for
+the same key in one process wait for a single render.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+from app.services import exporter
+
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", "./export_cache")
+EXPORT_CACHE_MAX_MB = int(os.getenv("EXPORT_CACHE_MAX_MB", "512"))
+# Files used this recently are never evicted (they may be being streamed)
+EVICT_GRACE_SECONDS = 60
+RENDER_VERSION = 1
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def snapshot_hash(paper_data: dict) -> str:
+    """Hash of everything in the paper that ends up in the rendered file."""
+    payload = json.dumps(
+        [paper_data.get("title"), paper_data.get("questions_snapshot")],
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_key(paper_id: int, paper_data: dict, fmt: str, include_answers: bool) -> str:
+    # Files from either DOCX engine are never served for the other
+    renderer = f"{fmt}/{exporter.DOCX_ENGINE}" if fmt == "docx" else fmt
+    digest = hashlib.sha256(
+        f"{RENDER_VERSION}:{paper_id}:{snapshot_hash(paper_data)}:{renderer}:{int(include_answers)}".encode("utf-8")
+    ).hexdigest()[:32]
+    return f"{paper_id}-{digest}"
+
+
+def _path(key: str, fmt: str) -> str:
+    return os.path.join(EXPORT_CACHE_DIR, f"{key}.{fmt}")
+
+
+def _touch(path: str) -> bool:
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def get_or_render(key: str, fmt: str, render: Callable[[], bytes]) -> str:
+    """Path of the cached file for key, rendering it first on a miss."""
+    path = _path(key, fmt)
+    if _touch(path):
+        return path
+    with _locks_guard:
+        lock = _locks.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            # Another request may have rendered it while we waited
+            if not _touch(path):
+                os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+                data = render()
+                tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+                evict()
+    finally:
+        with _locks_guard:
+            _locks.pop(key, None)
+    return path
+
+
+def evict(max_bytes: Optional[int] = None):
+    """Drop least recently used files until the cache fits max_bytes."""
+    if max_bytes is None:
+        max_bytes = EXPORT_CACHE_MAX_MB * 1024 * 1024
+    entries = []
+    total = 0
+    with os.scandir(EXPORT_CACHE_DIR) as it:
+        for entry in it:
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+    if total <= max_bytes:
+        return
+    cutoff = time.time() - EVICT_GRACE_SECONDS
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes or mtime > cutoff:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
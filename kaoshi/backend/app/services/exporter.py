@@ -2,15 +2,31 @@ from docx import Document
 from docx.shared import Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 import io
+import os
+import re
+import zipfile
+from functools import lru_cache
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
 
-def export_to_docx(paper_data: dict, include_answers: bool = True) -> io.BytesIO:
+# "python-docx" builds word/document.xml element by element; "template"
+# (opt-in, faster) writes it as one string into a prebuilt package. Both
+# give the same document.
+DOCX_ENGINE = os.getenv("DOCX_ENGINE", "python-docx")
+DOCX_ENGINES = ("template", "python-docx")
+
+def export_to_docx(paper_data: dict, include_answers: bool = True, engine: str = None) -> io.BytesIO:
     """
     Generates a Word document from the paper data.
     paper_data should contain: title, questions (list of dicts)
+    engine: one of DOCX_ENGINES, DOCX_ENGINE by default
     """
+    engine = engine or DOCX_ENGINE
+    if engine == "template":
+        return _docx_from_template(paper_data, include_answers)
+    if engine != "python-docx":
+        raise ValueError(f"Unknown docx engine: {engine}")
     doc = Document()
     
     # Title
@@ -65,6 +81,84 @@ def export_to_docx(paper_data: dict, include_answers: bool = True) -> io.BytesIO
     file_stream.seek(0)
     return file_stream
 
+@lru_cache(maxsize=1)
+def _docx_template():
+    """
+    python-docx's default package without word/document.xml, plus the text
+    of document.xml before and after the body content. Built once per process.
+    """
+    saved = io.BytesIO()
+    Document().save(saved)
+    package = io.BytesIO()
+    with zipfile.ZipFile(saved) as src, zipfile.ZipFile(package, "w", zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            if info.filename == "word/document.xml":
+                document = src.read(info).decode("utf-8")
+            else:
+                dst.writestr(info, src.read(info))
+    body = document.index("<w:body>") + len("<w:body>")
+    return package.getvalue(), document[:body], document[document.index("<w:sectPr", body):]
+
+# Characters XML 1.0 can't hold (lxml refuses them in the python-docx engine)
+_XML_INVALID_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+_RUN_SPLIT_RE = re.compile(r"([\t\r\n])")
+
+def _xml_run(text: str, rpr: str = "") -> str:
+    """<w:r> for text the way python-docx's run.text setter builds it."""
+    parts = []
+    for piece in _RUN_SPLIT_RE.split(_XML_INVALID_RE.sub("", text)):
+        if piece == "\t":
+            parts.append("<w:tab/>")
+        elif piece in ("\r", "\n"):
+            parts.append("<w:br/>")
+        elif piece:
+            escaped = piece.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+            space = ' xml:space="preserve"' if len(piece.strip()) < len(piece) else ""
+            parts.append(f"<w:t{space}>{escaped}</w:t>")
+    return f"<w:r>{rpr}{''.join(parts)}</w:r>"
+
+def _xml_paragraph(runs: str = "", style: str = None, center: bool = False) -> str:
+    ppr = (f'<w:pStyle w:val="{style}"/>' if style else "") + ('<w:jc w:val="center"/>' if center else "")
+    if ppr:
+        ppr = f"<w:pPr>{ppr}</w:pPr>"
+    return f"<w:p>{ppr}{runs}</w:p>" if ppr or runs else "<w:p/>"
+
+def _docx_from_template(paper_data: dict, include_answers: bool) -> io.BytesIO:
+    """export_to_docx's layout written straight into the template package."""
+    package, head, tail = _docx_template()
+    questions = paper_data.get("questions_snapshot", [])
+    title = paper_data.get("title", "Exam Paper")
+    body = [
+        _xml_paragraph(_xml_run(title) if title else "", style="Title", center=True),
+        _xml_paragraph(_xml_run("Name: _______________  Score: _______"), center=True),
+        _xml_paragraph(_xml_run("-" * 80)),
+    ]
+    stem_rpr = '<w:rPr><w:b/><w:sz w:val="22"/></w:rPr>'
+    for idx, q in enumerate(questions, 1):
+        body.append(_xml_paragraph(_xml_run(f"{idx}. [{q.get('q_type', 'Unknown')}] {q.get('content')}", stem_rpr)))
+        if q.get('q_type') in ['single', 'multi'] and q.get('options'):
+            for opt in q.get('options'):
+                body.append(_xml_paragraph(_xml_run(f"    {opt}"), style="ListBullet"))
+        if q.get('q_type') == 'essay':
+            body.append(_xml_paragraph(_xml_run("\n" * 5)))
+        body.append("<w:p/>")
+
+    if include_answers:
+        body.append('<w:p><w:r><w:br w:type="page"/></w:r></w:p>')
+        body.append(_xml_paragraph(_xml_run("Answer Key"), style="Heading1"))
+        for idx, q in enumerate(questions, 1):
+            runs = _xml_run(f"{idx}. {q.get('answer', 'N/A')}")
+            if q.get("analysis"):
+                runs += _xml_run(f"\n   Analysis: {q.get('analysis')}", "<w:rPr><w:i/></w:rPr>")
+            body.append(_xml_paragraph(runs))
+
+    # Appending copies the template's members as already compressed bytes
+    file_stream = io.BytesIO(package)
+    with zipfile.ZipFile(file_stream, "a", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("word/document.xml", (head + "".join(body) + tail).encode("utf-8"))
+    file_stream.seek(0)
+    return file_stream
+
 def export_to_txt(paper_data: dict, include_answers: bool = True) -> io.BytesIO:
     title = paper_data.get("title", "Exam Paper")
     questions = paper_data.get("questions_snapshot", [])
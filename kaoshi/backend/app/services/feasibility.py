@@ -0,0 +1,107 @@
+"""
+Rule feasibility pre-check.
+
+Compares a rule's demands with the availability counters maintained by the
+published pool (services.pool), so the check costs a few dictionary lookups
+per cell instead of a pool scan. Counts under several included/excluded tags
+are bounds rather than exact numbers and are flagged with exact=False.
+"""
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.services import pool as question_pool
+
+
+def _difficulty(level) -> Optional[int]:
+    try:
+        return int(level)
+    except (TypeError, ValueError):
+        return None
+
+
+def check_rule(db: Session, rule_config: dict, total_score: Optional[float] = None) -> dict:
+    pool = question_pool.get_pool(db)
+    type_dist = {t: int(n) for t, n in (rule_config.get("type_distribution") or {}).items()}
+    diff_dist = rule_config.get("difficulty_distribution") or {}
+    type_scores = {t: float(v) for t, v in (rule_config.get("type_scores") or {}).items()}
+    include = rule_config.get("tags_included") or rule_config.get("tags") or []
+    exclude = rule_config.get("tags_excluded") or []
+    kps = rule_config.get("knowledge_points") or {}
+    if isinstance(kps, list):
+        kps = {kp: 1 for kp in kps}
+    if total_score is None:
+        total_score = rule_config.get("total_score")
+
+    cells = []
+
+    def add(dimension, key, required, available, exact=True):
+        cells.append({
+            "dimension": dimension, "key": key,
+            "required": required, "available": available, "exact": exact,
+            "shortfall": max(0, required - available),
+        })
+
+    with pool.lock:
+        inc_codes = [pool.tag_codes[t] for t in include if t in pool.tag_codes]
+        exc_codes = [pool.tag_codes[t] for t in exclude if t in pool.tag_codes]
+        difficulties_by_type = {}
+        for (type_code, diff) in pool.cell_counts:
+            difficulties_by_type.setdefault(type_code, set()).add(diff)
+
+        def available(type_code, difficulties):
+            """(count, exact) of eligible questions of a type over some difficulties."""
+            total = sum(pool.cell_counts[(type_code, d)] for d in difficulties)
+            exact = True
+            if include:
+                tagged = sum(pool.cell_tag_counts[(type_code, d, c)] for d in difficulties for c in inc_codes)
+                # A question carrying several included tags is counted once per tag
+                total = min(total, tagged)
+                exact = len(inc_codes) <= 1
+            if exc_codes:
+                excluded = sum(pool.cell_tag_counts[(type_code, d, c)] for d in difficulties for c in exc_codes)
+                total = max(0, total - excluded)
+                exact = exact and not include and len(exc_codes) == 1
+            return total, exact
+
+        for q_type, count in type_dist.items():
+            type_code = pool.type_codes.get(q_type)
+            if type_code is None:
+                add("type", q_type, count, 0)
+                continue
+            n, exact = available(type_code, difficulties_by_type.get(type_code, ()))
+            add("type", q_type, count, n, exact)
+
+            for level, ratio in diff_dist.items():
+                target = int(count * ratio)
+                diff = _difficulty(level)
+                if target == 0:
+                    continue
+                if diff is None:
+                    add("difficulty", f"{q_type}:{level}", target, 0)
+                    continue
+                n, exact = available(type_code, (diff,))
+                add("difficulty", f"{q_type}:{level}", target, n, exact)
+
+        for kp, need in kps.items():
+            kp_code = pool.kp_codes.get(kp)
+            n = 0
+            if kp_code is not None:
+                n = sum(
+                    pool.type_kp_counts[(pool.type_codes[t], kp_code)]
+                    for t in type_dist if t in pool.type_codes
+                )
+            # Tag filters are not tracked per knowledge point, so n is an upper bound
+            add("knowledge_point", kp, int(need), n, exact=not (include or exclude))
+
+    if total_score is not None and type_dist and all(t in type_scores for t in type_dist):
+        fixed_total = sum(count * type_scores[t] for t, count in type_dist.items())
+        if abs(fixed_total - float(total_score)) > 1e-6:
+            cells.append({
+                "dimension": "total_score", "key": None,
+                "required": float(total_score), "available": fixed_total, "exact": True,
+                "shortfall": abs(float(total_score) - fixed_total),
+            })
+
+    shortfalls = [c for c in cells if c["shortfall"] > 0]
+    return {"feasible": not shortfalls, "cells": cells, "shortfalls": shortfalls}
@@ -0,0 +1,463 @@
+"""
+Streaming readers for question import files.
+
+Uploads are never loaded whole: CSV is read by pandas in chunks, XLSX by
+openpyxl in read-only mode, JSON Lines (plain or gzip'd) line by line and
+Parquet by record batch, so callers receive DataFrames of at most
+chunk_size rows. Each frame is indexed by the 1-based data row number used
+in import reports ("Row N: ..."), which stays stable across chunks.
+
+iter_normalized maps each frame to QuestionCreate fields column by column;
+run_import and stage_preview both read rows through it.
+"""
+import codecs
+import gzip
+import io
+import itertools
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, IO, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.services import dedup
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+# Jaccard score above which preview rows list similar stored questions
+SIMILARITY_THRESHOLD = float(os.getenv("IMPORT_SIMILARITY_THRESHOLD", "0.8"))
+# How long rows staged by parse_import stay committable
+IMPORT_STAGE_TTL_MINUTES = int(os.getenv("IMPORT_STAGE_TTL_MINUTES", "60"))
+
+# Bytes inspected to choose between UTF-8 and GBK for CSV files
+_ENCODING_SAMPLE = 1 << 20
+
+
+class ImportFileError(ValueError):
+    """The file could not be read (bad encoding, malformed CSV, broken workbook)."""
+
+
+def detect_encoding(f: IO[bytes]) -> str:
+    """UTF-8 (BOM tolerated) if the leading sample decodes, else GBK. Rewinds f."""
+    sample = f.read(_ENCODING_SAMPLE)
+    f.seek(0)
+    try:
+        # Incremental decode: a multi-byte char cut at the sample end is fine
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "gbk"
+
+
+def _csv_frames(f: IO[bytes], chunk_size: int) -> Iterator[pd.DataFrame]:
+    reader = pd.read_csv(f, encoding=detect_encoding(f), dtype=object, chunksize=chunk_size)
+    with reader:
+        for frame in reader:
+            frame.index = frame.index + 1
+            yield frame
+
+
+def _xlsx_frames(f: IO[bytes], chunk_size: int) -> Iterator[pd.DataFrame]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(f, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [
+            str(h).strip() if h is not None else f"Unnamed: {i}"
+            for i, h in enumerate(header)
+        ]
+        width = len(columns)
+        batch, numbers = [], []
+        for number, values in enumerate(rows, start=1):
+            # Read-only sheets often report trailing blank rows
+            if not any(v is not None and v != "" for v in values):
+                continue
+            values = tuple(values[:width]) + (None,) * (width - len(values))
+            batch.append(values)
+            numbers.append(number)
+            if len(batch) >= chunk_size:
+                yield pd.DataFrame(batch, columns=columns, index=numbers, dtype=object)
+                batch, numbers = [], []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns, index=numbers, dtype=object)
+    finally:
+        wb.close()
+
+
+def _xls_frames(f: IO[bytes], chunk_size: int) -> Iterator[pd.DataFrame]:
+    # Legacy .xls has no streaming reader; it is read whole and re-chunked
+    df = pd.read_excel(f, dtype=object)
+    df.index = df.index + 1
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _jsonl_value(number: int, key: str, value):
+    """Lists become tuples (see _split_list); objects and nested lists in read columns are refused."""
+    if isinstance(value, list):
+        if key in _READ_HEADERS and not all(isinstance(v, _SCALARS) for v in value):
+            raise ImportFileError(f"Line {number}: '{key}' must be a list of text or numbers")
+        return tuple(value)
+    if key in _READ_HEADERS and not isinstance(value, _SCALARS):
+        raise ImportFileError(f"Line {number}: '{key}' must be text, a number or a list")
+    return value
+
+
+def _jsonl_frames(f: IO[bytes], chunk_size: int) -> Iterator[pd.DataFrame]:
+    # gzip'd or plain
+    if f.read(2) == b"\x1f\x8b":
+        f.seek(0)
+        f = gzip.GzipFile(fileobj=f)
+    else:
+        f.seek(0)
+    batch, numbers = [], []
+    for number, line in enumerate(io.TextIOWrapper(f, encoding="utf-8-sig"), start=1):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ImportFileError(f"Line {number}: expected a JSON object")
+        batch.append({k: _jsonl_value(number, k, v) for k, v in record.items()})
+        numbers.append(number)
+        if len(batch) >= chunk_size:
+            yield pd.DataFrame(batch, index=numbers, dtype=object)
+            batch, numbers = [], []
+    if batch:
+        yield pd.DataFrame(batch, index=numbers, dtype=object)
+
+
+def _parquet_frames(f: IO[bytes], chunk_size: int) -> Iterator[pd.DataFrame]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    number = 1
+    for batch in pq.ParquetFile(f).iter_batches(batch_size=chunk_size):
+        columns = {}
+        for field, col in zip(batch.schema, batch.columns):
+            values = col.to_pylist()
+            if pa.types.is_list(field.type) or pa.types.is_large_list(field.type):
+                values = [tuple(v) if v is not None else None for v in values]
+            columns[field.name] = values
+        yield pd.DataFrame(columns, index=range(number, number + batch.num_rows), dtype=object)
+        number += batch.num_rows
+
+
+def _guarded(frames: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    try:
+        yield from frames
+    except Exception as e:
+        raise ImportFileError(str(e)) from e
+
+
+def open_frames(f: IO[bytes], filename: str, chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Start streaming an import file. The first chunk is read eagerly so that
+    unreadable files fail here, before anything is written; later failures
+    surface as ImportFileError from the returned iterator.
+    """
+    name = (filename or "").lower()
+    if name.endswith('.csv'):
+        frames = _csv_frames(f, chunk_size)
+    elif name.endswith('.xlsx'):
+        frames = _xlsx_frames(f, chunk_size)
+    elif name.endswith('.xls'):
+        frames = _xls_frames(f, chunk_size)
+    elif name.endswith(('.jsonl', '.jsonl.gz', '.ndjson')):
+        frames = _jsonl_frames(f, chunk_size)
+    elif name.endswith('.parquet'):
+        frames = _parquet_frames(f, chunk_size)
+    else:
+        raise ImportFileError("Unsupported file format. Please use .csv, .xlsx, .jsonl(.gz) or .parquet")
+    frames = _guarded(frames)
+    first = next(frames, None)
+    if first is None:
+        return iter(())
+    return itertools.chain([first], frames)
+
+
+def chunked(items: Iterable, size: int = IMPORT_CHUNK_SIZE) -> Iterator[List]:
+    it = iter(items)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+# Canonical field -> accepted headers, first non-empty one wins
+COLUMN_ALIASES = {
+    "content": ("content", "题干"),
+    "q_type": ("q_type", "题型"),
+    "difficulty": ("difficulty", "难度"),
+    "options": ("options", "选项"),
+    "answer": ("answer", "答案"),
+    "tags": ("tags", "标签"),
+    "analysis": ("analysis", "解析"),
+    "source_doc": ("source_doc", "来源"),
+}
+_READ_HEADERS = frozenset(h for headers in COLUMN_ALIASES.values() for h in headers)
+TYPE_MAP = {'单选': 'single', '多选': 'multi', '判断': 'judge', '简答': 'essay'}
+DEFAULT_DIFFICULTY = 3
+
+
+def _present(a: np.ndarray) -> np.ndarray:
+    """Mask of cells that count as filled in (not NaN/None, not empty text)."""
+    return pd.notna(a) & (a != "")
+
+
+def _resolve(frame: pd.DataFrame, field: str) -> np.ndarray:
+    """The field's column, each cell taken from the first alias that has a value."""
+    result = np.full(len(frame), None, dtype=object)
+    for header in reversed(COLUMN_ALIASES[field]):
+        if header in frame.columns:
+            col = frame[header].to_numpy(dtype=object)
+            result = np.where(_present(col), col, result)
+    return result
+
+
+def _text(a: np.ndarray, strip: bool = False) -> np.ndarray:
+    """str() of filled cells, None elsewhere."""
+    out = np.full(len(a), None, dtype=object)
+    present = _present(a)
+    if strip:
+        out[present] = [str(v).strip() for v in a[present]]
+    else:
+        out[present] = [str(v) for v in a[present]]
+    return out
+
+
+def _split_list(a: np.ndarray, sep: str) -> list:
+    """
+    Split text cells on sep into stripped, non-empty parts. Tuple cells (lists
+    from JSON Lines/Parquet) are already split; other cells give [].
+    """
+    # Each distinct cell is split once; tag columns repeat heavily
+    codes, uniques = pd.factorize(a)
+    parts = [
+        [p for part in v.split(sep) if (p := part.strip())] if type(v) is str
+        else [p for part in v if part is not None and (p := str(part).strip())] if type(v) is tuple
+        else []
+        for v in uniques
+    ]
+    return [list(parts[c]) if c >= 0 else [] for c in codes.tolist()]
+
+
+def _normalized_columns(frame: pd.DataFrame) -> Tuple[dict, np.ndarray]:
+    content = _text(_resolve(frame, "content"), strip=True)
+
+    q_type = _resolve(frame, "q_type")
+    q_type = np.where(_present(q_type), q_type, "single")
+    for label, code in TYPE_MAP.items():
+        q_type[q_type == label] = code
+
+    # Fractions round half up ("2.5" -> 3); blank, unparseable or 0 -> default
+    difficulty = np.floor(pd.to_numeric(_resolve(frame, "difficulty"), errors="coerce").astype(float) + 0.5)
+    usable = np.isfinite(difficulty) & (difficulty != 0)
+    difficulty = np.where(usable, difficulty, DEFAULT_DIFFICULTY).astype(int)
+
+    answer = _text(_resolve(frame, "answer"), strip=True)
+    columns = {
+        "content": content,
+        "q_type": _text(q_type),
+        "difficulty": difficulty,
+        "options": _split_list(_resolve(frame, "options"), "\n"),
+        "answer": np.where(pd.isna(answer), "", answer),
+        "tags": _split_list(_resolve(frame, "tags"), ","),
+        "analysis": _text(_resolve(frame, "analysis")),
+        "source_doc": _text(_resolve(frame, "source_doc")),
+    }
+    return columns, pd.isna(content) | (content == "")
+
+
+def iter_normalized(frames: Iterable[pd.DataFrame]) -> Iterator[Tuple[int, dict]]:
+    """(row_number, QuestionCreate fields) pairs; content is None for rows that lack it."""
+    for frame in frames:
+        columns, missing = _normalized_columns(frame)
+        fields = list(columns)
+        values = [col.tolist() if isinstance(col, np.ndarray) else col for col in columns.values()]
+        for number, skip, row in zip(frame.index.tolist(), missing.tolist(), zip(*values)):
+            record = dict(zip(fields, row))
+            if skip:
+                record["content"] = None
+            yield number, record
+
+
+def preview_item(row_number: int, data: dict) -> dict:
+    """Preview entry for a normalized row (see iter_normalized)."""
+    if data["content"] is None:
+        data = {k: v for k, v in data.items() if k != "content"}
+        return {"row_index": row_number, "status": "invalid", "errors": ["Content is missing"], "data": data}
+    return {"row_index": row_number, "status": "valid", "errors": [], "data": data}
+
+
+def _insert_candidates(db: Session, candidates: Iterable, errors: list, on_progress=None, progress_count=None):
+    """
+    Write (row_number, QuestionCreate) pairs in chunks: one hash lookup and
+    one bulk insert each (see crud.import_questions_chunk). Per-row failures
+    are appended to errors. Returns (created_count, parse_error); a read
+    error ends the import but keeps the chunks already written.
+    """
+    success_count = 0
+    seen_hashes = set()
+    try:
+        for chunk in chunked(candidates):
+            created, chunk_errors = crud.import_questions_chunk(db, chunk, seen_hashes)
+            success_count += created
+            errors.extend(chunk_errors)
+            if on_progress:
+                on_progress(progress_count())
+    except ImportFileError as e:
+        return success_count, f"Failed to parse file: {str(e)}"
+    return success_count, None
+
+
+def _report(db: Session, filename: str, success_count: int, errors: list, parse_error: Optional[str] = None) -> dict:
+    failed_count = len(errors)
+    errors.sort(key=lambda e: e[0])
+    errors = [f"Row {row}: {msg}" for row, msg in errors]
+    if parse_error:
+        errors.insert(0, parse_error)
+
+    crud.create_operation_log(
+        db, "batch_import", "question", 
+        details={"filename": filename, "success": success_count, "failed": failed_count}
+    )
+
+    return {
+        "success": success_count,
+        "failed": failed_count,
+        "errors": errors[:50]
+    }
+
+
+def run_import(
+    db: Session,
+    frames: Iterable[pd.DataFrame],
+    filename: str,
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> dict:
+    """
+    Stream rows through validation into chunked writes. on_progress gets
+    the number of rows read after each chunk. Returns the import report.
+    """
+    errors = []
+    rows_read = 0
+
+    def candidates():
+        nonlocal rows_read
+        for row_number, data in iter_normalized(frames):
+            rows_read += 1
+            if data["content"] is None:
+                continue
+            try:
+                q_schema = schemas.QuestionCreate(**data)
+            except Exception as e:
+                errors.append((row_number, str(e)))
+                continue
+            yield row_number, q_schema
+
+    success_count, parse_error = _insert_candidates(db, candidates(), errors, on_progress, lambda: rows_read)
+    if on_progress:
+        on_progress(rows_read)
+    return _report(db, filename, success_count, errors, parse_error)
+
+
+def stage_preview(db: Session, frames: Iterable[pd.DataFrame], filename: str) -> dict:
+    """
+    Build the preview for an import file and stage its rows under a token,
+    so /questions/import/commit can insert them without re-reading the file.
+    Duplicates are checked with one hash lookup per chunk.
+    """
+    crud.purge_expired_import_batches(db)
+    token = uuid.uuid4().hex
+    expires_at = datetime.utcnow() + timedelta(minutes=IMPORT_STAGE_TTL_MINUTES)
+    crud.create_import_batch(db, token, filename, expires_at)
+
+    parsed_items = []
+    for chunk in chunked(iter_normalized(frames)):
+        items = [preview_item(row_number, data) for row_number, data in chunk]
+
+        # Validation: Check Duplicate
+        hashes = {
+            id(item): crud.calculate_content_hash(item["data"]["content"])
+            for item in items if item["status"] == "valid"
+        }
+        existing = crud.get_existing_hashes(db, list(hashes.values()))
+        for item in items:
+            existing_id = existing.get(hashes.get(id(item)))
+            if existing_id is not None:
+                item["status"] = "duplicate"
+                item["errors"].append("Duplicate question exists")
+                item["existing_id"] = existing_id
+
+        # Near-duplicates are reported but do not block the row
+        valid = [item for item in items if item["status"] == "valid"]
+        similar = dedup.find_similar_batch(
+            db, [item["data"]["content"] for item in valid], SIMILARITY_THRESHOLD, limit=3
+        )
+        for item, matches in zip(valid, similar):
+            if matches:
+                item["similar"] = [{"id": m["id"], "score": m["score"]} for m in matches]
+        crud.add_import_batch_rows(db, token, items)
+        parsed_items.extend(items)
+
+    return {
+        "filename": filename,
+        "total": len(parsed_items),
+        "items": parsed_items,
+        "token": token,
+        "expires_at": expires_at,
+    }
+
+
+def commit_staged(
+    db: Session,
+    batch,
+    rows: Optional[List[int]] = None,
+    edits: Optional[dict] = None,
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> dict:
+    """
+    Insert a staged batch: its valid rows, restricted to `rows` if given,
+    plus any rows the user edited (edits maps row_index -> changed fields,
+    re-validated here). The batch is consumed. Returns the import report.
+    """
+    edits = {int(k): v for k, v in (edits or {}).items()}
+    selected = set(rows) if rows is not None else None
+    errors = []
+    rows_seen = 0
+
+    def candidates():
+        nonlocal rows_seen
+        for staged in crud.iter_import_batch_rows(db, batch.token):
+            for r in staged:
+                rows_seen += 1
+                if selected is not None and r.row_index not in selected:
+                    continue
+                edit = edits.get(r.row_index)
+                if edit is None and r.status != "valid":
+                    continue
+                try:
+                    q_schema = schemas.QuestionCreate(**{**(r.data or {}), **(edit or {})})
+                except Exception as e:
+                    errors.append((r.row_index, str(e)))
+                    continue
+                yield r.row_index, q_schema
+
+    token, filename = batch.token, batch.filename
+    success_count, _ = _insert_candidates(db, candidates(), errors, on_progress, lambda: rows_seen)
+    crud.delete_import_batch(db, token)
+    if on_progress:
+        on_progress(rows_seen)
+    return _report(db, filename, success_count, errors)
@@ -0,0 +1,212 @@
+"""
+Background jobs for long-running work (imports, AI generation, exports).
+
+Job state lives in the jobs table, so any process can report on it and it
+survives restarts. The work runs on a thread pool in the process that
+accepted it. Handlers are registered per kind and receive a JobContext
+with their own session, throttled progress reporting and an output
+directory. Job state is written through short separate sessions so it
+never mixes with the handler's transactions.
+"""
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, IO, Optional
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from app import models
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_FILES_DIR = os.getenv("JOB_FILES_DIR", "./job_files")
+JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS", "72"))
+# Minimum seconds between progress writes
+PROGRESS_INTERVAL = 0.5
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+_handlers: Dict[str, Callable[["JobContext"], Any]] = {}
+_futures: Dict[int, Future] = {}
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def register(kind: str):
+    """Decorator registering the handler for a job kind. Its return value is the job result."""
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def _sessions(bind):
+    return sessionmaker(autocommit=False, autoflush=False, bind=bind)
+
+
+def _update(bind, job_id: int, **fields) -> int:
+    with _sessions(bind)() as db:
+        updated = db.query(models.Job).filter(models.Job.id == job_id).update(fields)
+        db.commit()
+        return updated
+
+
+class JobContext:
+    def __init__(self, job_id: int, bind, params: dict, total: Optional[int] = None):
+        self.job_id = job_id
+        self.params = params or {}
+        self.db: Session = _sessions(bind)()
+        self.processed = 0
+        self.total = total
+        self._bind = bind
+        self._last_report = 0.0
+
+    def progress(self, processed: Optional[int] = None, total: Optional[int] = None, force: bool = False):
+        if processed is not None:
+            self.processed = processed
+        if total is not None:
+            self.total = total
+        now = time.monotonic()
+        if force or now - self._last_report >= PROGRESS_INTERVAL:
+            self._last_report = now
+            _update(self._bind, self.job_id, processed=self.processed, total=self.total)
+
+    def output_path(self, filename: str) -> str:
+        directory = os.path.join(JOB_FILES_DIR, str(self.job_id))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, filename)
+
+
+def save_upload(f: IO[bytes], filename: str) -> str:
+    """Copy an upload to disk so a job can read it after the request ends."""
+    directory = os.path.join(JOB_FILES_DIR, "uploads")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{uuid.uuid4().hex}_{os.path.basename(filename or 'upload')}")
+    with open(path, "wb") as out:
+        shutil.copyfileobj(f, out, 1 << 20)
+    return path
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+        return _executor
+
+
+def submit(db: Session, kind: str, params: Optional[dict] = None, total: Optional[int] = None) -> models.Job:
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = models.Job(kind=kind, params=params or {}, total=total, status="queued", processed=0)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _start(db.get_bind(), job.id)
+    return job
+
+
+def _start(bind, job_id: int):
+    future = _get_executor().submit(_run, bind, job_id)
+    _futures[job_id] = future
+    future.add_done_callback(lambda _: _futures.pop(job_id, None))
+
+
+def _run(bind, job_id: int):
+    # Claim the job; a conditional update keeps two processes from both running it
+    with _sessions(bind)() as db:
+        claimed = db.query(models.Job).filter(
+            models.Job.id == job_id, models.Job.status == "queued"
+        ).update({"status": "running", "started_at": datetime.utcnow()})
+        db.commit()
+        if not claimed:
+            return
+        job = db.get(models.Job, job_id)
+        kind, params, total = job.kind, job.params, job.total
+
+    ctx = JobContext(job_id, bind, params, total)
+    try:
+        handler = _handlers.get(kind)
+        if handler is None:
+            raise ValueError(f"Unknown job kind: {kind}")
+        result = handler(ctx)
+        fields = {"status": "succeeded", "result": result}
+    except Exception as e:
+        ctx.db.rollback()
+        fields = {"status": "failed", "error_message": str(e)}
+    finally:
+        ctx.db.close()
+    _update(bind, job_id, processed=ctx.processed, total=ctx.total, finished_at=datetime.utcnow(), **fields)
+
+
+def wait(job_id: int, timeout: Optional[float] = None):
+    """Block until a job started by this process finishes (tests, CLI use)."""
+    future = _futures.get(job_id)
+    if future is not None:
+        future.result(timeout)
+
+
+def get_job(db: Session, job_id: int) -> Optional[models.Job]:
+    return db.query(models.Job).filter(models.Job.id == job_id).first()
+
+
+def list_jobs(db: Session, kind: Optional[str] = None, status: Optional[str] = None, limit: int = 50):
+    query = db.query(models.Job)
+    if kind:
+        query = query.filter(models.Job.kind == kind)
+    if status:
+        query = query.filter(models.Job.status == status)
+    return query.order_by(models.Job.id.desc()).limit(limit).all()
+
+
+def describe(job: models.Job) -> dict:
+    """Job fields plus elapsed time and throughput (processed units per second)."""
+    end = job.finished_at or datetime.utcnow()
+    elapsed = (end - job.started_at).total_seconds() if job.started_at else 0.0
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "processed": job.processed or 0,
+        "total": job.total,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput": round((job.processed or 0) / elapsed, 2) if elapsed > 0 else 0.0,
+        "result": job.result,
+        "error_message": job.error_message,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def resume_pending(db: Session):
+    """
+    Startup hook: jobs left running by a previous process are marked failed,
+    queued ones are started again, and old job files are removed.
+    """
+    db.query(models.Job).filter(models.Job.status == "running").update({
+        "status": "failed",
+        "error_message": "Interrupted by server restart",
+        "finished_at": datetime.utcnow(),
+    })
+    db.commit()
+    queued = [
+        job_id for (job_id,) in
+        db.query(models.Job.id).filter(models.Job.status == "queued").order_by(models.Job.id)
+    ]
+    for job_id in queued:
+        _start(db.get_bind(), job_id)
+    prune(db)
+
+
+def prune(db: Session, retention_hours: int = JOB_RETENTION_HOURS):
+    """Delete output files of jobs that finished more than retention_hours ago."""
+    cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
+    old = db.query(models.Job.id).filter(
+        models.Job.status.in_(TERMINAL_STATUSES), models.Job.finished_at < cutoff
+    )
+    for (job_id,) in old:
+        shutil.rmtree(os.path.join(JOB_FILES_DIR, str(job_id)), ignore_errors=True)
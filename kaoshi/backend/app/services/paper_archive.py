@@ -0,0 +1,69 @@
+"""
+Several papers, formats and answer variants as one streamed ZIP archive.
+
+Members are rendered in parallel through the export cache (so cached files
+are reused and new renders are cached for later single downloads) and are
+written to the archive in the order they finish. The archive goes to a
+sink that is drained after every member, so only one member is ever
+buffered; zipfile switches to data descriptors since the sink can't seek.
+Members that fail to render are listed in ERRORS.txt at the end instead of
+aborting a download that has already started.
+"""
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, List
+
+from app.services import export_cache, render_pool
+from app.services.streaming import ChunkSink
+
+# Already compressed containers are stored as they are
+_STORED_FORMATS = ("docx", "pdf")
+_UNSAFE_RE = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+def member_name(paper: dict, fmt: str, include_answers: bool) -> str:
+    title = _UNSAFE_RE.sub("_", paper.get("title") or "").strip("_")[:80]
+    suffix = "" if include_answers else "_no_answers"
+    return f"{paper['id']}_{title}{suffix}.{fmt}" if title else f"exam_paper_{paper['id']}{suffix}.{fmt}"
+
+
+def _rendered(paper: dict, fmt: str, include_answers: bool) -> str:
+    data = {"title": paper["title"], "questions_snapshot": paper["questions_snapshot"]}
+    key = export_cache.cache_key(paper["id"], data, fmt, include_answers)
+    return export_cache.get_or_render(
+        key, fmt, lambda: render_pool.render(fmt, data, include_answers=include_answers, block=True)
+    )
+
+
+def iter_zip(papers: List[dict], formats: List[str], variants: List[bool]) -> Iterator[bytes]:
+    """
+    Byte chunks of a ZIP holding every paper (dicts with id, title and
+    questions_snapshot) in every format and include_answers variant.
+    """
+    entries = [(paper, fmt, inc) for paper in papers for fmt in formats for inc in variants]
+    sink = ChunkSink()
+    zf = zipfile.ZipFile(sink, "w")
+    errors = []
+    # Threads only wait on the render pool; one per render worker keeps it busy
+    ex = ThreadPoolExecutor(max_workers=max(1, render_pool.RENDER_WORKERS), thread_name_prefix="archive")
+    try:
+        futures = {ex.submit(_rendered, *entry): entry for entry in entries}
+        for fut in as_completed(futures):
+            paper, fmt, inc = futures[fut]
+            name = member_name(paper, fmt, inc)
+            try:
+                path = fut.result()
+            except Exception as e:
+                errors.append(f"{name}: {type(e).__name__}: {e}")
+                continue
+            compress = zipfile.ZIP_STORED if fmt in _STORED_FORMATS else zipfile.ZIP_DEFLATED
+            zf.write(path, name, compress_type=compress)
+            yield sink.drain()
+        if errors:
+            zf.writestr("ERRORS.txt", "\n".join(errors) + "\n")
+        zf.close()
+        yield sink.drain()
+    finally:
+        # Client gone: don't start renders nobody will download
+        ex.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,256 @@
+"""
+Process-level pool of published questions for the assembly engine.
+
+Only the columns needed for sampling are kept, in parallel arrays (ids,
+type codes, difficulties, scores) plus one tag and one knowledge-point
+bitset per question. crud
+patches the pool after each write; a TTL bounds staleness for writes made by
+other processes, and the engine re-checks chosen rows when loading them.
+"""
+import os
+import pickle
+import threading
+import time
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import models
+
+POOL_TTL_SECONDS = int(os.getenv("QUESTION_POOL_TTL", "300"))
+
+_COLUMNS = (
+    models.Question.id, models.Question.q_type, models.Question.difficulty,
+    models.Question.score, models.Question.tags, models.Question.status,
+    models.Question.knowledge_points,
+)
+
+
+class QuestionPool:
+    """Compact, array-backed view of the published questions."""
+
+    def __init__(self):
+        self.ids = array("q")
+        self.types = array("H")
+        self.difficulties = array("h")
+        self.scores = array("d")
+        self.tag_bits: List[int] = []
+        self.kp_bits: List[int] = []
+
+        self.type_names: List[str] = []
+        self.type_codes: Dict[str, int] = {}
+        self.tag_codes: Dict[str, int] = {}
+        self.kp_codes: Dict[str, int] = {}
+
+        self.positions: Dict[int, int] = {}
+        self._reset_stats()
+        self.loaded_at = 0.0
+        self.lock = threading.RLock()
+        self._buckets = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _reset_stats(self):
+        # Availability counters kept in step with the arrays, used by the
+        # rule feasibility check: (type, difficulty), (type, difficulty, tag)
+        # and (type, knowledge point), all by code
+        self.cell_counts = Counter()
+        self.cell_tag_counts = Counter()
+        self.type_kp_counts = Counter()
+
+    def _count(self, type_code: int, difficulty: int, tag_bits: int, kp_bits: int, sign: int):
+        self.cell_counts[(type_code, difficulty)] += sign
+        for code in iter_bits(tag_bits):
+            self.cell_tag_counts[(type_code, difficulty, code)] += sign
+        for code in iter_bits(kp_bits):
+            self.type_kp_counts[(type_code, code)] += sign
+
+    # Pools are shipped to worker processes (see engine.assemble_variants)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        state["_buckets"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def snapshot(self) -> "QuestionPool":
+        """Independent copy of the current contents, for work done outside the lock."""
+        with self.lock:
+            return pickle.loads(pickle.dumps(self))
+
+    # Encoding helpers
+    def _type_code(self, q_type: str) -> int:
+        code = self.type_codes.get(q_type)
+        if code is None:
+            code = len(self.type_names)
+            self.type_codes[q_type] = code
+            self.type_names.append(q_type)
+        return code
+
+    @staticmethod
+    def _bits(values, codes: Dict[str, int]) -> int:
+        bits = 0
+        for v in values or []:
+            code = codes.get(v)
+            if code is None:
+                code = codes[v] = len(codes)
+            bits |= 1 << code
+        return bits
+
+    @staticmethod
+    def _mask(values, codes: Dict[str, int]) -> int:
+        mask = 0
+        for v in values or []:
+            code = codes.get(v)
+            if code is not None:
+                mask |= 1 << code
+        return mask
+
+    def tag_mask(self, tags: Iterable[str]) -> int:
+        """Bitmask for the given tags; tags unknown to the pool contribute nothing."""
+        return self._mask(tags, self.tag_codes)
+
+    def kp_bit(self, knowledge_point: str) -> int:
+        """Bit for a knowledge point, or 0 if no pooled question covers it."""
+        return self._mask([knowledge_point], self.kp_codes)
+
+    # Mutation
+    def load(self, db: Session):
+        with self.lock:
+            self.ids, self.types = array("q"), array("H")
+            self.difficulties, self.scores = array("h"), array("d")
+            self.tag_bits, self.kp_bits, self.positions = [], [], {}
+            self.type_names, self.type_codes = [], {}
+            self.tag_codes, self.kp_codes = {}, {}
+            self._reset_stats()
+            rows = db.query(*_COLUMNS).filter(models.Question.status == "published").yield_per(5000)
+            for row in rows:
+                self._append(row)
+            self.loaded_at = time.monotonic()
+            self._buckets = None
+
+    def _append(self, row):
+        self.positions[row.id] = len(self.ids)
+        self.ids.append(row.id)
+        self.types.append(self._type_code(row.q_type))
+        self.difficulties.append(row.difficulty if row.difficulty is not None else 0)
+        self.scores.append(row.score if row.score is not None else 0.0)
+        self.tag_bits.append(self._bits(row.tags, self.tag_codes))
+        self.kp_bits.append(self._bits(row.knowledge_points, self.kp_codes))
+        self._count(self.types[-1], self.difficulties[-1], self.tag_bits[-1], self.kp_bits[-1], +1)
+
+    def _remove(self, question_id: int):
+        pos = self.positions.pop(question_id, None)
+        if pos is None:
+            return
+        self._count(self.types[pos], self.difficulties[pos], self.tag_bits[pos], self.kp_bits[pos], -1)
+        last = len(self.ids) - 1
+        if pos != last:
+            # Swap-remove: move the last entry into the freed slot
+            self.ids[pos] = self.ids[last]
+            self.types[pos] = self.types[last]
+            self.difficulties[pos] = self.difficulties[last]
+            self.scores[pos] = self.scores[last]
+            self.tag_bits[pos] = self.tag_bits[last]
+            self.kp_bits[pos] = self.kp_bits[last]
+            self.positions[self.ids[pos]] = pos
+        self.ids.pop()
+        self.types.pop()
+        self.difficulties.pop()
+        self.scores.pop()
+        self.tag_bits.pop()
+        self.kp_bits.pop()
+
+    def patch(self, rows):
+        """Apply fresh rows (see _COLUMNS) read after a write."""
+        with self.lock:
+            for row in rows:
+                self._remove(row.id)
+                if row.status == "published":
+                    self._append(row)
+            self._buckets = None
+
+    def remove(self, ids: Iterable[int]):
+        with self.lock:
+            for qid in ids:
+                self._remove(qid)
+            self._buckets = None
+
+    # Sampling support
+    def buckets(self) -> Dict[Tuple[str, str], List[int]]:
+        """Positions grouped by (q_type, str(difficulty)), built in one pass."""
+        with self.lock:
+            if self._buckets is None:
+                buckets: Dict[Tuple[str, str], List[int]] = {}
+                names = self.type_names
+                for pos, (t, d) in enumerate(zip(self.types, self.difficulties)):
+                    buckets.setdefault((names[t], str(d)), []).append(pos)
+                self._buckets = buckets
+            return self._buckets
+
+
+def iter_bits(bits: int):
+    """Indexes of the set bits of an int bitset."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+_pools: Dict[str, QuestionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _key(db: Session) -> str:
+    return str(db.get_bind().url)
+
+
+def get_pool(db: Session, reload: bool = False) -> QuestionPool:
+    key = _key(db)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = QuestionPool()
+    with pool.lock:
+        expired = time.monotonic() - pool.loaded_at > POOL_TTL_SECONDS
+        if reload or not pool.loaded_at or expired:
+            pool.load(db)
+    return pool
+
+
+def _loaded_pool(db: Session) -> Optional[QuestionPool]:
+    pool = _pools.get(_key(db))
+    return pool if pool is not None and pool.loaded_at else None
+
+
+def refresh_questions(db: Session, ids: List[int]):
+    """Re-read the given questions into the pool after a committed write."""
+    pool = _loaded_pool(db)
+    if pool is None or not ids:
+        return
+    rows = db.query(*_COLUMNS).filter(models.Question.id.in_(ids)).all()
+    found = {r.id for r in rows}
+    pool.patch(rows)
+    pool.remove(i for i in ids if i not in found)
+
+
+def remove_questions(db: Session, ids: List[int]):
+    pool = _loaded_pool(db)
+    if pool is not None and ids:
+        pool.remove(ids)
+
+
+def invalidate():
+    with _pools_lock:
+        _pools.clear()
+
+
+# A freshly (re)created questions table makes every cached pool meaningless
+event.listen(models.Question.__table__, "after_create", lambda *args, **kw: invalidate())
@@ -0,0 +1,104 @@
+"""
+Paper rendering in worker processes.
+
+python-docx and reportlab renders are CPU-bound pure Python; run in the
+request thread they hold the GIL and starve list/search traffic in the same
+process. render() ships the paper to a ProcessPoolExecutor instead and
+returns the file's bytes. At most RENDER_WORKERS renders run and
+RENDER_QUEUE_SIZE more wait; beyond that render() fails fast with
+RenderQueueFull rather than piling up requests. RENDER_WORKERS=0 renders
+inline (tests, platforms without process pools).
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from app.services import exporter
+
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+RENDER_QUEUE_SIZE = int(os.getenv("RENDER_QUEUE_SIZE", str(RENDER_WORKERS * 4)))
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "60"))
+
+RENDERERS = {
+    "docx": exporter.export_to_docx,
+    "pdf": exporter.export_to_pdf,
+    "txt": exporter.export_to_txt,
+}
+
+_executor: Optional[ProcessPoolExecutor] = None
+_slots: Optional[threading.BoundedSemaphore] = None
+_lock = threading.Lock()
+
+
+class RenderQueueFull(Exception):
+    pass
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+def _render(fmt: str, paper_data: dict, include_answers: bool) -> bytes:
+    return RENDERERS[fmt](paper_data, include_answers=include_answers).getvalue()
+
+
+def _get_executor():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            # spawn: forking a threaded server process can copy held locks
+            _executor = ProcessPoolExecutor(
+                max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+            _slots = threading.BoundedSemaphore(RENDER_WORKERS + RENDER_QUEUE_SIZE)
+        return _executor, _slots
+
+
+def _discard(executor: ProcessPoolExecutor):
+    global _executor
+    with _lock:
+        if _executor is executor:
+            _executor = None
+
+
+def shutdown():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
+
+
+def render(fmt: str, paper_data: dict, include_answers: bool = True, timeout: Optional[float] = None,
+           block: bool = False) -> bytes:
+    """
+    Rendered file bytes for fmt (docx/pdf/txt). With block=True a full
+    queue is waited on (up to the timeout) instead of failing at once.
+    """
+    if fmt not in RENDERERS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    if RENDER_WORKERS <= 0:
+        return _render(fmt, paper_data, include_answers)
+    executor, slots = _get_executor()
+    timeout = RENDER_TIMEOUT if timeout is None else timeout
+    if not (slots.acquire(timeout=timeout) if block else slots.acquire(blocking=False)):
+        raise RenderQueueFull(f"{RENDER_WORKERS + RENDER_QUEUE_SIZE} renders already running or queued")
+    try:
+        future = executor.submit(_render, fmt, paper_data, include_answers)
+    except BaseException:
+        slots.release()
+        raise
+    # The slot is held until the work is really done, even after a timeout
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()
+        raise RenderTimeout(f"Rendering {fmt} took longer than {timeout}s")
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); start a fresh pool next time
+        _discard(executor)
+        raise
@@ -0,0 +1,175 @@
+"""
+Full-text search over questions backed by an SQLite FTS5 table.
+
+FTS5's built-in tokenizers do not segment Chinese, so text is pre-tokenized
+here: CJK runs become overlapping bigrams plus their final character, other
+scripts become lower-cased words. The same tokenizer is applied to queries,
+which are then matched as a phrase, so both short (1-2 character) and long
+queries are index lookups.
+"""
+import re
+from typing import Iterable, List, Optional
+
+from sqlalchemy import text, Float, Integer
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app import models
+from app.models import FTS_TABLE
+
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+# CJK runs or other words; also the tokenizer of services.similarity
+TOKEN_RE = re.compile(rf"([{_CJK}]+)|([^\W_{_CJK}]+)")
+
+# Per-database cache of whether the FTS table is usable
+_enabled = {}
+
+
+def _tokens(value: str, trailing: bool = True) -> List[str]:
+    """
+    Split text into index tokens. For the last CJK run of a query `trailing`
+    is False, since the document run may continue past the query's end.
+    """
+    out = []
+    matches = list(TOKEN_RE.finditer(value or ""))
+    for i, m in enumerate(matches):
+        cjk, word = m.groups()
+        if word:
+            out.append(word.lower())
+            continue
+        out.extend(cjk[j:j + 2] for j in range(len(cjk) - 1))
+        if trailing or i < len(matches) - 1 or len(cjk) == 1:
+            out.append(cjk[-1])
+    return out
+
+
+def tokenize(value) -> str:
+    if isinstance(value, (list, tuple)):
+        value = " ".join(str(v) for v in value if v)
+    return " ".join(_tokens(str(value) if value else ""))
+
+
+def build_match(query: str) -> Optional[str]:
+    """Turn user input into an FTS5 MATCH expression (prefix phrase)."""
+    tokens = _tokens(query, trailing=False)
+    if not tokens:
+        return None
+    return '"' + " ".join(tokens) + '"*'
+
+
+def is_enabled(db: Session) -> bool:
+    bind = db.get_bind()
+    key = str(bind.url)
+    if key not in _enabled:
+        if bind.dialect.name != "sqlite":
+            _enabled[key] = False
+        else:
+            row = db.execute(
+                text("SELECT name FROM sqlite_master WHERE type='table' AND name=:n"),
+                {"n": FTS_TABLE},
+            ).first()
+            _enabled[key] = row is not None
+    return _enabled[key]
+
+
+def ensure_index(db: Session):
+    """Create and backfill the FTS table for databases that predate it."""
+    bind = db.get_bind()
+    if bind.dialect.name != "sqlite":
+        return
+    try:
+        exists = db.execute(
+            text("SELECT name FROM sqlite_master WHERE type='table' AND name=:n"),
+            {"n": FTS_TABLE},
+        ).first()
+        if exists is None:
+            db.execute(text(models.CREATE_FTS_SQL))
+            db.commit()
+            rebuild(db)
+    except OperationalError:
+        # SQLite built without FTS5: search falls back to LIKE
+        db.rollback()
+    _enabled.pop(str(bind.url), None)
+
+
+def index_questions(db: Session, questions: Iterable):
+    """(Re)index questions in the current transaction. Caller commits."""
+    if not is_enabled(db):
+        return
+    rows = [
+        {
+            "id": q.id,
+            "content": tokenize(q.content),
+            "analysis": tokenize(q.analysis),
+            "options": tokenize(q.options),
+        }
+        for q in questions
+    ]
+    if not rows:
+        return
+    remove_questions(db, [r["id"] for r in rows])
+    db.execute(
+        text(
+            f"INSERT INTO {FTS_TABLE}(rowid, content, analysis, options) "
+            "VALUES (:id, :content, :analysis, :options)"
+        ),
+        rows,
+    )
+
+
+def remove_questions(db: Session, ids: List[int]):
+    if not ids or not is_enabled(db):
+        return
+    db.execute(
+        text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({','.join(str(int(i)) for i in ids)})")
+    )
+
+
+def rebuild(db: Session, batch_size: int = 1000):
+    db.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    _enabled[str(db.get_bind().url)] = True
+    rows = db.query(
+        models.Question.id, models.Question.content,
+        models.Question.analysis, models.Question.options,
+    ).yield_per(batch_size)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            index_questions(db, batch)
+            batch = []
+    if batch:
+        index_questions(db, batch)
+    db.commit()
+
+
+def ranked_matches(match: str):
+    """Selectable of (qid, rank) for a MATCH expression; lower rank is better."""
+    return text(
+        f"SELECT rowid AS qid, bm25({FTS_TABLE}) AS rank FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH :match"
+    ).bindparams(match=match).columns(qid=Integer, rank=Float).subquery("fts_match")
+
+
+def make_snippet(q, query: str, width: int = 30) -> Optional[str]:
+    """Highlight the first literal hit of `query` in content/analysis/options."""
+    needle = (query or "").strip().lower()
+    if not needle:
+        return None
+    options = " ".join(str(o) for o in (q.options or []))
+    for field in (q.content, q.analysis, options):
+        if not field:
+            continue
+        pos = field.lower().find(needle)
+        if pos < 0:
+            continue
+        start = max(0, pos - width)
+        end = min(len(field), pos + len(needle) + width)
+        return (
+            ("..." if start > 0 else "")
+            + field[start:pos]
+            + "<mark>" + field[pos:pos + len(needle)] + "</mark>"
+            + field[pos + len(needle):end]
+            + ("..." if end < len(field) else "")
+        )
+    return None
@@ -0,0 +1,420 @@
+"""
+Related-question search: TF-IDF vectors over content, analysis and options
+compared by cosine similarity.
+
+Text is tokenized CJK-aware (single characters and bigrams of CJK runs,
+lower-cased words elsewhere) and terms are hashed into NUM_FEATURES
+columns, so there is no vocabulary to keep in sync. Term frequencies are
+sublinear and rows are L2-normalized, making cosine a sparse dot product.
+
+The index lives in a generation directory under SIMILARITY_INDEX_DIR whose
+.npy files are opened with mmap_mode="r", so every worker process shares
+the same pages. The main segment is stored column-major (CSC): a query only
+reads the posting columns of its own terms. Questions created or edited
+after the build are appended to a small delta segment, weighted with the
+build's IDF, the next time the index is used; rows in the delta shadow
+older rows for the same question, and deleted questions are dropped when
+results are fetched. Once the delta outgrows REBUILD_DELTA_RATIO of the
+main segment a rebuild is due, which refreshes the IDF.
+
+Nothing is built while serving a request: until a rebuild (the
+similarity_index job) has written a generation, lookups raise
+IndexNotBuilt. Rebuilds and delta writes are serialized by a lock file in
+the index directory; each delta write re-reads the delta on disk first so
+other processes' rows are kept, and catch-up waits out a running rebuild
+rather than blocking a request on it. A rebuild removes only generations
+older than the one it replaces, so processes still reading that one are
+not cut off.
+"""
+import json
+import os
+import threading
+import shutil
+import time
+import unicodedata
+import uuid
+import zlib
+from datetime import datetime
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app import models
+from app.services.search import TOKEN_RE
+
+SIMILARITY_INDEX_DIR = os.getenv("SIMILARITY_INDEX_DIR", "./similarity_index")
+REBUILD_DELTA_RATIO = float(os.getenv("SIMILARITY_REBUILD_RATIO", "0.2"))
+# Small banks are not rebuilt for every handful of edits
+REBUILD_DELTA_MIN = 1000
+# Minimum seconds between checks for new or edited questions, per process
+REFRESH_INTERVAL = 5.0
+NUM_FEATURES = 1 << 20
+
+_COLUMNS = (models.Question.id, models.Question.content, models.Question.analysis,
+            models.Question.options, models.Question.updated_at)
+
+try:
+    import fcntl
+except ImportError:  # Windows: the index lock only covers threads of one process
+    fcntl = None
+
+# Loaded index per index directory
+_cache: Dict[str, "SimilarityIndex"] = {}
+_lock_guard = threading.Lock()
+
+
+class IndexNotBuilt(Exception):
+    pass
+
+
+def tokens(text: Optional[str]) -> List[str]:
+    out = []
+    for cjk, word in TOKEN_RE.findall(unicodedata.normalize("NFKC", text or "").lower()):
+        if word:
+            out.append(word)
+            continue
+        out.extend(cjk)
+        out.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return out
+
+
+def document(content: Optional[str], analysis: Optional[str] = None, options=None) -> str:
+    """The text a question is indexed (and looked up) by."""
+    parts = [content or "", analysis or ""]
+    if options:
+        parts.extend(str(o) for o in options if o)
+    return "\n".join(parts)
+
+
+def term_counts(text: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted hashed term columns and their counts."""
+    toks = tokens(text)
+    if not toks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    hashed = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in toks), dtype=np.int64, count=len(toks))
+    cols, counts = np.unique(hashed & (NUM_FEATURES - 1), return_counts=True)
+    return cols, counts.astype(np.float32)
+
+
+def _weigh(indptr: np.ndarray, indices: np.ndarray, counts: np.ndarray, idf: np.ndarray) -> np.ndarray:
+    """TF-IDF data for CSR rows given raw counts, each row L2-normalized."""
+    data = (1 + np.log(counts)) * idf[indices]
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    norms = np.sqrt(np.bincount(rows, weights=data.astype(np.float64) ** 2, minlength=len(indptr) - 1))
+    norms[norms == 0] = 1
+    return (data / norms[rows]).astype(np.float32)
+
+
+def _csr_parts(docs: List[Tuple[np.ndarray, np.ndarray]]):
+    indptr = np.zeros(len(docs) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(cols) for cols, _ in docs])
+    if docs:
+        indices = np.concatenate([cols for cols, _ in docs])
+        counts = np.concatenate([c for _, c in docs])
+    else:
+        indices, counts = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    return indptr, indices, counts
+
+
+def _watermark(rows) -> Tuple[int, Optional[datetime]]:
+    max_id = max((r[0] for r in rows), default=0)
+    stamps = [r[4] for r in rows if r[4] is not None]
+    return max_id, max(stamps) if stamps else None
+
+
+class SimilarityIndex:
+    """
+    One loaded generation: the memory-mapped main segment plus its delta.
+    The delta's arrays and its watermark are swapped in together as one
+    tuple, so a search never pairs ids from one version with rows from
+    another.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+        self.ids = load("ids.npy")
+        self.idf = load("idf.npy")
+        self.main = sparse.csc_matrix(
+            (load("data.npy"), load("indices.npy"), load("indptr.npy")),
+            shape=(len(self.ids), NUM_FEATURES), copy=False,
+        )
+        self._built = (meta["max_id"], _parse_time(meta["watermark"]))
+        self.lock = threading.Lock()
+        self.checked_at = 0.0
+        self._delta = self._read_delta()
+
+    @property
+    def delta_path(self) -> str:
+        return os.path.join(self.path, "delta.npz")
+
+    @property
+    def delta_ids(self) -> np.ndarray:
+        return self._delta[0]
+
+    @property
+    def max_id(self) -> int:
+        return self._delta[3]
+
+    @property
+    def watermark(self) -> Optional[datetime]:
+        return self._delta[4]
+
+    def _read_delta(self) -> tuple:
+        """(ids, rows, shadowed, max_id, watermark, mtime) of the delta on disk."""
+        max_id, watermark = self._built
+        try:
+            mtime = os.stat(self.delta_path).st_mtime_ns
+        except FileNotFoundError:
+            return (np.empty(0, dtype=np.int64), sparse.csr_matrix((0, NUM_FEATURES), dtype=np.float32),
+                    np.zeros(len(self.ids), dtype=bool), max_id, watermark, None)
+        with np.load(self.delta_path) as d:
+            ids = d["ids"]
+            rows = sparse.csr_matrix((d["data"], d["indices"], d["indptr"]), shape=(len(ids), NUM_FEATURES))
+            max_id = max(max_id, int(d["max_id"]))
+            watermark = _later(watermark, _parse_time(str(d["watermark"])))
+        return ids, rows, np.isin(self.ids, ids), max_id, watermark, mtime
+
+    def sync(self):
+        """Pick up a delta written by another process."""
+        try:
+            mtime = os.stat(self.delta_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._delta[5]:
+            self._delta = self._read_delta()
+
+    def catch_up(self, db: Session) -> bool:
+        """
+        Append questions created or edited since the index last saw them.
+        The delta is re-read, merged and written under the index lock, so
+        processes catching up at once don't drop each other's rows. Returns
+        False, changing nothing, while another process holds that lock.
+        """
+        with self.lock, _index_lock(os.path.dirname(self.path), blocking=False) as locked:
+            if not locked:
+                return False
+            self.sync()
+            changed = models.Question.id > self.max_id
+            if self.watermark:
+                changed = or_(changed, models.Question.updated_at > self.watermark)
+            self._append(db.query(*_COLUMNS).filter(changed).all())
+        return True
+
+    def _append(self, rows):
+        """Add (or replace) questions in the delta segment and persist it."""
+        if not rows:
+            return
+        delta_ids, delta, _, max_id, watermark, _ = self._delta
+        new_ids = np.array([r[0] for r in rows], dtype=np.int64)
+        indptr, indices, counts = _csr_parts([term_counts(document(r[1], r[2], r[3])) for r in rows])
+        added = sparse.csr_matrix((_weigh(indptr, indices, counts, self.idf), indices, indptr),
+                                  shape=(len(rows), NUM_FEATURES))
+        keep = ~np.isin(delta_ids, new_ids)
+        ids = np.concatenate([delta_ids[keep], new_ids])
+        delta = sparse.vstack([delta[np.flatnonzero(keep)], added], format="csr")
+        rows_max_id, rows_watermark = _watermark(rows)
+        tmp = os.path.join(self.path, f"delta-{uuid.uuid4().hex}.npz")
+        with open(tmp, "wb") as f:
+            np.savez(f, ids=ids, indptr=delta.indptr, indices=delta.indices, data=delta.data,
+                     max_id=max(max_id, rows_max_id), watermark=_format_time(_later(watermark, rows_watermark)))
+        os.replace(tmp, self.delta_path)
+        # The watermark only moves once the rows it covers are on disk
+        self._delta = self._read_delta()
+
+    def needs_rebuild(self) -> bool:
+        return len(self.delta_ids) >= max(REBUILD_DELTA_MIN, REBUILD_DELTA_RATIO * len(self.ids))
+
+    def search(self, text: str, k: int = 10, exclude_id: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Top-k (question id, cosine score) pairs with score > 0, best first."""
+        cols, counts = term_counts(text)
+        if not len(cols) or k <= 0:
+            return []
+        with self.lock:
+            delta_ids, delta, shadowed = self._delta[:3]
+        weights = _weigh(np.array([0, len(cols)]), cols, counts, self.idf)
+        scores = np.concatenate([
+            self.main[:, cols] @ weights,
+            delta[:, cols] @ weights,
+        ])
+        ids = np.concatenate([self.ids, delta_ids])
+        scores[:len(self.ids)][shadowed] = 0
+        if exclude_id is not None:
+            scores[ids == exclude_id] = 0
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.lexsort((ids[top], -scores[top]))]
+        return [(int(ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _format_time(value: Optional[datetime]) -> str:
+    return value.isoformat() if value else ""
+
+
+def _later(a: Optional[datetime], b: Optional[datetime]) -> Optional[datetime]:
+    return max(a, b) if a and b else a or b
+
+
+def _current_generation(index_dir: str) -> Optional[str]:
+    try:
+        with open(os.path.join(index_dir, "CURRENT"), encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(index_dir, name) if name else None
+
+
+def _generation_time(name: str) -> int:
+    try:
+        return int(name.split("-")[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+@contextmanager
+def _index_lock(index_dir: str, blocking: bool = True):
+    """
+    Held for a whole rebuild and for each delta write, across threads and
+    processes. Yields whether it was acquired, which is always True when
+    blocking.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    if not _lock_guard.acquire(blocking=blocking):
+        yield False
+        return
+    try:
+        with open(os.path.join(index_dir, "build.lock"), "a") as f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+            try:
+                yield True
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+    finally:
+        _lock_guard.release()
+
+
+def _write_generation(index_dir: str, ids: List[int], idf: np.ndarray, rows: sparse.csc_matrix,
+                      watermark: Optional[datetime]) -> str:
+    """Write a generation directory and point CURRENT at it. Needs the build lock."""
+    replaced = _current_generation(index_dir)
+    index_dtype = np.int64 if rows.nnz >= 2 ** 31 else np.int32
+    name = f"gen-{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(index_dir, name)
+    os.makedirs(path)
+    np.save(os.path.join(path, "ids.npy"), np.array(ids, dtype=np.int64))
+    np.save(os.path.join(path, "idf.npy"), idf)
+    np.save(os.path.join(path, "data.npy"), rows.data.astype(np.float32))
+    np.save(os.path.join(path, "indices.npy"), rows.indices.astype(index_dtype))
+    np.save(os.path.join(path, "indptr.npy"), rows.indptr.astype(index_dtype))
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"rows": len(ids), "max_id": ids[-1] if ids else 0, "watermark": _format_time(watermark),
+                   "built_at": datetime.utcnow().isoformat()}, f)
+
+    tmp = os.path.join(index_dir, f"CURRENT-{uuid.uuid4().hex}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(tmp, os.path.join(index_dir, "CURRENT"))
+    # The replaced generation stays for processes that still map it; older
+    # ones (and leftovers of failed builds) go
+    if replaced is not None:
+        cutoff = _generation_time(os.path.basename(replaced))
+        for entry in os.listdir(index_dir):
+            if entry.startswith("gen-") and _generation_time(entry) < cutoff:
+                shutil.rmtree(os.path.join(index_dir, entry), ignore_errors=True)
+    return path
+
+
+def rebuild(db: Session, batch_size: int = 2000, on_progress: Optional[Callable] = None) -> str:
+    """
+    Build a fresh generation from the whole bank and make it current. A
+    rebuild already running elsewhere is waited for first.
+    """
+    index_dir = SIMILARITY_INDEX_DIR
+    with _index_lock(index_dir):
+        total = db.query(models.Question.id).count()
+        if on_progress:
+            on_progress(0, total=total)
+        docs, ids = [], []
+        watermark = None
+        # Keyset pages, each read in full: an open SQLite read cursor would
+        # block every writer's commit for the whole build
+        while True:
+            page = db.query(*_COLUMNS).filter(models.Question.id > (ids[-1] if ids else 0)) \
+                .order_by(models.Question.id).limit(batch_size).all()
+            if not page:
+                break
+            for row in page:
+                ids.append(row[0])
+                docs.append(term_counts(document(row[1], row[2], row[3])))
+                watermark = _later(watermark, row[4])
+            if on_progress:
+                on_progress(len(ids))
+        indptr, indices, counts = _csr_parts(docs)
+        df = np.bincount(indices, minlength=NUM_FEATURES)
+        idf = (np.log((1 + len(ids)) / (1 + df)) + 1).astype(np.float32)
+        rows = sparse.csr_matrix((_weigh(indptr, indices, counts, idf), indices, indptr),
+                                 shape=(len(ids), NUM_FEATURES)).tocsc()
+        path = _write_generation(index_dir, ids, idf, rows, watermark)
+    if on_progress:
+        on_progress(len(ids), force=True)
+    return path
+
+
+def ensure_index(db: Session):
+    """Create the updated_at index the catch-up query needs on databases that predate it."""
+    for index in models.Question.__table__.indexes:
+        if index.name == "ix_questions_updated_at":
+            index.create(db.get_bind(), checkfirst=True)
+
+
+def get_index(db: Session) -> SimilarityIndex:
+    """
+    The current index, caught up with questions created or edited since it
+    was built (at most every REFRESH_INTERVAL seconds). Raises IndexNotBuilt
+    if no rebuild has finished yet.
+    """
+    index_dir = SIMILARITY_INDEX_DIR
+    path = _current_generation(index_dir)
+    if path is None or not os.path.isdir(path):
+        raise IndexNotBuilt("The similarity index has not been built yet")
+    index = _cache.get(index_dir)
+    if index is None or index.path != path:
+        index = _cache[index_dir] = SimilarityIndex(path)
+    now = time.monotonic()
+    # Skipped while a rebuild holds the lock; its generation replaces this one
+    if now - index.checked_at >= REFRESH_INTERVAL and index.catch_up(db):
+        index.checked_at = now
+    return index
+
+
+def find_similar(db: Session, text: str, k: int = 10, exclude_id: Optional[int] = None) -> List[dict]:
+    """Up to k stored questions most similar to text: {"id", "custom_id", "q_type", "content", "score"}."""
+    index = get_index(db)
+    # Over-fetch a little: hits on deleted questions are dropped below
+    hits = index.search(text, k + 10, exclude_id)
+    by_id = {
+        q.id: q for q in db.query(models.Question).filter(models.Question.id.in_([qid for qid, _ in hits]))
+    } if hits else {}
+    results = []
+    for qid, score in hits:
+        q = by_id.get(qid)
+        if q is not None:
+            results.append({"id": q.id, "custom_id": q.custom_id, "q_type": q.q_type,
+                            "content": q.content, "score": round(score, 4)})
+    return results[:k]
@@ -0,0 +1,28 @@
+"""
+Helpers for producing response bodies as streams of byte chunks.
+"""
+import io
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file object whose contents are taken out as they are written."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
@@ -1,5 +1,7 @@
 import sys
 import os
+import io
+from datetime import datetime, timedelta
 # Add parent dir to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -8,6 +10,7 @@ from sqlalchemy.orm import sessionmaker
 from app.models import Base
 from app import models, crud, schemas
 from app.routers.questions import BatchItem
+from app.services import importer
 
 # Setup Test DB
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test_batch.db"
@@ -69,8 +72,165 @@ def test_batch():
         raise e
     finally:
         db.close()
+        engine.dispose()
+        if os.path.exists("./test_batch.db"):
+            os.remove("./test_batch.db")
+
+def test_bulk_import():
+    init_db()
+    db = TestingSessionLocal()
+
+    try:
+        existing = crud.create_question(db, schemas.QuestionCreate(content="已有题目", q_type="single"))
+        items = [
+            (1, schemas.QuestionCreate(content="新题目一", q_type="single", tags=["Math"], status="published")),
+            (2, schemas.QuestionCreate(content="已有题目", q_type="single")),
+            (3, schemas.QuestionCreate(content="新题目二", q_type="essay", difficulty=2)),
+            (4, schemas.QuestionCreate(content="新题目一", q_type="single")),
+        ]
+        seen = set()
+        created, errors = crud.import_questions_chunk(db, items, seen)
+        assert created == 2
+        assert errors == [(2, "Duplicate content"), (4, "Duplicate content")]
+
+        # Duplicates across chunks of the same file are caught via seen
+        created, errors = crud.import_questions_chunk(db, [(5, schemas.QuestionCreate(content="新题目二", q_type="essay"))], seen)
+        assert created == 0 and errors == [(5, "Duplicate content")]
+
+        # Derived tables follow the bulk insert
+        assert len({q.custom_id for q in db.query(models.Question)}) == 3
+        _, total = crud.get_questions_with_count(db, tag="Math")
+        assert total == 1
+        _, total = crud.get_questions_with_count(db, search="新题目")
+        assert total == 2
+        total, counted = crud.get_facet_counts(db)
+        assert total == 3
+        assert counted["q_type"] == {"single": 2, "essay": 1}
+
+        # A row inserted concurrently after the hash lookup makes the bulk
+        # insert fail; the chunk is retried row by row with per-row outcomes
+        lookup = crud.get_existing_hashes
+        crud.get_existing_hashes = lambda db, hashes: {}
+        try:
+            created, errors = crud.import_questions_chunk(db, [
+                (1, schemas.QuestionCreate(content="另一道题", q_type="judge")),
+                (2, schemas.QuestionCreate(content="已有题目", q_type="judge")),
+            ], set())
+        finally:
+            crud.get_existing_hashes = lookup
+        assert created == 1 and errors == [(2, "Duplicate content")]
+        total, counted = crud.get_facet_counts(db)
+        assert total == 4 and counted["q_type"]["judge"] == 1
+    finally:
+        db.close()
+        engine.dispose()
+        if os.path.exists("./test_batch.db"):
+            os.remove("./test_batch.db")
+
+def test_staged_import():
+    init_db()
+    db = TestingSessionLocal()
+
+    try:
+        crud.create_question(db, schemas.QuestionCreate(content="已有", q_type="single"))
+        csv_bytes = "题干,题型,难度\n暂存一,单选,2\n已有,单选,\n,判断,\n暂存二,简答,\n暂存三,单选,\n".encode("utf-8")
+        preview = importer.stage_preview(db, importer.open_frames(io.BytesIO(csv_bytes), "bank.csv"), "bank.csv")
+        assert [i["status"] for i in preview["items"]] == ["valid", "duplicate", "invalid", "valid", "valid"]
+        batch = crud.get_import_batch(db, preview["token"])
+        assert batch.total == 5
+
+        # Row 5 is dropped by the user, row 3 is fixed, row 1 is edited
+        report = importer.commit_staged(db, batch, rows=[1, 2, 3, 4], edits={
+            "1": {"difficulty": 5},
+            "3": {"content": "补全题干"},
+        })
+        assert report == {"success": 3, "failed": 0, "errors": []}
+        by_content = {q.content: q for q in db.query(models.Question)}
+        assert by_content["暂存一"].difficulty == 5
+        assert by_content["补全题干"].q_type == "judge"
+        assert "暂存三" not in by_content
+        # A batch is consumed by its commit
+        assert crud.get_import_batch(db, preview["token"]) is None
+
+        # Expired batches are purged
+        preview = importer.stage_preview(db, importer.open_frames(io.BytesIO(csv_bytes), "bank.csv"), "bank.csv")
+        crud.purge_expired_import_batches(db, now=datetime.utcnow() + timedelta(days=1))
+        assert crud.get_import_batch(db, preview["token"]) is None
+        assert db.query(models.ImportBatchRow).count() == 0
+    finally:
+        db.close()
+        engine.dispose()
+        if os.path.exists("./test_batch.db"):
+            os.remove("./test_batch.db")
+
+def test_custom_id_allocation():
+    init_db()
+    db = TestingSessionLocal()
+
+    try:
+        day = datetime.now().strftime("%Y%m%d")
+        # An id issued before the counter existed is not handed out again
+        db.add(models.Question(content="旧题", q_type="single", custom_id=f"S-{day}-5000"))
+        db.commit()
+
+        ids = crud.bulk_create_questions(db, [
+            schemas.QuestionCreate(content=f"Q{i}", q_type=t)
+            for i, t in enumerate(["single", "judge", "single", "multi", "single"])
+        ])
+        custom_ids = [crud.get_question(db, qid).custom_id for qid in ids]
+        assert custom_ids == [
+            f"S-{day}-5001", f"J-{day}-0001", f"S-{day}-5002", f"M-{day}-0001", f"S-{day}-5003",
+        ]
+
+        q = crud.create_question(db, schemas.QuestionCreate(content="单题", q_type="single"))
+        assert q.custom_id == f"S-{day}-5004"
+
+        # A rolled-back batch gives its block back
+        crud.allocate_custom_ids(db, ["judge"] * 10)
+        db.rollback()
+        assert crud.allocate_custom_ids(db, ["judge"]) == [f"J-{day}-0002"]
+    finally:
+        db.close()
+        engine.dispose()
+        if os.path.exists("./test_batch.db"):
+            os.remove("./test_batch.db")
+
+def test_batch_create():
+    init_db()
+    db = TestingSessionLocal()
+
+    try:
+        existing = crud.create_question(db, schemas.QuestionCreate(content="已有题目", q_type="single"))
+        result = crud.batch_create_questions(db, [
+            {"content": "新题一", "q_type": "single", "tags": ["AI"]},
+            {"content": "已有题目", "q_type": "single"},
+            {"content": " 新题一 ", "q_type": "judge"},
+            {"content": "   ", "q_type": "single"},
+            {"q_type": "single"},
+            schemas.QuestionCreate(content="新题二", q_type="multi"),
+        ])
+        assert [c["index"] for c in result["created"]] == [0, 5]
+        assert all(c["id"] and c["custom_id"] for c in result["created"])
+        assert result["duplicates"] == [
+            {"index": 1, "existing_id": existing.id, "error": "Duplicate question exists"},
+            {"index": 2, "error": "Duplicate of item 0"},
+        ]
+        assert [f["index"] for f in result["failed"]] == [3, 4]
+        assert result["failed"][0]["error"] == "Content is missing"
+
+        created = crud.get_questions_by_ids(db, [c["id"] for c in result["created"]])
+        assert [q.content for q in created] == ["新题一", "新题二"]
+        assert crud.get_facet_counts(db)[1]["tag"] == {"AI": 1}
+        schemas.BatchCreateResult(**result)
+    finally:
+        db.close()
+        engine.dispose()
         if os.path.exists("./test_batch.db"):
             os.remove("./test_batch.db")
 
 if __name__ == "__main__":
     test_batch()
+    test_bulk_import()
+    test_staged_import()
+    test_custom_id_allocation()
+    test_batch_create()
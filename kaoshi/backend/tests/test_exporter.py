@@ -1,4 +1,11 @@
-from app.services import exporter
+import os
+import shutil
+import threading
+import time
+import zipfile
+from io import BytesIO
+
+from app.services import exporter, export_cache, paper_archive, render_pool
 
 def test_export_formats():
     paper_data = {
@@ -40,7 +47,153 @@ def test_export_formats():
     assert len(txt_bytes) > 0
     assert b"Exporter Test Paper" in txt_bytes
 
+def test_docx_engines():
+    options = ["A. x & y", "B. <b>", " C. leading space", "D.\ttab"]
+    questions = [
+        {"q_type": "single", "content": "Two\nlines ", "options": options, "answer": "A", "analysis": "because\tso"},
+        {"q_type": "multi", "content": "中文题干", "options": options, "answer": None},
+        {"q_type": "essay", "content": None, "answer": "text"},
+        {"content": "no type"},
+    ]
+    for paper in ({"title": "T & <x>", "questions_snapshot": questions}, {"title": None, "questions_snapshot": []}):
+        for include_answers in (True, False):
+            fast = zipfile.ZipFile(exporter.export_to_docx(paper, include_answers, engine="template"))
+            slow = zipfile.ZipFile(exporter.export_to_docx(paper, include_answers, engine="python-docx"))
+            assert sorted(fast.namelist()) == sorted(slow.namelist())
+            for name in slow.namelist():
+                assert fast.read(name) == slow.read(name), name
+
+    # Characters XML can't hold are dropped instead of failing the export
+    doc = zipfile.ZipFile(exporter.export_to_docx({"title": "Bad\x0bchar", "questions_snapshot": []}, engine="template"))
+    assert b"<w:t>Badchar</w:t>" in doc.read("word/document.xml")
+    try:
+        exporter.export_to_docx({"title": "x"}, engine="odt")
+        assert False
+    except ValueError:
+        pass
+
+def test_export_cache():
+    paper_data = {
+        "title": "Cached Paper",
+        "questions_snapshot": [{"id": 1, "q_type": "judge", "content": "Is the sky blue?", "answer": "对", "score": 1.0}],
+    }
+    old_dir, old_grace = export_cache.EXPORT_CACHE_DIR, export_cache.EVICT_GRACE_SECONDS
+    export_cache.EXPORT_CACHE_DIR = "./test_export_cache"
+    renders = []
+
+    def render():
+        renders.append(1)
+        time.sleep(0.2)
+        return exporter.export_to_txt(paper_data, include_answers=True).getvalue()
+
+    try:
+        key = export_cache.cache_key(7, paper_data, "txt", True)
+        assert key == export_cache.cache_key(7, dict(paper_data), "txt", True)
+        assert key != export_cache.cache_key(7, paper_data, "txt", False)
+        assert key != export_cache.cache_key(7, {**paper_data, "title": "Other"}, "txt", True)
+        docx_key = export_cache.cache_key(7, paper_data, "docx", True)
+        old_engine, exporter.DOCX_ENGINE = exporter.DOCX_ENGINE, "template"
+        try:
+            assert docx_key != export_cache.cache_key(7, paper_data, "docx", True)
+        finally:
+            exporter.DOCX_ENGINE = old_engine
+
+        # Concurrent misses share one render; later hits don't render at all
+        paths = []
+        threads = [threading.Thread(target=lambda: paths.append(export_cache.get_or_render(key, "txt", render)))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(renders) == 1 and len(set(paths)) == 1
+        assert export_cache.get_or_render(key, "txt", render) == paths[0]
+        with open(paths[0], "rb") as f:
+            assert b"Cached Paper" in f.read()
+        assert len(renders) == 1
+
+        # Least recently used files go first once over the size bound
+        other = export_cache.get_or_render(export_cache.cache_key(8, paper_data, "txt", True), "txt", render)
+        os.utime(paths[0], (1, 1))
+        export_cache.EVICT_GRACE_SECONDS = 0
+        export_cache.evict(max_bytes=os.path.getsize(other))
+        assert not os.path.exists(paths[0]) and os.path.exists(other)
+    finally:
+        export_cache.EXPORT_CACHE_DIR, export_cache.EVICT_GRACE_SECONDS = old_dir, old_grace
+        shutil.rmtree("./test_export_cache", ignore_errors=True)
+
+def test_render_pool():
+    small = {"title": "Pooled Paper", "questions_snapshot": [
+        {"id": 1, "q_type": "single", "content": "Pick one", "options": ["A. x", "B. y"], "answer": "A", "score": 2.0},
+    ]}
+    big = {"title": "Big Paper", "questions_snapshot": small["questions_snapshot"] * 500}
+    old = render_pool.RENDER_WORKERS, render_pool.RENDER_QUEUE_SIZE
+    render_pool.shutdown()
+    render_pool.RENDER_WORKERS, render_pool.RENDER_QUEUE_SIZE = 1, 0
+
+    try:
+        assert render_pool.render("txt", small) == exporter.export_to_txt(small).getvalue()
+        assert render_pool.render("docx", small)[:2] == b"PK"
+
+        # One slot and no queue: a second render is refused while the first runs
+        for fmt, paper, kwargs, error in (
+            ("pdf", big, {"timeout": 0.01}, render_pool.RenderTimeout),
+            ("txt", small, {}, render_pool.RenderQueueFull),
+            ("odt", small, {}, ValueError),
+        ):
+            try:
+                render_pool.render(fmt, paper, **kwargs)
+                assert False, fmt
+            except error:
+                pass
+    finally:
+        render_pool.shutdown()
+        render_pool.RENDER_WORKERS, render_pool.RENDER_QUEUE_SIZE = old
+
+def test_paper_archive():
+    snapshot = [{"id": 1, "q_type": "judge", "content": "Is the sky blue?", "answer": "对", "score": 1.0}]
+    papers = [
+        {"id": 3, "title": "Midterm / A", "questions_snapshot": snapshot},
+        {"id": 4, "title": "", "questions_snapshot": snapshot * 2},
+    ]
+    old_dir, old_workers, old_pdf = export_cache.EXPORT_CACHE_DIR, render_pool.RENDER_WORKERS, render_pool.RENDERERS["pdf"]
+    export_cache.EXPORT_CACHE_DIR = "./test_archive_cache"
+    render_pool.RENDER_WORKERS = 0
+
+    def broken_pdf(paper_data, include_answers=True):
+        raise RuntimeError("no fonts")
+
+    try:
+        chunks = list(paper_archive.iter_zip(papers, ["txt", "docx"], [True, False]))
+        assert len(chunks) > 4  # members are sent as they finish, not at the end
+        with zipfile.ZipFile(BytesIO(b"".join(chunks))) as zf:
+            assert zf.testzip() is None
+            names = set(zf.namelist())
+            assert names == {
+                "3_Midterm_A.txt", "3_Midterm_A_no_answers.txt", "3_Midterm_A.docx", "3_Midterm_A_no_answers.docx",
+                "exam_paper_4.txt", "exam_paper_4_no_answers.txt", "exam_paper_4.docx", "exam_paper_4_no_answers.docx",
+            }
+            assert zf.read("3_Midterm_A.txt") == exporter.export_to_txt(papers[0]).getvalue()
+            assert b"Answer" not in zf.read("exam_paper_4_no_answers.txt")
+        # Every member went through the render cache
+        assert len(os.listdir("./test_archive_cache")) == 8
+
+        # A failed member is reported in ERRORS.txt; the rest still arrive
+        render_pool.RENDERERS["pdf"] = broken_pdf
+        data = b"".join(paper_archive.iter_zip(papers[:1], ["txt", "pdf"], [True]))
+        with zipfile.ZipFile(BytesIO(data)) as zf:
+            assert set(zf.namelist()) == {"3_Midterm_A.txt", "ERRORS.txt"}
+            assert b"3_Midterm_A.pdf: RuntimeError: no fonts" in zf.read("ERRORS.txt")
+    finally:
+        render_pool.RENDERERS["pdf"] = old_pdf
+        export_cache.EXPORT_CACHE_DIR, render_pool.RENDER_WORKERS = old_dir, old_workers
+        shutil.rmtree("./test_archive_cache", ignore_errors=True)
+
 if __name__ == "__main__":
     test_export_formats()
+    test_docx_engines()
+    test_export_cache()
+    test_render_pool()
+    test_paper_archive()
     print("✅ Exporter tests passed")
 
@@ -10,7 +10,9 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.models import Base
 from app import models, crud, schemas
-from app.services.engine import AssemblyEngine
+from app.services.engine import AssemblyEngine, overlap_ratio, variant_label
+from app.services import engine as engine_module
+from app.services import feasibility
 
 # Setup Test DB
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -39,7 +41,8 @@ def test_workflow():
                 difficulty=diff,
                 options=["A", "B", "C", "D"] if qt in ["single", "multi"] else None,
                 answer="A",
-                score=2.0
+                score=2.0,
+                status="published"
             )
             crud.create_question(db, q)
             
@@ -85,9 +88,153 @@ def test_workflow():
         raise e
     finally:
         db.close()
+        engine.dispose()
         # Clean up
         if os.path.exists("./test.db"):
             os.remove("./test.db")
 
+def test_constrained_assembly():
+    init_db()
+    db = TestingSessionLocal()
+
+    try:
+        def add(content, qt, diff, score, tags=None, kps=None):
+            crud.create_question(db, schemas.QuestionCreate(
+                content=content, q_type=qt, difficulty=diff, score=score,
+                tags=tags, knowledge_points=kps, status="published"
+            ))
+
+        for i in range(20):
+            add(f"Single {i}", "single", 1 + i % 3, 2.0 if i % 2 else 3.0, tags=["Math"])
+        add("Single excluded", "single", 1, 2.0, tags=["Math", "Obsolete"])
+        add("Single history", "single", 1, 2.0, tags=["History"])
+        add("Single fractions", "single", 2, 2.0, tags=["Math"], kps=["Fractions"])
+        add("Single decimals", "single", 3, 3.0, tags=["Math"], kps=["Fractions", "Decimals"])
+        for i in range(6):
+            add(f"Essay {i}", "essay", 3, 10.0 + i, tags=["Math"])
+
+        rule_config = {
+            "mode": "constrained",
+            "type_distribution": {"single": 10, "essay": 2},
+            "difficulty_distribution": {"1": 0.3, "2": 0.3, "3": 0.4},
+            "tags_included": ["Math"],
+            "tags_excluded": ["Obsolete"],
+            "knowledge_points": {"Fractions": 2, "Decimals": 1},
+            "total_score": 50,
+        }
+        result = AssemblyEngine(db).assemble(rule_config)
+        assert result.unmet == [], result.unmet
+
+        questions = result.questions
+        assert len([q for q in questions if q.q_type == "single"]) == 10
+        assert len([q for q in questions if q.q_type == "essay"]) == 2
+        assert all("Obsolete" not in (q.tags or []) and "Math" in q.tags for q in questions)
+        assert sum(1 for q in questions if "Fractions" in (q.knowledge_points or [])) >= 2
+        assert abs(sum(result.scores.values()) - 50) < 1e-6
+
+        # Fixed per-type scores, and constraints that cannot be met are reported
+        rule_config.update({
+            "type_scores": {"single": 4, "essay": 20},
+            "type_distribution": {"single": 10, "essay": 8},
+            "knowledge_points": {"Fractions": 3},
+        })
+        result = AssemblyEngine(db).assemble(rule_config)
+        unmet = {(u["constraint"], u["key"]) for u in result.unmet}
+        assert ("type_count", "essay") in unmet
+        assert ("knowledge_point", "Fractions") in unmet
+        assert ("total_score", None) in unmet
+        assert all(result.scores[q.id] == (4 if q.q_type == "single" else 20) for q in result.questions)
+
+        paper = crud.create_paper(db, schemas.ExamPaperCreate(title="Scored"), result.questions, scores=result.scores)
+        assert {item["score"] for item in paper.questions_snapshot} == {4, 20}
+    finally:
+        db.close()
+        engine.dispose()
+        if os.path.exists("./test.db"):
+            os.remove("./test.db")
+
+def test_paper_variants():
+    init_db()
+    db = TestingSessionLocal()
+
+    try:
+        for i in range(60):
+            crud.create_question(db, schemas.QuestionCreate(
+                content=f"Variant pool {i}", q_type="single" if i % 3 else "judge",
+                difficulty=1 + i % 2, status="published"
+            ))
+        rule_config = {"type_distribution": {"single": 6, "judge": 3}}
+
+        # Sequential: 4 disjoint versions fit in the pool
+        results = AssemblyEngine(db).assemble_variants(rule_config, count=4, max_overlap=0)
+        assert all(len(r.questions) == 9 and r.unmet == [] for r in results)
+        ids = [{q.id for q in r.questions} for r in results]
+        assert all(not (ids[i] & ids[j]) for i in range(4) for j in range(i))
+
+        # Process pool: 8 versions cannot all be disjoint, so overlap is
+        # bounded and any excess reported
+        engine_module.PARALLEL_VARIANTS_MIN = 2
+        results = AssemblyEngine(db).assemble_variants(rule_config, count=8, max_overlap=0.5)
+        for k, r in enumerate(results):
+            assert len(r.questions) == 9
+            reported = {u["key"] for u in r.unmet if u["constraint"] == "overlap"}
+            for j in range(k):
+                ratio = overlap_ratio([q.id for q in r.questions], [q.id for q in results[j].questions])
+                assert ratio <= 0.5 or variant_label(j) in reported
+    finally:
+        engine_module.PARALLEL_VARIANTS_MIN = 6
+        db.close()
+        engine.dispose()
+        if os.path.exists("./test.db"):
+            os.remove("./test.db")
+
+def test_rule_feasibility():
+    init_db()
+    db = TestingSessionLocal()
+
+    try:
+        for i in range(6):
+            crud.create_question(db, schemas.QuestionCreate(
+                content=f"Feasible {i}", q_type="single", difficulty=1 + i % 2,
+                tags=["Math"] if i < 4 else ["History"],
+                knowledge_points=["Fractions"] if i == 0 else None, status="published"
+            ))
+        crud.create_question(db, schemas.QuestionCreate(content="Draft essay", q_type="essay", status="draft"))
+
+        rule_config = {
+            "type_distribution": {"single": 4, "essay": 1},
+            "difficulty_distribution": {"1": 0.5, "2": 0.5},
+            "tags_included": ["Math"],
+            "knowledge_points": {"Fractions": 2},
+        }
+        result = feasibility.check_rule(db, rule_config)
+        cells = {(c["dimension"], c["key"]): c for c in result["cells"]}
+        assert not result["feasible"]
+        assert cells[("type", "single")]["available"] == 4 and cells[("type", "single")]["shortfall"] == 0
+        assert cells[("difficulty", "single:1")]["available"] == 2
+        assert cells[("type", "essay")]["shortfall"] == 1
+        assert cells[("knowledge_point", "Fractions")]["shortfall"] == 1
+
+        # Counters follow writes without reloading the pool
+        q = crud.create_question(db, schemas.QuestionCreate(content="Published essay", q_type="essay", tags=["Math"], status="published"))
+        rule_config["knowledge_points"] = {"Fractions": 1}
+        assert feasibility.check_rule(db, rule_config)["feasible"]
+        crud.batch_update_status(db, [q.id], "archived")
+        assert not feasibility.check_rule(db, rule_config)["feasible"]
+
+        # Fixed per-type scores that cannot add up to the target
+        result = feasibility.check_rule(db, {
+            "type_distribution": {"single": 2}, "type_scores": {"single": 5}, "total_score": 100
+        })
+        assert [c["dimension"] for c in result["shortfalls"]] == ["total_score"]
+    finally:
+        db.close()
+        engine.dispose()
+        if os.path.exists("./test.db"):
+            os.remove("./test.db")
+
 if __name__ == "__main__":
     test_workflow()
+    test_constrained_assembly()
+    test_paper_variants()
+    test_rule_feasibility()
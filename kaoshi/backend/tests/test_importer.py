@@ -0,0 +1,121 @@
+import io
+
+import pandas as pd
+from openpyxl import Workbook
+
+from collections import namedtuple
+from datetime import datetime
+
+from app.services import importer, bank_export
+
+def test_streaming_readers():
+    # CSV: GBK is detected, chunks keep file-wide row numbers, blanks are empty
+    csv_bytes = "题干,题型,标签\n甲,单选,a\n乙,判断,\n丙,单选,b\n".encode("gbk")
+    frames = list(importer.open_frames(io.BytesIO(csv_bytes), "bank.CSV", chunk_size=2))
+    assert [len(f) for f in frames] == [2, 1]
+    rows = list(importer.iter_normalized(frames))
+    assert [n for n, _ in rows] == [1, 2, 3]
+    assert (rows[1][1]["content"], rows[1][1]["q_type"], rows[1][1]["tags"]) == ("乙", "judge", [])
+
+    # UTF-8 with BOM keeps the first header intact
+    bom = io.BytesIO("﻿content,q_type\nQ,single\n".encode("utf-8"))
+    assert [(n, r["content"]) for n, r in importer.iter_normalized(importer.open_frames(bom, "a.csv"))] == [(1, "Q")]
+
+    # XLSX: read-only streaming, blank rows skipped without renumbering
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["content", "difficulty"])
+    ws.append(["Q1", 2])
+    ws.append([None, None])
+    ws.append(["Q3"])
+    buf = io.BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+    rows = list(importer.iter_normalized(importer.open_frames(buf, "bank.xlsx", chunk_size=1)))
+    assert [(n, r["content"], r["difficulty"]) for n, r in rows] == [(1, "Q1", 2), (3, "Q3", 3)]
+
+    assert [len(c) for c in importer.chunked(range(5), 2)] == [2, 2, 1]
+
+    for name, data in (("a.txt", b"x"), ("a.xlsx", b"not a workbook")):
+        try:
+            importer.open_frames(io.BytesIO(data), name)
+            assert False, name
+        except importer.ImportFileError:
+            pass
+
+def test_iter_normalized():
+    frame = pd.DataFrame({
+        "题干": [" 甲 ", "乙", None, "   "],
+        "content": [None, "B", None, None],
+        "题型": ["判断", None, "多选", "essay"],
+        "难度": ["2", "abc", 0, 4.0],
+        "选项": ["A\n B \n\n", None, 3, "C"],
+        "标签": ["x, y,,", "x, y,,", None, ""],
+        "解析": [None, 1, "", "z"],
+    }, dtype=object, index=[1, 2, 3, 4])
+
+    rows = dict(importer.iter_normalized([frame]))
+    assert [rows[n]["content"] is None for n in rows] == [False, False, True, True]
+    assert [rows[n]["difficulty"] for n in rows] == [2, 3, 3, 4]
+
+    # Fractional difficulties round half up
+    fractions = pd.DataFrame({"content": ["a", "b", "c"], "difficulty": ["2.5", 2.4, 3.5]}, dtype=object, index=[1, 2, 3])
+    assert [r["difficulty"] for _, r in importer.iter_normalized([fractions])] == [3, 2, 4]
+    # Canonical headers win over their Chinese aliases
+    assert rows[2]["content"] == "B"
+    assert rows[1] == {
+        "content": "甲", "q_type": "judge", "difficulty": 2, "options": ["A", "B"],
+        "answer": "", "tags": ["x", "y"], "analysis": None, "source_doc": None,
+    }
+    assert rows[2]["tags"] == ["x", "y"] and rows[2]["tags"] is not rows[1]["tags"]
+    assert rows[2]["q_type"] == "single" and rows[2]["analysis"] == "1"
+    assert rows[3]["content"] is None and rows[3]["options"] == [] and rows[3]["q_type"] == "multi"
+    assert rows[4]["content"] is None and rows[4]["options"] == ["C"] and rows[4]["tags"] == []
+
+    item = importer.preview_item(3, rows[3])
+    assert item["status"] == "invalid" and "content" not in item["data"]
+
+def test_columnar_round_trip():
+    Row = namedtuple("Row", bank_export.FIELDS)
+    rows = [
+        Row(1, "S-1", "single", "题干一", ["A. 甲", "B. 乙"], "A", "解析", 2, ["安全", "消防"], 2.0,
+            "规程", ["kp"], "published", datetime(2026, 1, 1)),
+        Row(2, None, "essay", "题干二", None, None, None, 3, None, 1.0, None, None, "draft", datetime(2026, 1, 2)),
+    ] * 3
+    expected = [
+        {"content": "题干一", "q_type": "single", "difficulty": 2, "options": ["A. 甲", "B. 乙"], "answer": "A",
+         "tags": ["安全", "消防"], "analysis": "解析", "source_doc": "规程"},
+        {"content": "题干二", "q_type": "essay", "difficulty": 3, "options": [], "answer": "",
+         "tags": [], "analysis": None, "source_doc": None},
+    ] * 3
+
+    for fmt in ("xlsx", "jsonl", "parquet"):
+        chunks = list(bank_export.iter_export(fmt, iter(rows)))
+        filename = bank_export.FORMATS[fmt][1]
+        frames = list(importer.open_frames(io.BytesIO(b"".join(chunks)), filename, chunk_size=4))
+        assert [len(f) for f in frames] == [4, 2], fmt
+        assert [r for _, r in importer.iter_normalized(frames)] == expected, fmt
+
+    # Parquet is written one row group at a time
+    chunks = list(bank_export.iter_parquet(iter(rows), row_group=2))
+    assert len(chunks) == 4 and chunks[0][:4] == b"PAR1"
+
+    # Plain JSON Lines imports too; blank lines are skipped but still counted
+    plain = '{"题干": "甲", "选项": ["x", "y"]}\n\n{"content": "乙"}\n'.encode("utf-8")
+    rows = list(importer.iter_normalized(importer.open_frames(io.BytesIO(plain), "bank.jsonl")))
+    assert [(n, r["content"], r["options"]) for n, r in rows] == [(1, "甲", ["x", "y"]), (3, "乙", [])]
+
+    # Objects and nested lists are refused with the line they are on
+    for bad in ('{"content": "q", "options": {"A": "x"}}', '{"content": "q", "tags": [["a"]]}'):
+        data = ('{"content": "ok", "extra": {"ignored": true}}\n' + bad + "\n").encode("utf-8")
+        try:
+            list(importer.iter_normalized(importer.open_frames(io.BytesIO(data), "bank.jsonl")))
+            assert False, bad
+        except importer.ImportFileError as e:
+            assert str(e).startswith("Line 2: "), str(e)
+
+if __name__ == "__main__":
+    test_streaming_readers()
+    test_iter_normalized()
+    test_columnar_round_trip()
+    print("✅ Importer tests passed")
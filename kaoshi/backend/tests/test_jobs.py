@@ -0,0 +1,118 @@
+import sys
+import os
+import io
+import gzip
+import json
+import shutil
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from app.models import Base
+from app import models, crud, schemas, database
+from app.services import jobs, bank_export
+from app.routers import questions as questions_router  # registers the question job handlers
+
+# Setup Test DB
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_jobs.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def init_db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+@jobs.register("test_fail")
+def _fail(ctx):
+    ctx.progress(3, total=10, force=True)
+    raise RuntimeError("boom")
+
+def test_background_jobs():
+    init_db()
+    db = TestingSessionLocal()
+    jobs.JOB_FILES_DIR = "./test_job_files"
+
+    try:
+        crud.create_question(db, schemas.QuestionCreate(content="已有", q_type="single", status="published"))
+
+        # Import: upload saved to disk, rows processed by the worker
+        csv_bytes = "题干,题型\n后台一,单选\n已有,单选\n后台二,判断\n".encode("utf-8")
+        path = jobs.save_upload(io.BytesIO(csv_bytes), "bank.csv")
+        job = jobs.submit(db, "import_questions", {"path": path, "filename": "bank.csv"})
+        assert job.status == "queued"
+        jobs.wait(job.id, timeout=30)
+        db.expire_all()
+        info = jobs.describe(jobs.get_job(db, job.id))
+        assert info["status"] == "succeeded", info
+        assert info["processed"] == 3
+        assert info["result"] == {"success": 2, "failed": 1, "errors": ["Row 2: Duplicate content"]}
+        assert not os.path.exists(path)
+
+        # Export writes a downloadable file
+        job = jobs.submit(db, "export_questions", {"q_type": "single"})
+        jobs.wait(job.id, timeout=30)
+        db.expire_all()
+        job = jobs.get_job(db, job.id)
+        assert job.status == "succeeded" and job.result["count"] == 2
+        with open(job.result["file"], encoding="utf-8") as f:
+            assert len(f.read().splitlines()) == 3
+
+        # The direct export streams the same rows in encoded chunks
+        old = database.SessionLocal, bank_export.EXPORT_CHUNK_SIZE
+        database.SessionLocal, bank_export.EXPORT_CHUNK_SIZE = TestingSessionLocal, 10
+        try:
+            chunks = list(questions_router.stream_questions_export("csv", {"q_type": "single"}))
+        finally:
+            database.SessionLocal, bank_export.EXPORT_CHUNK_SIZE = old
+        assert len(chunks) == 2 and all(isinstance(c, bytes) for c in chunks)
+        lines = b"".join(chunks).decode("utf-8").splitlines()
+        assert lines[0].startswith("ID,Type") and [l.split(",")[2] for l in lines[1:]] == ["已有", "后台一"]
+
+        # No read cursor is held between batches: writers commit without waiting
+        writer = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"timeout": 0})
+        contents = []
+        for row in crud.iter_export_questions(db, batch_size=1, q_type="single"):
+            contents.append(row.content)
+            with writer.begin() as conn:
+                conn.execute(text("UPDATE questions SET score = score WHERE id = :id"), {"id": row.id})
+        writer.dispose()
+        assert contents == ["已有", "后台一"]
+
+        # Other formats go through the same job
+        job = jobs.submit(db, "export_questions", {"q_type": "single", "format": "jsonl"})
+        jobs.wait(job.id, timeout=30)
+        db.expire_all()
+        job = jobs.get_job(db, job.id)
+        assert job.status == "succeeded" and job.result["filename"] == "questions_export.jsonl.gz"
+        with gzip.open(job.result["file"], "rt", encoding="utf-8") as f:
+            assert [json.loads(line)["content"] for line in f] == ["已有", "后台一"]
+
+        # Failures are recorded with the progress reached
+        job = jobs.submit(db, "test_fail")
+        jobs.wait(job.id, timeout=30)
+        db.expire_all()
+        job = jobs.get_job(db, job.id)
+        assert job.status == "failed" and job.error_message == "boom"
+        assert (job.processed, job.total) == (3, 10)
+
+        # Restart recovery: running jobs fail, queued ones run
+        stale = models.Job(kind="export_questions", status="running", params={})
+        queued = models.Job(kind="export_questions", status="queued", params={})
+        db.add_all([stale, queued])
+        db.commit()
+        jobs.resume_pending(db)
+        jobs.wait(queued.id, timeout=30)
+        db.expire_all()
+        assert jobs.get_job(db, stale.id).status == "failed"
+        assert jobs.get_job(db, queued.id).status == "succeeded"
+    finally:
+        db.close()
+        engine.dispose()
+        shutil.rmtree("./test_job_files", ignore_errors=True)
+        if os.path.exists("./test_jobs.db"):
+            os.remove("./test_jobs.db")
+
+if __name__ == "__main__":
+    test_background_jobs()
+    print("✅ Job tests passed")
@@ -0,0 +1,452 @@
+import sys
+import os
+import shutil
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from app.models import Base
+from app import models, crud, schemas
+from app.services.engine import AssemblyEngine
+from app.services import search as search_index
+from app.services import pool as question_pool
+from app.services import dedup
+from app.services import similarity
+from app.routers.questions import BatchItem
+
+# Setup Test DB
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_question_index.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def init_db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+def tag_rows(db, question_id):
+    rows = db.query(models.QuestionTag.tag).filter(models.QuestionTag.question_id == question_id).all()
+    return sorted(r[0] for r in rows)
+
+def test_tag_index():
+    init_db()
+    db = TestingSessionLocal()
+
+    try:
+        q1 = crud.create_question(db, schemas.QuestionCreate(content="Q1", q_type="single", tags=["Math", "Algebra"], status="published"))
+        q2 = crud.create_question(db, schemas.QuestionCreate(content="Q2", q_type="single", tags=["Math"], status="published"))
+        q3 = crud.create_question(db, schemas.QuestionCreate(content="Q3", q_type="essay", tags=["History"], status="published"))
+
+        assert tag_rows(db, q1.id) == ["Algebra", "Math"]
+
+        items, total = crud.get_questions_with_count(db, tag="Math")
+        assert total == 2
+        assert {q.id for q in items} == {q1.id, q2.id}
+
+        # Update keeps the index in sync
+        crud.update_question(db, q2.id, schemas.QuestionUpdate(tags=["History"]))
+        assert tag_rows(db, q2.id) == ["History"]
+        assert [q.id for q in crud.get_questions(db, tag="Math")] == [q1.id]
+
+        # Batch tag update
+        crud.batch_update_tags(db, [q1.id, q3.id], ["Physics"])
+        _, total = crud.get_questions_with_count(db, tag="Physics")
+        assert total == 2
+        _, total = crud.get_questions_with_count(db, tag="Math")
+        assert total == 0
+
+        # Engine honors rule tags through the index
+        rule_config = {"type_distribution": {"single": 5, "essay": 5}, "tags": ["Physics"]}
+        picked = AssemblyEngine(db).generate_paper(rule_config)
+        assert {q.id for q in picked} == {q1.id, q3.id}
+
+        # Deletes drop index rows
+        q1_id, q3_id = q1.id, q3.id
+        crud.delete_question(db, q3_id)
+        crud.batch_delete_questions(db, [q1_id])
+        assert tag_rows(db, q1_id) == []
+        assert tag_rows(db, q3_id) == []
+
+        # Backfill rebuilds the table from the JSON column
+        db.query(models.QuestionTag).delete()
+        db.commit()
+        crud.ensure_question_tags(db)
+        assert tag_rows(db, q2.id) == ["History"]
+    finally:
+        db.close()
+        engine.dispose()
+        if os.path.exists("./test_question_index.db"):
+            os.remove("./test_question_index.db")
+
+def test_full_text_search():
+    init_db()
+    db = TestingSessionLocal()
+
+    try:
+        q1 = crud.create_question(db, schemas.QuestionCreate(content="安全生产管理规定适用于哪些单位？", q_type="single", options=["A. 全部企业", "B. Mining only"]))
+        q2 = crud.create_question(db, schemas.QuestionCreate(content="下列关于消防安全的说法正确的是", q_type="single", analysis="依据安全生产法第十条"))
+        q3 = crud.create_question(db, schemas.QuestionCreate(content="Explain the water cycle.", q_type="essay"))
+
+        def ids(term):
+            items, total = crud.get_questions_with_count(db, search=term)
+            assert total == len(items)
+            return {q.id for q in items}
+
+        assert ids("安全生产") == {q1.id, q2.id}
+        assert ids("安全") == {q1.id, q2.id}
+        assert ids("消防") == {q2.id}
+        assert ids("规") == {q1.id}
+        assert ids("mining") == {q1.id}
+        assert ids("wat") == {q3.id}
+        assert ids("生产管理规定") == {q1.id}
+        assert ids("管理安全") == set()
+
+        # Content hit ranks above an analysis-only hit
+        items, _ = crud.get_questions_with_count(db, search="安全生产")
+        assert items[0].id == q1.id
+
+        # Index follows updates and deletes
+        crud.update_question(db, q3.id, schemas.QuestionUpdate(content="水循环的过程"))
+        assert ids("water") == set()
+        assert ids("水循环") == {q3.id}
+        q3_id = q3.id
+        crud.delete_question(db, q3_id)
+        assert ids("水循环") == set()
+
+        assert "<mark>消防</mark>" in search_index.make_snippet(q2, "消防")
+    finally:
+        db.close()
+        engine.dispose()
+        if os.path.exists("./test_question_index.db"):
+            os.remove("./test_question_index.db")
+
+def test_keyset_pagination():
+    init_db()
+    db = TestingSessionLocal()
+
+    try:
+        for i in range(25):
+            crud.create_question(db, schemas.QuestionCreate(content=f"Paging {i}", q_type="single" if i % 2 else "judge"))
+
+        seen = []
+        before_id = None
+        while True:
+            items, total, exact, next_page = crud.get_questions_page(db, limit=10, before_id=before_id, total_mode="none")
+            assert total is None and not exact
+            seen.extend(q.id for q in items)
+            if next_page is None:
+                break
+            before_id = next_page["before_id"]
+        assert len(seen) == 25
+        assert seen == sorted(seen, reverse=True)
+
+        # Filters apply in keyset mode as well
+        items, total, exact, next_page = crud.get_questions_page(db, limit=5, q_type="single")
+        assert total == 12 and exact
+        items, _, _, _ = crud.get_questions_page(db, limit=100, q_type="single", before_id=next_page["before_id"])
+        assert len(items) == 7
+
+        # Relevance-ranked searches page by offset instead
+        seen, skip = [], 0
+        while True:
+            items, _, _, next_page = crud.get_questions_page(db, skip=skip, limit=10, search="Paging", total_mode="none")
+            seen.extend(q.id for q in items)
+            if next_page is None:
+                break
+            skip = next_page["offset"]
+        assert sorted(seen) == sorted(set(seen)) and len(seen) == 25
+
+        crud.COUNT_ESTIMATE_CAP = 10
+        _, total, exact, _ = crud.get_questions_page(db, limit=5, q_type="judge", total_mode="estimate")
+        assert total == 10 and not exact
+    finally:
+        crud.COUNT_ESTIMATE_CAP = 10000
+        db.close()
+        engine.dispose()
+        if os.path.exists("./test_question_index.db"):
+            os.remove("./test_question_index.db")
+
+def test_facet_counts():
+    init_db()
+    db = TestingSessionLocal()
+
+    try:
+        q1 = crud.create_question(db, schemas.QuestionCreate(content="F1", q_type="single", difficulty=1, tags=["Math"], source_doc="book"))
+        q2 = crud.create_question(db, schemas.QuestionCreate(content="F2", q_type="single", difficulty=2, tags=["Math", "Physics"]))
+        q3 = crud.create_question(db, schemas.QuestionCreate(content="F3", q_type="essay", difficulty=2, status="published"))
+        q4 = crud.create_question(db, schemas.QuestionCreate(content="F4", q_type="judge", difficulty=3))
+
+        crud.update_question(db, q4.id, schemas.QuestionUpdate(q_type="single", tags=["Physics"]))
+        crud.review_question(db, q1.id, "review")
+        crud.batch_update_status(db, [q2.id, q4.id], "published")
+        crud.batch_update_difficulty(db, [q1.id], 2)
+        crud.batch_update_tags(db, [q3.id], ["History"])
+        crud.batch_review_questions(db, [BatchItem(id=q1.id, value="published")])
+        q4_id = q4.id
+        crud.delete_question(db, q4_id)
+
+        total, counted = crud.get_facet_counts(db)
+        # Counters must agree with a from-scratch rebuild
+        crud.rebuild_facet_counts(db)
+        assert crud.get_facet_counts(db) == (total, counted)
+
+        assert total == 3
+        assert counted["q_type"] == {"single": 2, "essay": 1}
+        assert counted["difficulty"] == {"2": 3}
+        assert counted["status"] == {"published": 3}
+        assert counted["source_doc"] == {"book": 1}
+        assert counted["tag"] == {"Math": 2, "Physics": 1, "History": 1}
+
+        total, counted = crud.get_facet_counts(db, q_type="single")
+        assert total == 2
+        assert counted["tag"] == {"Math": 2, "Physics": 1}
+
+        _, total, exact, _ = crud.get_questions_page(db)
+        assert total == 3 and exact
+    finally:
+        db.close()
+        engine.dispose()
+        if os.path.exists("./test_question_index.db"):
+            os.remove("./test_question_index.db")
+
+def test_published_pool():
+    init_db()
+    db = TestingSessionLocal()
+
+    try:
+        qs = [
+            crud.create_question(db, schemas.QuestionCreate(content=f"P{i}", q_type="single", difficulty=1 + i % 2, status="published"))
+            for i in range(6)
+        ]
+        rule_config = {"type_distribution": {"single": 10}}
+        assert len(AssemblyEngine(db).generate_paper(rule_config)) == 6
+
+        pool = question_pool.get_pool(db)
+        loaded_at = pool.loaded_at
+
+        # Writes patch the pool in place instead of forcing a reload
+        extra = crud.create_question(db, schemas.QuestionCreate(content="P-extra", q_type="single", status="published"))
+        crud.batch_update_status(db, [qs[0].id, qs[1].id], "archived")
+        crud.review_question(db, qs[2].id, "draft")
+        crud.delete_question(db, qs[3].id)
+        crud.update_question(db, qs[4].id, schemas.QuestionUpdate(q_type="judge"))
+
+        assert pool.loaded_at == loaded_at
+        assert sorted(pool.ids) == sorted([qs[5].id, extra.id, qs[4].id])
+
+        picked = AssemblyEngine(db).generate_paper(rule_config)
+        assert sorted(q.id for q in picked) == sorted([qs[5].id, extra.id])
+
+        # Difficulty buckets are honored
+        picked = AssemblyEngine(db).generate_paper({
+            "type_distribution": {"single": 1},
+            "difficulty_distribution": {"2": 1.0},
+        })
+        assert [q.id for q in picked] == [qs[5].id]
+    finally:
+        db.close()
+        engine.dispose()
+        if os.path.exists("./test_question_index.db"):
+            os.remove("./test_question_index.db")
+
+def test_near_duplicate_index():
+    init_db()
+    db = TestingSessionLocal()
+
+    try:
+        base = "根据《安全生产法》，生产经营单位的主要负责人对本单位安全生产工作全面负责，下列说法正确的是"
+        q1 = crud.create_question(db, schemas.QuestionCreate(content=base, q_type="single"))
+        q2 = crud.create_question(db, schemas.QuestionCreate(content="下列关于消防器材使用方法的说法中，错误的是哪一项", q_type="single"))
+        ids = crud.bulk_create_questions(db, [schemas.QuestionCreate(content="Which gas is most abundant in the atmosphere?", q_type="single")])
+
+        # Punctuation, spacing and full-width differences vanish
+        assert dedup.normalize("Ａ， b .c") == dedup.normalize("a b c") == "abc"
+        hits = crud.check_content_similarity(db, "根据 安全生产法, 生产经营单位的主要负责人对本单位安全生产工作全面负责 下列说法正确的是？")
+        assert [h["id"] for h in hits] == [q1.id] and hits[0]["score"] == 1.0
+
+        # An edited variant is found with its Jaccard score; unrelated text is not
+        variant = base.replace("正确", "错误")
+        hits = crud.check_content_similarity(db, variant, threshold=0.7)
+        assert [h["id"] for h in hits] == [q1.id] and 0.7 <= hits[0]["score"] < 1.0
+        assert crud.check_content_similarity(db, variant, threshold=0.99) == []
+        assert crud.check_content_similarity(db, "which gas is MOST abundant in the atmosphere")[0]["id"] == ids[0]
+        assert crud.check_content_similarity(db, base, exclude_id=q1.id) == []
+
+        batch = dedup.find_similar_batch(db, [base, "完全无关的内容", ""])
+        assert [[h["id"] for h in hits] for hits in batch] == [[q1.id], [], []]
+
+        items = crud.check_duplicates_batch(db, [base, variant, "完全无关的内容", base], threshold=0.7)
+        assert items[0]["exact"]["id"] == q1.id and items[0]["batch_duplicate_of"] is None
+        assert items[1]["exact"] is None and [h["id"] for h in items[1]["similar"]] == [q1.id]
+        assert items[2] == {"index": 2, "exact": None, "batch_duplicate_of": None, "similar": []}
+        assert items[3]["batch_duplicate_of"] == 0
+
+        # Index follows updates and deletes, and can be rebuilt
+        crud.update_question(db, q2.id, schemas.QuestionUpdate(content=variant))
+        assert {h["id"] for h in crud.check_content_similarity(db, variant)} == {q1.id, q2.id}
+        crud.delete_question(db, q1.id)
+        assert [h["id"] for h in crud.check_content_similarity(db, variant)] == [q2.id]
+        count = db.query(models.QuestionLshBucket).count()
+        assert count == 2 * dedup.NUM_BANDS
+        dedup.rebuild(db)
+        assert db.query(models.QuestionLshBucket).count() == count
+    finally:
+        db.close()
+        engine.dispose()
+        if os.path.exists("./test_question_index.db"):
+            os.remove("./test_question_index.db")
+
+def test_duplicate_groups():
+    init_db()
+    db = TestingSessionLocal()
+
+    try:
+        base = "根据《安全生产法》，生产经营单位的主要负责人对本单位安全生产工作全面负责，下列说法正确的是"
+        other = "下列关于消防器材使用方法的说法中，错误的是哪一项，请选择最合适的答案"
+        draft = crud.create_question(db, schemas.QuestionCreate(content=base, q_type="single"))
+        spaced = crud.create_question(db, schemas.QuestionCreate(content=base.replace("，", " "), q_type="single"))
+        published = crud.create_question(db, schemas.QuestionCreate(
+            content=base + "？", q_type="single", status="published"))
+        o1 = crud.create_question(db, schemas.QuestionCreate(content=other, q_type="single"))
+        o2 = crud.create_question(db, schemas.QuestionCreate(
+            content=other.replace("，", "、"), q_type="single", analysis="见教材"))
+        crud.create_question(db, schemas.QuestionCreate(content="Which gas is most abundant in the atmosphere?", q_type="single"))
+
+        assert (draft.id, spaced.id) in dedup.candidate_pairs(db)
+        groups = dedup.find_duplicate_groups(db, threshold=0.9)
+        # Published beats draft; among drafts the explained one wins
+        assert [(g["keeper_id"], g["size"]) for g in groups] == [(published.id, 3), (o2.id, 2)]
+        assert [m["id"] for m in groups[0]["members"]] == [published.id, draft.id, spaced.id]
+        assert all(m["score"] == 1.0 for m in groups[0]["members"])
+
+        # Pool path yields the same groups
+        old = dedup.PARALLEL_PAIRS_MIN, dedup.PAIR_CHUNK_SIZE
+        dedup.PARALLEL_PAIRS_MIN, dedup.PAIR_CHUNK_SIZE = 1, 1
+        try:
+            progress = []
+            pooled = dedup.find_duplicate_groups(db, threshold=0.9, workers=2,
+                                                 on_progress=lambda n, total=None: progress.append(n))
+        finally:
+            dedup.PARALLEL_PAIRS_MIN, dedup.PAIR_CHUNK_SIZE = old
+        assert pooled == groups
+        assert progress[-1] == len(dedup.candidate_pairs(db))
+
+        # Oversized buckets are only paired with their first member, and reported
+        truncated = []
+        assert dedup.find_duplicate_groups(db, threshold=0.9, truncated=truncated) == groups
+        assert truncated == []
+        old = dedup.MAX_BUCKET_SIZE
+        dedup.MAX_BUCKET_SIZE = 2
+        try:
+            pairs = dedup.candidate_pairs(db, truncated)
+        finally:
+            dedup.MAX_BUCKET_SIZE = old
+        assert truncated and all(b["size"] > 2 and b["first_id"] == draft.id for b in truncated)
+        assert (draft.id, spaced.id) in pairs and (spaced.id, published.id) not in pairs
+    finally:
+        db.close()
+        engine.dispose()
+        if os.path.exists("./test_question_index.db"):
+            os.remove("./test_question_index.db")
+
+def test_similarity_index():
+    init_db()
+    db = TestingSessionLocal()
+    old = similarity.SIMILARITY_INDEX_DIR, similarity.REFRESH_INTERVAL
+    similarity.SIMILARITY_INDEX_DIR = "./test_similarity_index"
+    similarity.REFRESH_INTERVAL = 0
+
+    try:
+        fire = crud.create_question(db, schemas.QuestionCreate(
+            content="使用干粉灭火器扑救初起火灾时，应对准火焰的哪个部位喷射？", q_type="single",
+            options=["火焰根部", "火焰顶部"], analysis="灭火器应对准火焰根部"))
+        hydrant = crud.create_question(db, schemas.QuestionCreate(
+            content="室内消火栓的使用步骤中，第一步是什么？", q_type="single"))
+        law = crud.create_question(db, schemas.QuestionCreate(
+            content="根据《安全生产法》，生产经营单位的主要负责人职责包括哪些？", q_type="multi"))
+        english = crud.create_question(db, schemas.QuestionCreate(
+            content="Which extinguisher suits electrical fires?", q_type="single"))
+
+        assert similarity.tokens("灭火器 CO2") == ["灭", "火", "器", "灭火", "火器", "co2"]
+        # Lookups never build the index themselves
+        try:
+            similarity.find_similar(db, "灭火器")
+            assert False
+        except similarity.IndexNotBuilt:
+            pass
+        first = similarity.rebuild(db)
+        hits = similarity.find_similar(db, "干粉灭火器喷射部位", k=2)
+        assert hits[0]["id"] == fire.id and 0 < hits[0]["score"] <= 1
+        assert similarity.find_similar(db, "electrical FIRES")[0]["id"] == english.id
+        # Analysis and options are indexed too
+        assert similarity.find_similar(db, "火焰根部")[0]["id"] == fire.id
+        assert all(h["id"] != fire.id for h in similarity.find_similar(db, "灭火器", exclude_id=fire.id))
+        assert similarity.find_similar(db, "") == []
+
+        # The index is memory-mapped from its generation directory
+        index = similarity.get_index(db)
+        assert isinstance(index.ids, np.memmap) and not index.main.data.flags.writeable
+        assert len(index.delta_ids) == 0
+
+        # New and edited questions go to the delta; deleted ones disappear
+        extra = crud.create_question(db, schemas.QuestionCreate(
+            content="高处作业安全带应高挂低用", q_type="judge"))
+        crud.update_question(db, law.id, schemas.QuestionUpdate(content="消火栓水带连接后应先开阀门还是先对准火源？"))
+        crud.delete_question(db, hydrant.id)
+        assert similarity.find_similar(db, "安全带高挂低用")[0]["id"] == extra.id
+        hits = similarity.find_similar(db, "消火栓水带")
+        assert hits[0]["id"] == law.id and hydrant.id not in [h["id"] for h in hits]
+        assert law.id not in [h["id"] for h in similarity.find_similar(db, "安全生产法 主要负责人")]
+        index = similarity.get_index(db)
+        assert sorted(index.delta_ids.tolist()) == sorted([extra.id, law.id])
+
+        # Catch-up waits out a rebuild, then merges into the delta on disk,
+        # keeping rows another process (here, another instance) wrote
+        other = similarity.SimilarityIndex(index.path)
+        confined = crud.create_question(db, schemas.QuestionCreate(
+            content="受限空间作业前应先通风再检测", q_type="judge"))
+        with similarity._index_lock(similarity.SIMILARITY_INDEX_DIR):
+            assert not index.catch_up(db) and index.max_id == extra.id
+        assert index.catch_up(db) and index.max_id == confined.id
+        crud.update_question(db, english.id, schemas.QuestionUpdate(content="How to report a gas leak?"))
+        assert other.catch_up(db)
+        assert sorted(other.delta_ids.tolist()) == sorted([extra.id, law.id, confined.id, english.id])
+        index.sync()
+        assert index.delta_ids.tolist() == other.delta_ids.tolist() and index.watermark == other.watermark
+
+        # A rebuild folds the delta into a new generation. It reads in pages,
+        # so writers can commit between them without waiting
+        writer = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"timeout": 0})
+
+        def write(done, **kwargs):
+            with writer.begin() as conn:
+                conn.execute(text("UPDATE questions SET score = score WHERE id = :id"), {"id": fire.id})
+
+        second = similarity.rebuild(db, batch_size=2, on_progress=write)
+        writer.dispose()
+        index = similarity.get_index(db)
+        assert len(index.delta_ids) == 0 and sorted(index.ids.tolist()) == sorted([fire.id, law.id, english.id, extra.id, confined.id])
+        assert similarity.find_similar(db, "消火栓水带")[0]["id"] == law.id
+        # The replaced generation is kept for readers; only older ones are removed
+        assert os.path.isdir(first) and os.path.isdir(second)
+        third = similarity.rebuild(db)
+        assert not os.path.exists(first) and os.path.isdir(second) and os.path.isdir(third)
+    finally:
+        similarity.SIMILARITY_INDEX_DIR, similarity.REFRESH_INTERVAL = old
+        db.close()
+        engine.dispose()
+        shutil.rmtree("./test_similarity_index", ignore_errors=True)
+        if os.path.exists("./test_question_index.db"):
+            os.remove("./test_question_index.db")
+
+if __name__ == "__main__":
+    test_tag_index()
+    test_full_text_search()
+    test_keyset_pagination()
+    test_facet_counts()
+    test_published_pool()
+    test_near_duplicate_index()
+    test_duplicate_groups()
+    test_similarity_index()
+    print("✅ Question index tests passed")
@@ -1,7 +1,7 @@
 import { useState } from 'react'
 import { Card, Input, InputNumber, Button, Tag, Spin, message, Row, Col, Select, Upload, Form, Tabs, Space } from 'antd'
-import { generateAIQuestions, createQuestion, parseFile, batchCreateQuestions } from '../services/api'
-import type { AIGeneratedQuestion, QuestionCreate } from '../services/api'
+import { generateAIQuestions, createQuestion, parseFile, batchCreateQuestionsV2, checkDuplicateBatch } from '../services/api'
+import type { AIGeneratedQuestion, QuestionCreate, DuplicateCheckItem } from '../services/api'
 import { RobotOutlined, SaveOutlined, UploadOutlined, FileTextOutlined, DeleteOutlined, ImportOutlined } from '@ant-design/icons'
 import type { UploadFile } from 'antd/es/upload/interface'
 
@@ -32,6 +32,8 @@ export default function AIPage() {
   const [loading, setLoading] = useState(false)
   const [parsing, setParsing] = useState(false)
   const [generatedQuestions, setGeneratedQuestions] = useState<AIGeneratedQuestion[]>([])
+  // Duplicate check results, parallel to generatedQuestions
+  const [duplicates, setDuplicates] = useState<(DuplicateCheckItem | null)[]>([])
 
   const handleFileUpload = async (file: File) => {
     setParsing(true)
@@ -73,7 +75,13 @@ export default function AIPage() {
         tag_l2: tagL2 || undefined,
       })
       setGeneratedQuestions(data)
+      setDuplicates([])
       message.success(`生成成功，共 ${data.length} 道题目`)
+      try {
+        setDuplicates(await checkDuplicateBatch(data.map(q => q.content)))
+      } catch (e) {
+        console.error(e)
+      }
     } catch (e) {
       console.error(e)
       message.error('生成失败')
@@ -119,10 +127,14 @@ export default function AIPage() {
     }))
 
     try {
-        const results = await batchCreateQuestions({ questions: questionsToCreate })
-        message.success(`批量入库成功，已创建 ${results.length} 道题目，进入待审核状态`)
+        const { created, duplicates, failed } = await batchCreateQuestionsV2({ questions: questionsToCreate })
+        message.success(`批量入库成功，已创建 ${created.length} 道题目，进入待审核状态`)
+        if (duplicates.length || failed.length) {
+          message.warning(`跳过重复 ${duplicates.length} 道，失败 ${failed.length} 道`)
+        }
         // Clear generated questions or keep them? Maybe clear to avoid duplicate re-save
         setGeneratedQuestions([])
+        setDuplicates([])
     } catch (e: unknown) {
         console.error(e)
         message.error('批量入库失败')
@@ -133,6 +145,11 @@ export default function AIPage() {
     const newQuestions = [...generatedQuestions]
     newQuestions.splice(index, 1)
     setGeneratedQuestions(newQuestions)
+    setDuplicates(duplicates.filter((_, i) => i !== index))
+    // Positions shifted, so in-batch matches need a fresh check
+    if (newQuestions.length) {
+      checkDuplicateBatch(newQuestions.map(q => q.content)).then(setDuplicates).catch(console.error)
+    }
   }
 
   return (
@@ -283,7 +300,22 @@ export default function AIPage() {
                    <Card
                      key={index}
                      size="small"
-                     title={`#${index + 1} [${TYPE_MAP[item.q_type] || item.q_type}]`}
+                     title={
+                       <Space>
+                         {`#${index + 1} [${TYPE_MAP[item.q_type] || item.q_type}]`}
+                         {duplicates[index]?.exact && (
+                           <Tag color="red">题库已存在 {duplicates[index]!.exact!.custom_id || duplicates[index]!.exact!.id}</Tag>
+                         )}
+                         {!duplicates[index]?.exact && !!duplicates[index]?.similar.length && (
+                           <Tag color="orange">
+                             相似 {duplicates[index]!.similar.length} 道（最高 {Math.round(duplicates[index]!.similar[0].score * 100)}%）
+                           </Tag>
+                         )}
+                         {duplicates[index]?.batch_duplicate_of != null && (
+                           <Tag color="gold">与 #{duplicates[index]!.batch_duplicate_of! + 1} 重复</Tag>
+                         )}
+                       </Space>
+                     }
                      extra={
                        <Space>
                          <Button 
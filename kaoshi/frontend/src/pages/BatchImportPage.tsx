@@ -20,7 +20,7 @@ import {
   CloseCircleOutlined,
 } from '@ant-design/icons'
 import type { ColumnsType } from 'antd/es/table'
-import { parseImportFile, batchCreateQuestions } from '../services/api'
+import { parseImportFile, batchCreateQuestionsV2, commitImport } from '../services/api'
 import type { ParsedItem } from '../services/api'
 
 const { Dragger } = Upload
@@ -30,6 +30,7 @@ export default function BatchImportPage() {
   const [currentStep, setCurrentStep] = useState(0)
   const [loading, setLoading] = useState(false)
   const [parsedData, setParsedData] = useState<ParsedItem[]>([])
+  const [stageToken, setStageToken] = useState<string | undefined>()
 
   // Step 1: Handle File Upload
   async function handleFileUpload(file: File) {
@@ -37,6 +38,7 @@ export default function BatchImportPage() {
     try {
       const res = await parseImportFile(file)
       setParsedData(res.items)
+      setStageToken(res.token)
       setCurrentStep(1)
       message.success(`成功解析 ${res.total} 条数据`)
     } catch (e) {
@@ -93,6 +95,11 @@ export default function BatchImportPage() {
               {record.errors.join(', ')}
             </Text>
           )}
+          {record.similar && record.similar.length > 0 && (
+            <Text type="warning" style={{ fontSize: 12 }}>
+              相似题目：{record.similar.map(s => `#${s.id} (${(s.score * 100).toFixed(0)}%)`).join(', ')}
+            </Text>
+          )}
         </Space>
       )
     },
@@ -139,8 +146,18 @@ export default function BatchImportPage() {
 
     setLoading(true)
     try {
-      await batchCreateQuestions({ questions: questionsToImport })
-      message.success(`成功导入 ${questionsToImport.length} 条题目`)
+      if (stageToken) {
+        // Rows are already parsed and checked on the server; send only the selection
+        const res = await commitImport({
+          token: stageToken,
+          rows: parsedData.filter(i => i.status === 'valid').map(i => i.row_index),
+        })
+        setStageToken(undefined)
+        message.success(`成功导入 ${res.success} 条题目`)
+      } else {
+        const res = await batchCreateQuestionsV2({ questions: questionsToImport })
+        message.success(`成功导入 ${res.created.length} 条题目`)
+      }
       setCurrentStep(2)
     } catch (e) {
       console.error(e)
@@ -166,7 +183,7 @@ export default function BatchImportPage() {
         {currentStep === 0 && (
           <div style={{ maxWidth: 600, margin: '0 auto', padding: '40px 0' }}>
             <Dragger
-              accept=".csv,.xlsx,.xls"
+              accept=".csv,.xlsx,.xls,.jsonl,.gz,.parquet"
               beforeUpload={handleFileUpload}
               showUploadList={false}
               disabled={loading}
@@ -176,7 +193,7 @@ export default function BatchImportPage() {
               </p>
               <p className="ant-upload-text">点击或拖拽文件到此处上传</p>
               <p className="ant-upload-hint">
-                支持 CSV, Excel 格式。请确保包含：题干、题型、难度、选项、答案等列。
+                支持 CSV、Excel、JSON Lines (.jsonl/.jsonl.gz)、Parquet 格式。请确保包含：题干、题型、难度、选项、答案等列。
               </p>
             </Dragger>
             <div style={{ marginTop: 20, textAlign: 'center' }}>
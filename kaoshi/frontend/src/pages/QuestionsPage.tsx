@@ -4,6 +4,7 @@ import {
   Button,
   Card,
   Col,
+  Dropdown,
   Form,
   Input,
   InputNumber,
@@ -30,12 +31,14 @@ import {
   reviewQuestion,
   listTags,
   exportQuestions,
+  EXPORT_FILENAMES,
 } from '../services/api'
-import type { Question, QuestionCreate, Tag as TagType } from '../services/api'
+import type { ExportFormat, Question, QuestionCreate, Tag as TagType } from '../services/api'
 import {
   CheckCircleOutlined,
   CloseCircleOutlined,
   DeleteOutlined,
+  DownOutlined,
   DownloadOutlined,
   EditOutlined,
   PlusOutlined,
@@ -111,7 +114,7 @@ export default function QuestionsPage() {
         listTags()
       ])
       setData(res.items)
-      setPagination(p => ({ ...p, current: page, pageSize, total: res.total }))
+      setPagination(p => ({ ...p, current: page, pageSize, total: res.total ?? p.total }))
       setTags(tagItems)
       setSelectedRowKeys([])
     } catch (e) {
@@ -148,13 +151,13 @@ export default function QuestionsPage() {
     return () => window.removeEventListener('keydown', handleKeyDown)
   }, [selectedRowKeys])
 
-  async function handleExport() {
+  async function handleExport(format: ExportFormat = 'csv') {
     try {
-      const blob = await exportQuestions(filters)
+      const blob = await exportQuestions({ ...filters, format })
       const url = window.URL.createObjectURL(blob)
       const link = document.createElement('a')
       link.href = url
-      link.download = 'questions_export.csv'
+      link.download = EXPORT_FILENAMES[format]
       document.body.appendChild(link)
       link.click()
       document.body.removeChild(link)
@@ -583,7 +586,21 @@ export default function QuestionsPage() {
           >
             新增题目
           </Button>
-          <Button icon={<DownloadOutlined />} onClick={handleExport}>导出结果</Button>
+          <Space.Compact>
+            <Button icon={<DownloadOutlined />} onClick={() => handleExport('csv')}>导出结果</Button>
+            <Dropdown
+              menu={{
+                items: [
+                  { key: 'xlsx', label: 'Excel (.xlsx)' },
+                  { key: 'jsonl', label: 'JSON Lines (.jsonl.gz)' },
+                  { key: 'parquet', label: 'Parquet (.parquet)' },
+                ],
+                onClick: ({ key }) => handleExport(key as ExportFormat),
+              }}
+            >
+              <Button icon={<DownOutlined />} />
+            </Dropdown>
+          </Space.Compact>
           {selectedRowKeys.length > 0 && (
             <>
               <Button onClick={() => setBatchDifficultyOpen(true)}>批量改难度</Button>
@@ -114,7 +114,11 @@ const api = axios.create({
 
 export interface QuestionListResponse {
   items: Question[]
-  total: number
+  // null when requested with total_mode=none
+  total: number | null
+  total_exact?: boolean
+  next_cursor?: string | null
+  snippets?: Record<number, string> | null
 }
 
 export async function listQuestions(params?: {
@@ -127,6 +131,9 @@ export async function listQuestions(params?: {
   status?: string
   source_doc?: string
   review_status?: 'pending' | 'approved' | 'rejected'
+  highlight?: boolean
+  cursor?: string
+  total_mode?: 'exact' | 'estimate' | 'none'
 }): Promise<QuestionListResponse> {
   const res = await api.get<QuestionListResponse>('/questions/', { params })
   return res.data
@@ -162,11 +169,44 @@ export async function batchCreateQuestions(payload: { questions: QuestionCreate[
   return res.data
 }
 
+export interface BatchCreateItem {
+  index: number
+  id?: number
+  custom_id?: string
+  existing_id?: number
+  error?: string
+}
+
+export interface BatchCreateResult {
+  created: BatchCreateItem[]
+  duplicates: BatchCreateItem[]
+  failed: BatchCreateItem[]
+}
+
+// Single-transaction save that reports duplicates and failures per item
+export async function batchCreateQuestionsV2(payload: { questions: QuestionCreate[] }): Promise<BatchCreateResult> {
+  const res = await api.post<BatchCreateResult>('/questions/batch_create/v2', payload)
+  return res.data
+}
+
 export async function checkDuplicate(content: string, threshold: number = 0.8): Promise<{ similar_questions: Array<{ id: number, content: string, score: number }> }> {
   const res = await api.post('/questions/check_duplicate', { content, threshold })
   return res.data
 }
 
+export interface DuplicateCheckItem {
+  index: number
+  exact: { id: number, custom_id?: string } | null
+  batch_duplicate_of: number | null
+  similar: Array<{ id: number, content: string, score: number }>
+}
+
+// One request for a whole list of candidates (exact and near-duplicate matches per item)
+export async function checkDuplicateBatch(contents: string[], threshold: number = 0.8): Promise<DuplicateCheckItem[]> {
+  const res = await api.post<{ items: DuplicateCheckItem[] }>('/questions/check_duplicate_batch', { contents, threshold })
+  return res.data.items
+}
+
 export async function createQuestion(payload: QuestionCreate): Promise<Question> {
   const res = await api.post<Question>('/questions/', payload)
   return res.data
@@ -276,11 +316,21 @@ export async function listLogs(skip = 0, limit = 100): Promise<OperationLog[]> {
   return res.data
 }
 
+export type ExportFormat = 'csv' | 'xlsx' | 'jsonl' | 'parquet'
+
+export const EXPORT_FILENAMES: Record<ExportFormat, string> = {
+  csv: 'questions_export.csv',
+  xlsx: 'questions_export.xlsx',
+  jsonl: 'questions_export.jsonl.gz',
+  parquet: 'questions_export.parquet',
+}
+
 export async function exportQuestions(params: {
   q_type?: string
   difficulty?: number
   tag?: string
   status?: string
+  format?: ExportFormat
 }) {
   const res = await api.post('/questions/export', null, {
     params,
@@ -300,6 +350,8 @@ export interface ParsedItem {
   status: 'valid' | 'invalid' | 'duplicate' | 'error'
   errors: string[]
   existing_id?: number
+  // Near-duplicates already in the bank (Jaccard score), informational only
+  similar?: Array<{ id: number, score: number }>
   data: QuestionCreate
 }
 
@@ -307,6 +359,8 @@ export interface ParseImportResponse {
   filename: string
   total: number
   items: ParsedItem[]
+  token?: string
+  expires_at?: string
 }
 
 export async function parseImportFile(file: File): Promise<ParseImportResponse> {
@@ -320,6 +374,16 @@ export async function parseImportFile(file: File): Promise<ParseImportResponse>
   return res.data
 }
 
+// Insert rows staged by parseImportFile without uploading the file again
+export async function commitImport(payload: {
+  token: string
+  rows?: number[]
+  edits?: Record<number, Partial<QuestionCreate>>
+}): Promise<ImportResponse> {
+  const res = await api.post<ImportResponse>('/questions/import/commit', payload)
+  return res.data
+}
+
 export async function importQuestions(file: File): Promise<ImportResponse> {
   const formData = new FormData()
   formData.append('file', file)
@@ -331,3 +395,39 @@ export async function importQuestions(file: File): Promise<ImportResponse> {
   return res.data
 }
 
+
+export interface Job {
+  id: number
+  kind: string
+  status: 'queued' | 'running' | 'succeeded' | 'failed'
+  processed: number
+  total?: number | null
+  elapsed_seconds: number
+  throughput: number
+  result?: Record<string, unknown> | null
+  error_message?: string | null
+  created_at: string
+  started_at?: string | null
+  finished_at?: string | null
+}
+
+export async function importQuestionsInBackground(file: File): Promise<Job> {
+  const formData = new FormData()
+  formData.append('file', file)
+  const res = await api.post<Job>('/questions/import', formData, {
+    params: { background: true },
+    headers: {
+      'Content-Type': 'multipart/form-data',
+    },
+  })
+  return res.data
+}
+
+export async function getJob(id: number): Promise<Job> {
+  const res = await api.get<Job>(`/jobs/${id}`)
+  return res.data
+}
+
+export function jobEventsUrl(id: number): string {
+  return `${api.defaults.baseURL ?? ''}/jobs/${id}/events`
+}